@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
+"""Crawl budget: a deadline and a number of Notion API calls, per run."""
+import threading
+import time
+import typing
+from collections.abc import Callable
+
+import structlog
+
+rlog = structlog.get_logger("nhound.budget")
+
+
+class CrawlBudget:
+    """What a run may spend, in seconds and API calls, None for no limit.
+
+    Used as an httpx request hook, it counts the calls. It is thread safe.
+    """
+
+    def __init__(
+        self,
+        seconds: float | None = None,
+        calls: int | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """Init, the time starts now."""
+        self._clock = clock
+        self._deadline = None if seconds is None else clock() + seconds
+        self._calls = calls
+        self._lock = threading.Lock()
+        self.spent = 0  # The calls made.
+
+    def __call__(self, _: typing.Any = None) -> None:
+        """Count a call."""
+        with self._lock:
+            self.spent += 1
+
+    def exhausted(self) -> str | None:
+        """Get what has run out, None if nothing has."""
+        if self._calls is not None and self.spent >= self._calls:
+            return "calls"
+        if self._deadline is not None and self._clock() >= self._deadline:
+            return "deadline"
+        return None
@@ -2,15 +2,17 @@
 # Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
 """A cohort of Notion users."""
 import os
+from collections.abc import Callable, Iterable, Iterator
 from contextlib import suppress
 
 import pendulum
 import structlog
-from rich import print as rprint
+from pendulum.datetime import DateTime
 
 from nhound import NOW
+from nhound.report import Report
+from nhound.spill import EdgeSpill
 from nhound.user import Page, User
-from nhound.utils import wprint
 
 rlog = structlog.get_logger("nhound.cohort")
 
@@ -18,19 +20,43 @@ rlog = structlog.get_logger("nhound.cohort")
 class Cohort:
     """A collection of users."""
 
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        now: DateTime | None = None,
+        lookup: Callable[[list[str]], dict[str, User | None]] | None = None,
+        spill: EdgeSpill | None = None,
+    ) -> None:
         """Init.
 
-        We care just the day, we care not about specific times.
+        We care just the day, we care not about specific times. The time of
+        the run defaults to when nhound started.
+
+        With a `lookup`, the users are not all added up front: the pages are
+        deferred and only the users of the stale ones are looked up, see
+        `resolve`.
+
+        With a `spill`, the pages are kept on disk rather than with their
+        users, and read back user after user. So are the deferred pages,
+        grouped by their owners and authors.
         """
+        if now is None:
+            now = NOW
         self._users = {}  # type: dict[str, User]
-        self.now = pendulum.datetime(NOW.year, NOW.month, NOW.day)
+        self._lookup = lookup
+        self._spill = spill
+        # The deferred pages, with their callout owners and their authors.
+        self._pending: list[tuple[Page, tuple[str, ...], tuple[str, ...]]] = []
+        self._pending_spill = spill.spawn() if spill is not None else None
+        self._deferred = 0
+        self._fresh = 0  # Deferred pages dropped, they are fresh.
+        self.run_time = now
+        self.now = pendulum.datetime(now.year, now.month, now.day)
         _interval = 13  # Default to 13 weeks, or 3 months, ish.
         with suppress(ValueError):
             _interval = int(
                 os.environ.get("NHOUND_PAGES_ARE_STALE_AFTER_X_WEEKS", f"{_interval}")
             )
-        self.stale = NOW.subtract(weeks=_interval)
+        self.stale = now.subtract(weeks=_interval)
 
     @property
     def size(self) -> int:
@@ -57,6 +83,132 @@ class Cohort:
             rlog.warning(msg)
             return None
 
+    def add_page(self, uuid: str, page: Page) -> bool:
+        """Add a page to the user with this uuid, if there is one.
+
+        With a lookup, a page of an unknown user is deferred.
+        """
+        if self._lookup is not None and uuid not in self._users:
+            self.defer(page, (uuid,), ())
+            return True
+        user = self.get_by_uuid(uuid)
+        if user is None:
+            return False
+        self._add(user, page)
+        return True
+
+    def _add(self, user: User, page: Page) -> None:
+        if self._spill is not None:
+            self._spill.add(user.uuid, page)
+        else:
+            user.pages.add(page)
+
+    def defer(self, page: Page, owners: Iterable[str], authors: Iterable[str]) -> None:
+        """Defer a page until its users are looked up, unless it is fresh."""
+        if page.last_edited_time >= page.threashold_time:
+            self._fresh += 1
+            return
+        self._deferred += 1
+        if self._pending_spill is not None:
+            # Uuids have no comma nor semicolon.
+            self._pending_spill.add(f"{','.join(owners)};{','.join(authors)}", page)
+        else:
+            self._pending.append((page, tuple(owners), tuple(authors)))
+
+    def _groups(self) -> Iterator[tuple[list[Page], tuple[str, ...], tuple[str, ...]]]:
+        """Get the deferred pages, grouped by owners and authors."""
+        if self._pending_spill is None:
+            for page, owners, authors in self._pending:
+                yield ([page], owners, authors)
+            return
+        for key, pages in self._pending_spill.groups():
+            joined_owners, joined_authors = key.split(";")
+            yield (
+                pages,
+                tuple(x for x in joined_owners.split(",") if x),
+                tuple(x for x in joined_authors.split(",") if x),
+            )
+
+    def deferred(self) -> Iterator[tuple[Page, tuple[str, ...], tuple[str, ...]]]:
+        """Get the deferred pages, with their owners and authors."""
+        for pages, owners, authors in self._groups():
+            for page in pages:
+                yield (page, owners, authors)
+
+    def _drop_deferred(self) -> None:
+        self._pending = []
+        if self._pending_spill is not None:
+            self._pending_spill.clear()
+        self._deferred = 0
+        self._fresh = 0
+
+    def resolve(self) -> int:
+        """Add the deferred pages to their callout owners, or else authors.
+
+        Fresh pages were dropped. The users of the stale pages are looked up
+        in one batch, each once. Returns the number of pages added.
+        """
+        if not self._deferred:
+            self._drop_deferred()
+            return 0
+        wanted = {
+            x for _, owners, authors in self._groups() for x in (*owners, *authors)
+        }
+        wanted.difference_update(self._users)
+        if wanted and self._lookup is not None:
+            for user in self._lookup(sorted(wanted)).values():
+                if user is not None and user.uuid not in self._users:
+                    self.add_user(user)
+        count = 0
+        for pages, owners, authors in self._groups():
+            users = [self._users[x] for x in owners if x in self._users]
+            if not users:
+                users = [self._users[x] for x in authors if x in self._users]
+            for user in users:
+                for page in pages:
+                    self._add(user, page)
+                    count += 1
+        rlog.info(
+            "Resolved deferred pages",
+            pages=count,
+            fresh=self._fresh,
+            users=len(wanted),
+        )
+        self._drop_deferred()
+        return count
+
+    def edges(self) -> Iterator[tuple[str, Page]]:
+        """Get all the (user uuid, page) pairs."""
+        for user in self._with_pages():
+            for page in user.pages:
+                yield (user.uuid, page)
+
+    def _with_pages(self) -> Iterator[User]:
+        """Get the users with their pages, read back from the spill if any."""
+        if self._spill is None:
+            yield from self._users.values()
+            return
+        for uuid, pages in self._spill.groups():
+            user = self._users[uuid]
+            # A copy, so that only the pages of one user are in memory.
+            copy = User(user.uuid, user.name, user.email)
+            copy.pages = set(pages)
+            yield copy
+
+    def close(self) -> None:
+        """Delete the spilled pages, if any."""
+        if self._spill is not None:
+            self._spill.close()
+
+    def clear(self) -> None:
+        """Drop all the pages, keeping the users."""
+        self._drop_deferred()
+        if self._spill is not None:
+            self._spill.clear()
+        for user in self._users.values():
+            if user.pages:
+                user.pages = set()
+
     def get_by_name(self, name: str) -> tuple[User, ...]:
         """Get user by thier name.
 
@@ -79,31 +231,23 @@ class Cohort:
                 results.append(user)
         return tuple(results)
 
-    def print_data(self) -> None:  # pragma: no cover
-        """Bleurgh.
+    def print_data(self, report: Report | None = None) -> int:
+        """Print the stale and fresh pages of every user.
 
-        There is no unit test here since, in all likelyhood, this will
-        never be used as is.
+        By default, the report is configured from the environment.
+        Returns the number of pages reported.
         """
-        for uuid, user in self._users.items():
-            if user.pages:
-                rprint(f"{uuid} {user.name} → ")
-                for page in user.pages:
-                    if page.last_edited_time < page.threashold_time:
-                        wprint(
-                            f"{page.title} is stale, "
-                            f"it was editted {page.last_edited_time.diff_for_humans(NOW)} now. "
-                            f"<{page.url}>",
-                            level="warning",
-                        )
-                    else:
-                        wprint(f"{page.title} is fresh.", level="info")
+        if report is None:
+            report = Report.from_env()
+        return report.render(self._with_pages(), self.run_time)
 
     def get_data_for_email(self) -> list[tuple[User, list[Page]]]:
         """Get all the data in a format email can understand."""
-        ret = []
-        for _, user in self._users.items():
+        return list(self.iter_data_for_email())
+
+    def iter_data_for_email(self) -> Iterator[tuple[User, list[Page]]]:
+        """Get the data for the emails, user after user."""
+        for user in self._with_pages():
             pages = [x for x in user.pages if x.last_edited_time < x.threashold_time]
             if pages:
-                ret.append((user, pages))
-        return ret
+                yield (user, pages)
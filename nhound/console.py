@@ -7,7 +7,10 @@ import logging
 import logging.config
 import os
 import sys
+from functools import partial
+from itertools import count
 from pathlib import Path
+from typing import TYPE_CHECKING
 
 import click
 import pendulum
@@ -21,9 +24,39 @@ from rich.prompt import Confirm
 from rich.traceback import install
 
 from nhound import __version__
+from nhound.daemon import run_daemon
+from nhound.delivery import make_mail_transport
 from nhound.email import IEMail
-from nhound.inotion import INotion, INotionError
-from nhound.utils import COLOUR_INFO, VersionCheck, check_if_latest_version, wprint
+from nhound.inotion import (
+    BudgetConfig,
+    CrawlConfig,
+    INotion,
+    INotionError,
+    UsersConfig,
+)
+from nhound.logs import LOG_LEVELS, LevelCallsiteAdder, install_queue
+from nhound.memory import phase
+from nhound.memory import profile as memory
+from nhound.notify import FanOut, make_notifiers
+from nhound.reminders import Reminders, make_reminders
+from nhound.report import Report
+from nhound.state import CrawlState, UsersCache
+from nhound.transport import TransportConfig
+from nhound.utils import (
+    COLOUR_INFO,
+    VersionCheck,
+    check_if_latest_version,
+    env_flag,
+    env_int,
+    wprint,
+)
+from nhound.workqueue import make_queue
+from nhound.workspaces import Workspace, load_workspaces, run_workspaces
+
+if TYPE_CHECKING:  # pragma: no cover
+    from collections.abc import Iterable
+
+    from pendulum.datetime import DateTime
 
 # Rich.
 install(show_locals=True)
@@ -44,34 +77,36 @@ pre_chain = [
 ]
 
 
-def configure_logging(log_level: str, verbose: bool) -> None:
-    """Configure all the logging."""
-    # Logging levels
-    # https://www.structlog.org/en/stable/_modules/structlog/_log_levels.html?highlight=log%20level
-    _lvl = {
-        "critical": 50,
-        "error": 40,
-        "warning": 30,
-        "info": 20,
-        "debug": 10,
-        "notset": 0,
-    }
-
-    # Structlog processors. Order appears to matter…
+def configure_logging(
+    log_level: str,
+    verbose: bool,
+    callsite_levels: Iterable[str] = tuple(LOG_LEVELS),
+) -> None:
+    """Configure all the logging.
+
+    The handlers sit behind a queue: rendering and writing happen on a
+    background thread. Callsite parameters are only added for the levels
+    in `callsite_levels`.
+    """
+    # Structlog processors, these run on the calling thread. Order appears to
+    # matter…
     shared_processors = [
+        structlog.contextvars.merge_contextvars,
         structlog.stdlib.add_logger_name,
         structlog.stdlib.add_log_level,
         structlog.stdlib.PositionalArgumentsFormatter(),
         structlog.processors.StackInfoRenderer(),
         structlog.processors.TimeStamper(fmt="iso"),
         structlog.processors.format_exc_info,
-        structlog.processors.CallsiteParameterAdder(
-            [
-                structlog.processors.CallsiteParameter.FILENAME,
-                structlog.processors.CallsiteParameter.FUNC_NAME,
-                structlog.processors.CallsiteParameter.LINENO,
-            ]
-        ),
+        LevelCallsiteAdder(callsite_levels),
+    ]
+
+    # Foreign records only carry what the logging module gave them.
+    foreign_pre_chain = [
+        *pre_chain,
+        structlog.stdlib.add_logger_name,
+        structlog.processors.TimeStamper(fmt="iso"),
+        LevelCallsiteAdder(callsite_levels),
     ]
 
     class VerboseFilter(logging.Filter):
@@ -104,31 +139,29 @@ def configure_logging(log_level: str, verbose: bool) -> None:
                 "plain": {
                     "()": structlog.stdlib.ProcessorFormatter,
                     "processors": [
-                        *shared_processors,
                         structlog.stdlib.ProcessorFormatter.remove_processors_meta,
                         structlog.processors.JSONRenderer(),
                     ],
-                    "foreign_pre_chain": pre_chain,
+                    "foreign_pre_chain": foreign_pre_chain,
                 },
                 "colored": {
                     "()": structlog.stdlib.ProcessorFormatter,
                     "processors": [
-                        *shared_processors,
                         structlog.stdlib.ProcessorFormatter.remove_processors_meta,
                         structlog.dev.ConsoleRenderer(colors=True),
                     ],
-                    "foreign_pre_chain": pre_chain,
+                    "foreign_pre_chain": foreign_pre_chain,
                 },
             },
             "handlers": {
                 "default": {
-                    "level": _lvl[log_level],
+                    "level": LOG_LEVELS[log_level],
                     "class": "logging.StreamHandler",
                     "filters": ["myfilter"],
                     "formatter": "colored",
                 },
                 "file": {
-                    "level": _lvl[log_level],
+                    "level": LOG_LEVELS[log_level],
                     "class": "logging.handlers.WatchedFileHandler",
                     "filename": "nhound.log",
                     "formatter": "plain",
@@ -138,29 +171,35 @@ def configure_logging(log_level: str, verbose: bool) -> None:
             "loggers": {
                 "nhound": {
                     "handlers": ["default", "file"],
-                    "level": _lvl[log_level],
+                    "level": LOG_LEVELS[log_level],
                     "propagate": True,
                 },
                 "requests": {
                     "handlers": ["default", "file"],
-                    "level": _lvl[log_level],
+                    "level": LOG_LEVELS[log_level],
                     "propagate": True,
                 },
                 "rich": {
                     "handlers": ["default", "file"],
-                    "level": _lvl[log_level],
+                    "level": LOG_LEVELS[log_level],
                     "propagate": True,
                 },
+                "notion-client": {
+                    "handlers": ["default", "file"],
+                    "level": LOG_LEVELS[log_level],
+                    "propagate": False,
+                },
             },
         }
     )
+    install_queue(["nhound", "requests", "rich", "notion-client"])
     structlog.configure(
         processors=[
             *shared_processors,  # type: ignore[list-item]
             structlog.stdlib.ProcessorFormatter.wrap_for_formatter,
         ],
         logger_factory=structlog.stdlib.LoggerFactory(),
-        wrapper_class=structlog.make_filtering_bound_logger(_lvl[log_level]),
+        wrapper_class=structlog.make_filtering_bound_logger(LOG_LEVELS[log_level]),
         cache_logger_on_first_use=True,
     )
 
@@ -190,11 +229,37 @@ def configure_logging(log_level: str, verbose: bool) -> None:
     type=click.Path(exists=True),
     help="Which .env file to load.",
 )
+@click.option(
+    "-c",
+    "--callsite-level",
+    "callsite_levels",
+    multiple=True,
+    default=tuple(LOG_LEVELS),
+    show_default=True,
+    type=click.Choice([*LOG_LEVELS, "none"], case_sensitive=False),
+    help="Log levels for which the file name, function and line number are "
+    "recorded. Repeat for several levels, use `none` to switch this off.",
+)
+@click.option(
+    "-d",
+    "--daemon",
+    is_flag=True,
+    help="Keep running and hound every day at NHOUND_DAEMON_AT (UTC).",
+)
+@click.option(
+    "-r",
+    "--resume",
+    is_flag=True,
+    help="Carry on the crawl that was cut short, from its last checkpoint.",
+)
 @click.option("-v", "--version", is_flag=True, help="Print the version and exit")
 @click.option("--verbose", is_flag=True, help="Print the logs to stdout")
 def main(
     log_level: str,
     env: Path,
+    callsite_levels: tuple[str, ...],
+    daemon: bool,
+    resume: bool,
     version: bool,
     verbose: bool,
 ) -> None:
@@ -213,7 +278,7 @@ def main(
         sys.exit(EXIT_CODE_SUCCESS)
 
     # Configure logging.
-    configure_logging(log_level, verbose)
+    configure_logging(log_level, verbose, callsite_levels)
     rlog = structlog.get_logger("nhound")
     rlog.debug(
         "All the loggers",
@@ -229,7 +294,11 @@ def main(
 
     # Do all the hard work.
     rlog.debug("Starting real work…")
-    status = _do_stuff(rlog, env)
+    try:
+        status = _do_stuff(rlog, env, daemon, resume)
+    except KeyboardInterrupt:  # pragma: no cover
+        rlog.info("Interrupted, stopping.")
+        status = True
 
     # We should be done…
     if status:
@@ -245,9 +314,14 @@ def main(
     sys.exit(EXIT_CODE_SUCCESS)
 
 
-def _do_stuff(rlog: structlog.BoundLogger, env: Path) -> bool:  # pragma: no cover
+def _do_stuff(
+    rlog: structlog.BoundLogger, env: Path, daemon: bool = False, resume: bool = False
+) -> bool:  # pragma: no cover
     """Do stuff.
 
+    As a daemon, this runs every day until interrupted. Only the first run
+    resumes.
+
     Why not unit tests? Well, this is actually doing work. We could mock
     everything, but is there a point to doing that?
 
@@ -257,16 +331,18 @@ def _do_stuff(rlog: structlog.BoundLogger, env: Path) -> bool:  # pragma: no cov
     # Get enviorment variables from .env file.
     rlog.debug("Loading environment variables from .env file.", env=env)
     load_dotenv(env)  # take environment variables from .env.
-    token = ""  # There should never be a real value here.  # nosec
-    try:
-        token = os.environ["NHOUND_NOTION_TOKEN"]
-    except KeyError as e:
-        rlog.exception("Missing environment variable", var=e)
-        wprint("Missing environment variable NHOUND_NOTION_TOKEN.", level="error")
+    workspaces = _get_workspaces(rlog)
+    if os.getenv("NHOUND_CRAWL", "tree") == "watermark" and any(
+        x for workspace in workspaces for x in workspace.uuids
+    ):
+        wprint(
+            "A watermark crawl hounds all the pages shared with nhound, "
+            "NHOUND_PAGES_UUIDS must be empty.",
+            level="error",
+        )
         sys.exit(EXIT_CODE_OPERATION_FAILED)
-
-    # Get UUID of Notion pages from environment variable.
-    uuids = loads(os.environ["NHOUND_PAGES_UUIDS"])
+    if env_flag("NHOUND_MEMORY_PROFILE"):
+        memory.enable(env_int("NHOUND_MEMORY_PROFILE_TOP", 10))
 
     # Set up email forwarding.
     #
@@ -287,28 +363,211 @@ def _do_stuff(rlog: structlog.BoundLogger, env: Path) -> bool:  # pragma: no cov
         rlog.warning("Using custom SMTP server. Probably testing…")
         rlog.warning("Run: `python -m smtpd -n -c DebuggingServer localhost:1025`")
 
-    email = IEMail(my_sender, os.environ["NHOUND_SMTP_EMAIL_SENDER"])
-
-    # Do stuff with Notion API.
-    status = True
+    # Or hand the emails over to the local MTA.
     try:
-        inotion = INotion(
-            token,
-            int(os.getenv("NHOUND_PAGES_ARE_STALE_AFTER_X_WEEKS", 13)),
+        transport = make_mail_transport(
+            os.getenv("NHOUND_EMAIL_TRANSPORT", "smtp"),
+            os.getenv("NHOUND_EMAIL_TRANSPORT_PATH"),
+            env_int("NHOUND_SENDMAIL_BATCH", 50),
         )
-        for data in inotion.get_email_data(uuids):
-            status = status & email.send(
-                receivers=[
-                    data[0].email,
+    except ValueError as e:
+        wprint(str(e), level="error")
+        sys.exit(EXIT_CODE_OPERATION_FAILED)
+
+    # The report is rendered after the crawl, check its format now.
+    try:
+        Report.from_env()
+    except ValueError as e:
+        wprint(str(e), level="error")
+        sys.exit(EXIT_CODE_OPERATION_FAILED)
+
+    # One email connection is shared by all the workspaces.
+    email = IEMail(my_sender, os.environ["NHOUND_SMTP_EMAIL_SENDER"], transport)
+
+    # The channels each user is notified on, all at the same time.
+    try:
+        fan_out = FanOut(
+            make_notifiers(
+                [
+                    x.strip()
+                    for x in os.getenv("NHOUND_NOTIFIERS", "email").split(",")
+                    if x.strip()
                 ],
-                body_params={"name": data[0].name, "pages": data[1]},
+                email,
+                os.getenv("NHOUND_SLACK_WEBHOOK_URL"),
+                os.getenv("NHOUND_TEAMS_WEBHOOK_URL"),
+                concurrency=env_int("NHOUND_WEBHOOK_CONCURRENCY", 4),
+                batch=env_int("NHOUND_WEBHOOK_BATCH", 10),
+            ),
+            retries=env_int("NHOUND_NOTIFY_RETRIES", 2),
+        )
+    except ValueError as e:
+        wprint(str(e), level="error")
+        sys.exit(EXIT_CODE_OPERATION_FAILED)
+
+    # Do stuff with Notion API.
+    try:
+        inotions = [(x, _make_inotion(x), _make_reminders(x)) for x in workspaces]
+        if daemon:
+            # The same INotions are used for every run: their caches stay warm.
+            runs = count()
+            run_daemon(
+                lambda now: _run(
+                    email, fan_out, inotions, now, resume and not next(runs)
+                ),
+                at=os.getenv("NHOUND_DAEMON_AT", "06:00"),
             )
+            return True
+        return _run(email, fan_out, inotions, resume=resume)
     except INotionError as e:
         rlog.exception("INotionError", error=e)
         sys.exit(EXIT_CODE_NOTION_API_FAILED)
 
+
+def _run(
+    email: IEMail,
+    fan_out: FanOut,
+    inotions: list[tuple[Workspace, INotion, Reminders | None]],
+    now: DateTime | None = None,
+    resume: bool = False,
+) -> bool:  # pragma: no cover
+    """Do one run of every workspace, at the same time if there are several."""
+    try:
+        if len(inotions) == 1:
+            workspace, inotion, reminders = inotions[0]
+            return _send_emails(
+                inotion, email, fan_out, workspace.uuids, now, reminders, resume
+            )
+        return _run_workspaces(email, fan_out, inotions, now, resume)
+    finally:
+        memory.log_summary()
+
+
+def _run_workspaces(
+    email: IEMail,
+    fan_out: FanOut,
+    inotions: list[tuple[Workspace, INotion, Reminders | None]],
+    now: DateTime | None = None,
+    resume: bool = False,
+) -> bool:  # pragma: no cover
+    """Do one run of every workspace, at the same time."""
+    with email.session():
+        status = run_workspaces(
+            {
+                x.name: partial(
+                    _send_emails,
+                    inotion,
+                    email,
+                    fan_out,
+                    x.uuids,
+                    now,
+                    reminders,
+                    resume,
+                )
+                for x, inotion, reminders in inotions
+            }
+        )
+    return all(status.values())
+
+
+def _get_workspaces(rlog: structlog.BoundLogger) -> list[Workspace]:
+    """Get the workspaces, from NHOUND_WORKSPACES or else the environment."""
+    path = os.getenv("NHOUND_WORKSPACES")
+    if path:
+        try:
+            return load_workspaces(Path(path))
+        except ValueError as e:
+            wprint(str(e), level="error")
+            sys.exit(EXIT_CODE_OPERATION_FAILED)
+    token = ""  # There should never be a real value here.  # nosec
+    try:
+        token = os.environ["NHOUND_NOTION_TOKEN"]
+    except KeyError as e:
+        rlog.exception("Missing environment variable", var=e)
+        wprint("Missing environment variable NHOUND_NOTION_TOKEN.", level="error")
+        sys.exit(EXIT_CODE_OPERATION_FAILED)
+
+    # Get UUID of Notion pages from environment variable.
+    uuids = loads(os.environ["NHOUND_PAGES_UUIDS"])
+    return [Workspace("", token, tuple(uuids))]
+
+
+def _make_reminders(workspace: Workspace) -> Reminders | None:  # pragma: no cover
+    """Make the reminders of a workspace, each has its own."""
+    kind = os.getenv("NHOUND_REMINDERS", "sqlite")
+    path = os.getenv("NHOUND_REMINDERS_PATH")
+    if kind == "sqlite" and (workspace.name or not path):
+        path = str(workspace.state_path("reminders.sqlite"))
+    prefix = "nhound:reminders"
+    if workspace.name:
+        prefix = f"{prefix}:{workspace.name}"
+    return make_reminders(
+        kind,
+        os.getenv("NHOUND_RENAG_INTERVAL", "a week"),
+        path,
+        os.getenv("NHOUND_REMINDERS_URL"),
+        prefix,
+    )
+
+
+def _make_inotion(workspace: Workspace) -> INotion:  # pragma: no cover
+    """Make the INotion of a workspace, each has its own HTTP client."""
+    transport = TransportConfig.from_env()
+    if workspace.rate_limit is not None:
+        transport = transport._replace(rate_limit=workspace.rate_limit)
+    weeks = workspace.weeks
+    if weeks is None:
+        weeks = int(os.getenv("NHOUND_PAGES_ARE_STALE_AFTER_X_WEEKS", 13))
+    crawl = CrawlConfig.from_env()
+    queue_kind = os.getenv("NHOUND_QUEUE", "none")
+    queue_path = os.getenv("NHOUND_QUEUE_PATH")
+    if queue_kind == "sqlite" and (workspace.name or not queue_path):
+        queue_path = str(workspace.state_path("queue.sqlite"))
+    return INotion(
+        workspace.token,
+        weeks,
+        crawl=crawl,
+        budget=BudgetConfig.from_env(workspace.state_path("checkpoint.json")),
+        transport=transport,
+        users=UsersConfig.from_env(),
+        state=(
+            CrawlState.load(workspace.state_path("crawl.json"))
+            if crawl.mode == "watermark"
+            else None
+        ),
+        users_cache=UsersCache.load(workspace.state_path("users.json")),
+        queue=make_queue(queue_kind, queue_path),
+    )
+
+
+def _send_emails(
+    inotion: INotion,
+    email: IEMail,
+    fan_out: FanOut,
+    uuids: tuple[str, ...],
+    now: DateTime | None = None,
+    reminders: Reminders | None = None,
+    resume: bool = False,
+) -> bool:  # pragma: no cover
+    """Do one run: crawl Notion and notify the users.
+
+    With reminders, only the pages due a reminder are notified about. With
+    resume, the crawl carries on from its checkpoint.
+    """
+    if now is None:
+        now = pendulum.now("UTC")
+    data = inotion.get_email_data(uuids, now, resume)
+    if reminders is not None:
+        data = reminders.due(data, now)
+    status = True
+    with phase("send"), email.session():
+        for user, pages, sent in fan_out.send(data):
+            if sent and reminders is not None:
+                reminders.notified(user, pages, now)
+            status = status & sent
+
     if not status:
-        wprint("Email sending failed.", level="warning")
+        wprint("Notification sending failed.", level="warning")
         return False
     return True
 
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+# Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
+"""Daemon mode: run every day at a set time, from one long lived process."""
+import time
+from collections.abc import Callable
+
+import pendulum
+import structlog
+from pendulum.datetime import DateTime
+
+rlog = structlog.get_logger("nhound.daemon")
+
+
+def next_run(at: str, now: DateTime) -> DateTime:
+    """Get the first time of day `at` (HH:MM, UTC) strictly after now."""
+    try:
+        hour, minute = (int(x) for x in at.split(":"))
+        when: DateTime = now.in_timezone("UTC").set(
+            hour=hour, minute=minute, second=0, microsecond=0
+        )
+    except ValueError as e:
+        msg = f"Invalid daemon time {at}, expected HH:MM"
+        rlog.error(msg)
+        raise ValueError(msg) from e
+    if when <= now:
+        when = when.add(days=1)
+    return when
+
+
+def run_daemon(
+    job: Callable[[DateTime], bool],
+    at: str = "06:00",
+    runs: int | None = None,
+    sleep: Callable[[float], None] = time.sleep,
+) -> int:
+    """Run the job every day at `at`, forever or for `runs` runs.
+
+    The job is given the time of the run. A failing run is logged, it
+    does not stop the daemon. Returns the number of runs.
+    """
+    count = 0
+    while runs is None or count < runs:
+        now = pendulum.now("UTC")
+        when = next_run(at, now)
+        rlog.info("Next run scheduled", at=when.isoformat())
+        sleep((when - now).total_seconds())
+        count += 1
+        try:
+            status = job(pendulum.now("UTC"))
+        except Exception as e:
+            rlog.exception("Scheduled run failed", run=count, error=e)
+            continue
+        rlog.info("Scheduled run done", run=count, status=status)
+    return count
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+# Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
+"""Decode Notion's responses with orjson, keeping only what nhound reads.
+
+A response is projected onto the fields below as soon as it is decoded,
+so the large raw payloads (properties, rich text annotations, icons,
+covers…) are never kept around. Only the allowlisted properties of the
+pages are kept, and only those are asked for, see `NotionClient`.
+"""
+import typing
+from collections.abc import Collection
+
+import httpx
+import structlog
+from notion_client import Client
+from notion_client.api_endpoints import DatabasesEndpoint
+from notion_client.helpers import pick
+from orjson import JSONDecodeError, loads
+
+rlog = structlog.get_logger("nhound.decode")
+
+# The API version nhound speaks: newer ones query data sources, not databases.
+NOTION_VERSION = "2022-06-28"
+
+# A projection: a dict of the fields to keep, with the projection of each
+# value, None to keep it as is, or a list of one projection for a list.
+Projection = dict[str, typing.Any] | None
+
+RICH_TEXT: Projection = {
+    "type": None,
+    "plain_text": None,
+    "text": {"content": None},
+    "mention": {"type": None, "user": {"id": None}},
+}
+PAGE: Projection = {
+    "object": None,
+    "id": None,
+    "url": None,
+    "created_time": None,
+    "last_edited_time": None,
+    "created_by": {"id": None},
+    "last_edited_by": {"id": None},
+    "archived": None,
+    "in_trash": None,
+    "parent": None,
+}
+BLOCK: Projection = {
+    "object": None,
+    "id": None,
+    "type": None,
+    "has_children": None,
+    "created_time": None,
+    "last_edited_time": None,
+    "created_by": {"id": None},
+    "last_edited_by": {"id": None},
+    "archived": None,
+    "in_trash": None,
+    "child_page": {"title": None},
+    "child_database": {"title": None},
+    "callout": {"rich_text": [RICH_TEXT]},
+}
+USER: Projection = {
+    "object": None,
+    "id": None,
+    "type": None,
+    "name": None,
+    "person": {"email": None},
+}
+DATABASE: Projection = {
+    "object": None,
+    "id": None,
+    "title": [{"plain_text": None}],
+}
+PROJECTIONS: dict[str, Projection] = {
+    "page": PAGE,
+    "block": BLOCK,
+    "user": USER,
+    "database": DATABASE,
+}
+
+
+def project(data: typing.Any, projection: Projection | list[Projection]) -> typing.Any:
+    """Keep only the fields of the projection."""
+    if projection is None:
+        return data
+    if isinstance(projection, list):
+        if not isinstance(data, list):
+            return data
+        return [project(x, projection[0]) for x in data]
+    if not isinstance(data, dict):
+        return data
+    return {k: project(data[k], v) for k, v in projection.items() if k in data}
+
+
+def project_properties(
+    data: typing.Any, properties: Collection[str] | None
+) -> typing.Any:
+    """Keep the page properties of the allowlist, by ID or name, None for all."""
+    if properties is None or not isinstance(data, dict):
+        return data
+    return {
+        k: v
+        for k, v in data.items()
+        if k in properties or (isinstance(v, dict) and v.get("id") in properties)
+    }
+
+
+def project_object(
+    data: typing.Any, properties: Collection[str] | None = ()
+) -> typing.Any:
+    """Project a Notion object, or each of a list of them, by its kind.
+
+    The properties of the pages are those of the allowlist, None for all.
+    Objects of other kinds are kept as they are.
+    """
+    if not isinstance(data, dict):
+        return data
+    kind: str = data.get("object", "")
+    if kind == "list":
+        return {
+            "object": "list",
+            "results": [project_object(x, properties) for x in data.get("results", ())],
+            "has_more": data.get("has_more", False),
+            "next_cursor": data.get("next_cursor"),
+        }
+    projected = project(data, PROJECTIONS.get(kind))
+    if kind == "page" and "properties" in data and properties != ():
+        projected["properties"] = project_properties(data["properties"], properties)
+    return projected
+
+
+class QueryableDatabasesEndpoint(DatabasesEndpoint):
+    """The databases, with the query of the versions of the client that had it.
+
+    The query takes the `filter_properties` of the pages, like
+    `pages.retrieve`.
+    """
+
+    def query(self, database_id: str, **kwargs: typing.Any) -> typing.Any:
+        """Query a database."""
+        return self.parent.request(
+            path=f"databases/{database_id}/query",
+            method="POST",
+            query=pick(kwargs, "filter_properties"),
+            body=pick(kwargs, "filter", "sorts", "start_cursor", "page_size"),
+            auth=kwargs.get("auth"),
+        )
+
+
+class NotionClient(Client):
+    """A Notion client decoding its responses with orjson, projected.
+
+    The pages keep the `properties` of the allowlist, by ID or name, None
+    for all of them. Ask Notion for those only, with `filter_properties`.
+    The API version is pinned to `NOTION_VERSION`, unless told otherwise.
+    """
+
+    def __init__(
+        self,
+        *args: typing.Any,
+        properties: Collection[str] | None = (),
+        **kwargs: typing.Any,
+    ) -> None:
+        """Init."""
+        kwargs.setdefault("notion_version", NOTION_VERSION)
+        super().__init__(*args, **kwargs)
+        self.properties = properties
+        self.databases: QueryableDatabasesEndpoint = QueryableDatabasesEndpoint(self)
+
+    def _parse_response(self, response: httpx.Response) -> typing.Any:
+        """Decode and project a successful response.
+
+        Errors are left to the client, they are raised as usual.
+        """
+        if not response.is_success:
+            return super()._parse_response(response)
+        try:
+            body = loads(response.content)
+        except JSONDecodeError:
+            return super()._parse_response(response)
+        return project_object(body, self.properties)
@@ -1,7 +1,14 @@
 # -*- coding: utf-8 -*-
 # Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
-"""Dehumanize a date string."""
+"""Dehumanize a date string.
+
+Threshold expressions look like `a day`, `3 weeks`, `1 year 2 months`,
+`6m` or ISO-8601 durations such as `P3M`. They are parsed once into a
+threshold, a tuple of `(unit, value)` pairs suitable for `subtract`.
+"""
+import re
 import string
+from functools import lru_cache
 from typing import Any
 
 import structlog
@@ -10,40 +17,97 @@ from nhound import NOW
 
 rlog = structlog.get_logger("nhound.dehumanize")
 
+Threshold = tuple[tuple[str, int], ...]
+
+UNITS = {
+    "d": "days",
+    "day": "days",
+    "days": "days",
+    "w": "weeks",
+    "wk": "weeks",
+    "wks": "weeks",
+    "week": "weeks",
+    "weeks": "weeks",
+    "m": "months",
+    "mo": "months",
+    "mos": "months",
+    "month": "months",
+    "months": "months",
+    "y": "years",
+    "yr": "years",
+    "yrs": "years",
+    "year": "years",
+    "years": "years",
+}
+
+_PUNCTUATION = str.maketrans("", "", string.punctuation)
+# A term and the spaces after it, matched one after the other: a pattern of
+# repeated terms would backtrack exponentially on text that nearly matches.
+_TERM = re.compile(r"(\d+|an?)\s*([a-z]+)\s*")
+_ISO_8601 = re.compile(r"p(?:(\d+)y)?(?:(\d+)m)?(?:(\d+)w)?(?:(\d+)d)?")
+
+
+def normalize(text: str) -> str:
+    """Normalize a threshold expression."""
+    words = text.lower().translate(_PUNCTUATION).split()
+    return " ".join(x for x in words if x != "and")
+
+
+@lru_cache(maxsize=1024)
+def _parse(expression: str) -> Threshold | None:
+    """Parse a normalized threshold expression, None if it is not one."""
+    if expression == "now":
+        return ()
+    values: dict[str, int] = {}
+    iso = _ISO_8601.fullmatch(expression)
+    if iso is not None and expression != "p":
+        for unit, span in zip(
+            ("years", "months", "weeks", "days"), iso.groups(), strict=True
+        ):
+            if span is not None:
+                values[unit] = int(span)
+        return tuple(sorted(values.items()))
+    pos = 0
+    while pos < len(expression):
+        term = _TERM.match(expression, pos)
+        if term is None:
+            return None
+        span, word = term.groups()
+        try:
+            unit = UNITS[word]
+        except KeyError:
+            return None
+        values[unit] = values.get(unit, 0) + (1 if span in ("a", "an") else int(span))
+        pos = term.end()
+    if not values:
+        return None
+    return tuple(sorted(values.items()))
+
+
+def parse_threshold(text: str) -> Threshold | None:
+    """Parse a threshold expression, None if it is not one.
+
+    Results are cached by normalized expression.
+    """
+    return _parse(normalize(text))
+
+
+def subtract(threshold: Threshold, now: Any = None) -> Any:
+    """Get the date that is threshold before now."""
+    if now is None:
+        now = NOW
+    return now.subtract(**dict(threshold))
+
 
-def dehumanize(text: str) -> Any:
-    """Dehumanize a date string."""
-    # Clean up the input text.
-    text = text.lower().translate(str.maketrans("", "", string.punctuation))
+def dehumanize(text: str, now: Any = None) -> Any:
+    """Dehumanize a date string.
 
-    # Try to split into value and unit.
-    try:
-        span, unit = text.split(" ")
-    except ValueError as e:
-        rlog.exception(e)
+    Anything that cannot be parsed is now.
+    """
+    if now is None:
+        now = NOW
+    threshold = parse_threshold(text)
+    if threshold is None:
         rlog.error("Failed to parse humanized text", text=text)
-        return NOW
-
-    # Value must be an interger.
-    try:
-        value = int(span)
-    except ValueError as e:
-        if span == "a":
-            value = 1
-        else:
-            rlog.exception(e)
-            rlog.error("Failed to cast span of humanized text", text=text, span=span)
-            return NOW
-
-    # Parse the unit.
-    if unit in ["day", "days"]:
-        return NOW.subtract(days=int(value))
-    if unit in ["week", "weeks"]:
-        return NOW.subtract(weeks=int(value))
-    if unit in ["month", "months"]:
-        return NOW.subtract(months=int(value))
-    if unit in ["year", "years"]:
-        return NOW.subtract(years=int(value))
-
-    # Default is now.
-    return NOW
+        return now
+    return subtract(threshold, now)
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+# Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
+"""Bulk email delivery, handing the rendered messages over to a local MTA.
+
+Talking SMTP to a relay is one round trip (or more) per message. When the
+host has a mail transfer agent, it is much faster to write the messages in
+its maildir or pickup directory, or to pipe them to its `sendmail`, and let
+it deliver them.
+"""
+import abc
+import contextlib
+import mailbox
+import shlex
+import subprocess  # nosec
+import typing
+import uuid
+from collections.abc import Sequence
+from email.message import EmailMessage
+from pathlib import Path
+
+import structlog
+
+from nhound.state import write_atomically
+
+rlog = structlog.get_logger("nhound.delivery")
+
+MAIL_TRANSPORTS = ("smtp", "maildir", "pickup", "sendmail")
+SENDMAIL = ("/usr/sbin/sendmail", "-t", "-oi")
+
+
+class MailTransport(abc.ABC):
+    """A delivery backend, failures are raised as `OSError`.
+
+    Batch is how many messages it is best handed over at once.
+    """
+
+    batch = 1
+
+    @abc.abstractmethod
+    def deliver(self, message: EmailMessage) -> None:
+        """Deliver a message."""
+
+    def send(self, messages: Sequence[EmailMessage]) -> list[bool]:
+        """Deliver the messages, tell whether each was."""
+        sent = []
+        for message in messages:
+            try:
+                self.deliver(message)
+            except OSError as e:
+                rlog.error("Failed to deliver email", error=e, receiver=message["To"])
+                sent.append(False)
+            else:
+                sent.append(True)
+        return sent
+
+
+class MaildirTransport(MailTransport):
+    """Write the messages in a maildir, its `new` folder is created if needed."""
+
+    def __init__(self, path: Path) -> None:
+        """Init."""
+        self._maildir = mailbox.Maildir(path, create=True)
+
+    def deliver(self, message: EmailMessage) -> None:
+        """Deliver a message."""
+        # Written in `tmp` and moved to `new`, never seen half written.
+        self._maildir.add(message)
+
+
+class PickupTransport(MailTransport):
+    """Write the messages as `.eml` files in a pickup directory."""
+
+    def __init__(self, path: Path) -> None:
+        """Init."""
+        self._path = path
+        self._path.mkdir(parents=True, exist_ok=True)
+
+    def deliver(self, message: EmailMessage) -> None:
+        """Deliver a message."""
+        write_atomically(self._path / f"{uuid.uuid4()}.eml", message.as_bytes())
+
+
+class SendmailTransport(MailTransport):
+    """Pipe the messages to a `sendmail` compatible binary, in batches.
+
+    `sendmail` takes one message at a time: a batch is piped to as many
+    processes, that run at the same time.
+    """
+
+    def __init__(self, command: Sequence[str] = SENDMAIL, batch: int = 50) -> None:
+        """Init."""
+        self._command = list(command)
+        self.batch = max(1, batch)
+
+    def deliver(self, message: EmailMessage) -> None:
+        """Pipe a message to sendmail."""
+        if not self.send([message])[0]:
+            msg = "sendmail failed"
+            raise OSError(msg)
+
+    def _pipe(self, message: EmailMessage) -> subprocess.Popen[bytes] | None:
+        """Start piping a message to sendmail, None if it failed."""
+        try:
+            process = subprocess.Popen(  # noqa: S603 # nosec
+                self._command,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+            )
+        except OSError as e:
+            rlog.error("Failed to run sendmail", error=e, receiver=message["To"])
+            return None
+        stdin = typing.cast("typing.IO[bytes]", process.stdin)
+        # If it quit early, its status tells why.
+        with contextlib.suppress(OSError):
+            stdin.write(message.as_bytes())
+        with contextlib.suppress(OSError):
+            stdin.close()
+        return process
+
+    def send(self, messages: Sequence[EmailMessage]) -> list[bool]:
+        """Pipe the messages to sendmail, at the same time."""
+        processes = [self._pipe(x) for x in messages]
+        sent = []
+        for message, process in zip(messages, processes, strict=True):
+            if process is None:
+                sent.append(False)
+                continue
+            stderr = typing.cast("typing.IO[bytes]", process.stderr)
+            error = stderr.read()
+            stderr.close()
+            sent.append(not process.wait())
+            if process.returncode:
+                rlog.error(
+                    "sendmail failed",
+                    status=process.returncode,
+                    error=error.decode(errors="replace").strip(),
+                    receiver=message["To"],
+                )
+        rlog.debug(
+            "Messages piped to sendmail", count=len(messages), failed=sent.count(False)
+        )
+        return sent
+
+
+def make_mail_transport(
+    kind: str, path: str | None = None, batch: int = 50
+) -> MailTransport | None:
+    """Make the delivery backend, None for SMTP.
+
+    The path is the directory of `maildir` and `pickup`, or the `sendmail`
+    command line.
+    """
+    if kind not in MAIL_TRANSPORTS:
+        msg = f"Unknown email transport {kind}"
+        rlog.error(msg, kinds=MAIL_TRANSPORTS)
+        raise ValueError(msg)
+    if kind == "sendmail":
+        return SendmailTransport(shlex.split(path) if path else SENDMAIL, batch)
+    if kind == "smtp":
+        return None
+    if not path:
+        msg = f"The {kind} email transport needs a directory"
+        rlog.error(msg)
+        raise ValueError(msg)
+    if kind == "maildir":
+        return MaildirTransport(Path(path))
+    return PickupTransport(Path(path))
@@ -1,9 +1,16 @@
 # -*- coding: utf-8 -*-
 # Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.id
 """Email sending module."""
+import smtplib
+import threading
+import typing
+from collections.abc import Iterator
+from contextlib import contextmanager
+
 import structlog
 from redmail import EmailSender  # pyright: ignore [reportPrivateImportUsage]
 
+from nhound.delivery import MailTransport
 from nhound.user import Page
 
 rlog = structlog.get_logger("nhound.email")
@@ -46,29 +53,93 @@ Nhound bot.
 {{ company }}
     """
 
-    def __init__(self, email: EmailSender, sender: str) -> None:
-        """Initialize."""
+    def __init__(
+        self, email: EmailSender, sender: str, transport: MailTransport | None = None
+    ) -> None:
+        """Initialize.
+
+        It can be shared by threads, the emails are sent one at a time. With
+        a transport, the emails are only rendered by the sender, and handed
+        over to the transport rather than sent by SMTP, a batch at a time,
+        see `send_many`.
+        """
         self._email = email
         self._sender = sender
+        self._transport = transport
+        self._lock = threading.Lock()
+        self._sessions = 0
 
-    def send(self, receivers: list, body_params: dict[str, str | list[Page]]) -> bool:
-        """Send email."""
+    @contextmanager
+    def session(self) -> Iterator[None]:
+        """Keep one connection open for all the emails sent meanwhile.
+
+        Sessions can overlap, the connection is closed at the end of the last.
+        A transport has no connection to keep.
+        """
+        with self._lock:
+            self._sessions += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._sessions -= 1
+                if not self._sessions:
+                    self._close()
+
+    def _close(self) -> None:
+        """Close the connection, if any."""
+        if self._transport is None:
+            self._email.close()
+
+    @property
+    def batch(self) -> int:
+        """Get how many emails are best sent at once, see `send_many`."""
+        return 1 if self._transport is None else self._transport.batch
+
+    def _send_in_session(self, **kwargs: typing.Any) -> None:
+        """Send on the connection of the session, reconnect if it was dropped."""
+        if not self._email.is_alive:
+            self._email.connect()
+        try:
+            self._email.send(**kwargs)
+        except smtplib.SMTPServerDisconnected:
+            rlog.info("Email server disconnected, reconnecting")
+            self._email.connect()
+            self._email.send(**kwargs)
+
+    def _message(
+        self, receivers: list, body_params: dict[str, str | list[Page]]
+    ) -> dict[str, typing.Any] | None:
+        """Get the email, None if there are no pages to tell about."""
         sz = len(body_params["pages"])
         if sz == 0:
-            return True
+            return None
         subject = f"{sz} Notion pages requires your attention"
         if sz == 1:
             subject = f"{sz} Notion page requires your attention"
+        return {
+            "subject": subject,
+            "sender": self._sender,
+            "receivers": receivers,
+            "text": self.text,
+            "html": self.html,
+            "body_params": body_params,
+        }
+
+    def send(self, receivers: list, body_params: dict[str, str | list[Page]]) -> bool:
+        """Send email."""
+        message = self._message(receivers, body_params)
+        if message is None:
+            return True
+        if self._transport is not None:
+            return self._deliver(self._transport, [message])[0]
         try:
-            with self._email:
-                self._email.send(
-                    subject=subject,
-                    sender=self._sender,
-                    receivers=receivers,
-                    text=self.text,
-                    html=self.html,
-                    body_params=body_params,
-                )
+            with self._lock:
+                if self._sessions:
+                    self._send_in_session(**message)
+                else:
+                    with self._email:
+                        self._email.send(**message)
         except ConnectionRefusedError as e:
             rlog.error(
                 "Failed to send email",
@@ -80,3 +151,29 @@ Nhound bot.
             return False
         else:
             return True
+
+    def send_many(
+        self, emails: list[tuple[list, dict[str, str | list[Page]]]]
+    ) -> list[bool]:
+        """Send several emails, tell whether each was sent.
+
+        With a transport, they are handed over together: a sent email is
+        delivered, not merely queued.
+        """
+        if self._transport is None:
+            return [self.send(*x) for x in emails]
+        messages = [self._message(*x) for x in emails]
+        delivered = iter(
+            self._deliver(self._transport, [x for x in messages if x is not None])
+        )
+        return [True if x is None else next(delivered) for x in messages]
+
+    def _deliver(
+        self, transport: MailTransport, messages: list[dict[str, typing.Any]]
+    ) -> list[bool]:
+        """Render the emails and hand them over to the transport."""
+        if not messages:
+            return []
+        rendered = [self._email.get_message(**x) for x in messages]
+        with self._lock:
+            return transport.send(rendered)
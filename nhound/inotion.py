@@ -2,19 +2,43 @@
 # Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
 """Interface to Notion."""
 import logging
+import os
+import time
 import typing
-from re import search
+from collections.abc import Collection, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+from heapq import heappop, heappush
+from itertools import count, islice
+from pathlib import Path
+from re import findall, search
 
 import pendulum
 import structlog
-from notion_client import APIResponseError, Client
-from notion_client.helpers import collect_paginated_api, is_full_page
+from notion_client import APIErrorCode, APIResponseError
+from notion_client.helpers import (
+    is_full_page,
+    iterate_paginated_api,
+)
 from pendulum.datetime import DateTime
 
 from nhound import NOW
+from nhound.budget import CrawlBudget
 from nhound.cohort import Cohort
-from nhound.dehumanize import dehumanize
+from nhound.decode import NotionClient
+from nhound.dehumanize import Threshold, parse_threshold, subtract
+from nhound.memory import phase
+from nhound.partition import query_database
+from nhound.prune import Pruner, load_pruner
+from nhound.shard import crawl_sharded
+from nhound.spill import EdgeSpill
+from nhound.state import Checkpoint, CrawlState, PageRecord, UsersCache
+from nhound.times import format_time, parse_time, plain
+from nhound.transport import TransportConfig, make_http_client
 from nhound.user import Page, User
+from nhound.utils import env_flag, env_float, env_int
+from nhound.workqueue import WorkQueue, heartbeat, worker_name
 
 rlog = structlog.get_logger("nhound.inotion")
 
@@ -23,153 +47,763 @@ class INotionError(Exception):
     """Base class for Notion errors."""
 
 
+SCAN_MODES = ("full", "callout", "head")
+CRAWL_MODES = ("tree", "watermark")
+USERS_MODES = ("list", "lazy")
+DEFAULT_PROPERTIES = ("title",)  # Every page has it.
+CHILD_PAGE_FIELDS = ("created_time", "last_edited_time", "created_by", "last_edited_by")
+
+
+def page_title(page: typing.Any) -> str:
+    """Get the title of a page, from its URL unless it is known."""
+    if page.get("title"):
+        return str(page["title"])
+    try:
+        url: str = page["url"]
+        return url.rsplit("/", 1)[-1].rsplit("-", 1)[0]
+    except KeyError as e:
+        rlog.exception(e)
+        return "UNSET"
+
+
+def child_page(block: typing.Any) -> dict[str, typing.Any] | None:
+    """Get a child page from its block, None if a field is missing.
+
+    The block has the title, the times and the authors of the page, but
+    not its URL: it is made from the title and the ID, as Notion does, and
+    Notion redirects it to the page anyway. The title is kept as is, the
+    URL only has its ASCII letters and digits.
+    """
+    if not all(block.get(x) for x in CHILD_PAGE_FIELDS):
+        return None
+    title = block["child_page"].get("title", "")
+    slug = "-".join(findall("[A-Za-z0-9]+", title))
+    name = block["id"].replace("-", "")
+    if slug:
+        name = f"{slug}-{name}"
+    return {
+        "id": block["id"],
+        "url": f"https://www.notion.so/{name}",
+        "title": title,
+        "archived": block.get("archived") or block.get("in_trash"),
+        **{x: block[x] for x in CHILD_PAGE_FIELDS},
+    }
+
+
+class Task(typing.NamedTuple):
+    """A page or a database to crawl."""
+
+    kind: str  # Either page or database.
+    uuid: str
+    depth: int = 0  # Below the root pages.
+
+
+class Child(typing.NamedTuple):
+    """A child page or database, as found in the blocks of its parent."""
+
+    kind: str  # Either page or database.
+    uuid: str
+    title: str
+    archived: bool
+    last_edited_time: str  # Empty if unknown.
+
+    @classmethod
+    def from_block(cls, block: typing.Any) -> "Child":
+        """Create a child from its child_page or child_database block."""
+        return cls(
+            "page" if block["type"] == "child_page" else "database",
+            block["id"],
+            block[block["type"]].get("title", ""),
+            bool(block.get("archived") or block.get("in_trash")),
+            block.get("last_edited_time") or "",
+        )
+
+
+class PageScan(typing.NamedTuple):
+    """What is found in the blocks of a page.
+
+    Scans are cached for the life of the process: only IDs and hints are
+    kept, not the blocks.
+    """
+
+    owners: tuple[str, ...]  # User uuids from the callout.
+    threshold: Threshold | None  # From the callout, if any.
+    children: tuple[Child, ...]
+
+
+class CrawlConfig(typing.NamedTuple):
+    """How the pages are crawled.
+
+    The scan mode sets how much of a page's blocks are read:
+    - full: all of them, every callout is used.
+    - callout: stop at the first owner callout, unless children still
+      have to be discovered from the blocks.
+    - head: only the callouts of the first `scan_blocks` blocks. The
+      blocks after them are only listed when children still have to be
+      discovered.
+
+    The crawl mode is either:
+    - tree: walk every page and database from the root pages.
+    - watermark: only get the pages edited since the previous run, with
+      the Notion search, and keep all the pages in the crawl state. All
+      the pages are searched again every `resync_days`, 0 for never.
+
+    With several `processes`, a tree crawl is sharded: the root pages and
+    the databases are crawled by a pool of processes. With a work queue,
+    items are leased for `lease_seconds` by the `worker`, named after the
+    host and the process by default. The workers share the `run` of that
+    name, or else the run in progress.
+
+    A database of more than one page of rows is queried in up to
+    `database_partitions` ranges of creation times, at the same time, see
+    `query_database`. Pages are retrieved and databases queried with only
+    the `properties` of the allowlist, by ID, None for all of them. nhound
+    reads none, Notion's `title` is the smallest.
+    """
+
+    mode: str = "tree"
+    scan: str = "full"
+    scan_blocks: int = 10
+    resync_days: float = 7
+    processes: int = 1
+    lease_seconds: float = 300
+    worker: str | None = None
+    run: str | None = None
+    database_partitions: int = 1
+    properties: Collection[str] | None = DEFAULT_PROPERTIES
+
+    @classmethod
+    def from_env(cls) -> "CrawlConfig":
+        """Create a configuration from the environment variables."""
+        default = cls()
+        properties: tuple[str, ...] | None = DEFAULT_PROPERTIES
+        if os.getenv("NHOUND_PROPERTIES"):
+            properties = tuple(
+                x.strip()
+                for x in os.environ["NHOUND_PROPERTIES"].split(",")
+                if x.strip()
+            )
+            if "*" in properties:
+                properties = None
+        return cls(
+            mode=os.getenv("NHOUND_CRAWL", default.mode),
+            scan=os.getenv("NHOUND_CALLOUT_SCAN", default.scan),
+            scan_blocks=env_int("NHOUND_CALLOUT_SCAN_BLOCKS", default.scan_blocks),
+            resync_days=env_float("NHOUND_WATERMARK_RESYNC_DAYS", default.resync_days),
+            processes=env_int("NHOUND_CRAWL_PROCESSES", default.processes),
+            lease_seconds=env_float(
+                "NHOUND_QUEUE_LEASE_SECONDS", default.lease_seconds
+            ),
+            run=os.getenv("NHOUND_QUEUE_RUN") or None,
+            database_partitions=env_int(
+                "NHOUND_DATABASE_PARTITIONS", default.database_partitions
+            ),
+            properties=properties,
+        )
+
+
+class BudgetConfig(typing.NamedTuple):
+    """What is left out of a crawl, and how long it may last.
+
+    The pages and databases matching the `prune` rules are not crawled, by
+    default the meeting databases, see `Pruner`.
+
+    A tree crawl of one process, without a queue, stops once the run has
+    lasted `deadline` seconds or made `max_calls` calls to Notion. Such a
+    crawl is saved to the `checkpoint` file every `checkpoint_seconds`, and
+    when it is cut short, to be resumed, see `INotion.get_email_data`.
+    """
+
+    prune: Pruner | None = None
+    deadline: float | None = None
+    max_calls: int | None = None
+    checkpoint: Path | None = None
+    checkpoint_seconds: float = 300
+
+    @classmethod
+    def from_env(cls, checkpoint: Path) -> "BudgetConfig":
+        """Create a configuration from the environment variables.
+
+        The crawl is saved to the checkpoint file if NHOUND_CHECKPOINT_SECONDS
+        is set.
+        """
+        prune = os.getenv("NHOUND_PRUNE_RULES")
+        seconds = env_float("NHOUND_CHECKPOINT_SECONDS", 0)
+        return cls(
+            prune=load_pruner(Path(prune)) if prune else None,
+            deadline=env_float("NHOUND_CRAWL_DEADLINE_SECONDS", 0) or None,
+            max_calls=env_int("NHOUND_CRAWL_MAX_CALLS", 0) or None,
+            checkpoint=checkpoint if seconds else None,
+            checkpoint_seconds=seconds,
+        )
+
+
+class UsersConfig(typing.NamedTuple):
+    """How the Notion users are got, and where their pages are kept.
+
+    The users are cached for `ttl` hours, and fetched again when an
+    unknown user shows up. With the `lazy` mode, instead of `list`, the
+    users are not listed: only the users of stale pages are looked up,
+    once per run, with up to `lookup_workers` requests at a time.
+
+    With `spill`, the (user, page) edges of a run are kept on disk, in
+    `spill_dir` or the temporary directory, and the emails are streamed
+    user after user, see `EdgeSpill`. This bounds the memory of very large
+    workspaces.
+    """
+
+    mode: str = "list"
+    ttl: int = 168
+    lookup_workers: int = 8
+    spill: bool = False
+    spill_dir: Path | None = None
+
+    @classmethod
+    def from_env(cls) -> "UsersConfig":
+        """Create a configuration from the environment variables."""
+        default = cls()
+        spill_dir = os.getenv("NHOUND_SPILL_DIR")
+        return cls(
+            mode=os.getenv("NHOUND_USERS", default.mode),
+            ttl=env_int("NHOUND_USERS_CACHE_TTL_HOURS", default.ttl),
+            lookup_workers=env_int(
+                "NHOUND_USERS_LOOKUP_WORKERS", default.lookup_workers
+            ),
+            spill=env_flag("NHOUND_SPILL", default.spill),
+            spill_dir=Path(spill_dir) if spill_dir else None,
+        )
+
+
 class INotion:
     """A interface to Notion's API."""
 
     _nhound_delimiters: typing.ClassVar[str] = "nhound{(.+?)}"
 
-    def __init__(self, token: str, threashold: int = 13) -> None:
-        """Init."""
-        logger = structlog.wrap_logger(
-            logging.getLogger("notion-client"),
-            logger_factory=structlog.stdlib.LoggerFactory(),
-            wrapper_class=structlog.stdlib.BoundLogger,
+    def __init__(
+        self,
+        token: str,
+        threashold: int = 13,
+        log_level: int | None = None,
+        crawl: CrawlConfig | None = None,
+        budget: BudgetConfig | None = None,
+        transport: TransportConfig | None = None,
+        users: UsersConfig | None = None,
+        state: CrawlState | None = None,
+        users_cache: UsersCache | None = None,
+        queue: WorkQueue | None = None,
+    ) -> None:
+        """Init.
+
+        The client logs through a plain logging logger: records below the
+        level are dropped before any processing. By default, the level is
+        the one of the nhound loggers.
+
+        The settings are grouped by concern, see `CrawlConfig`,
+        `BudgetConfig`, `TransportConfig` and `UsersConfig`; the defaults
+        are used for those not given. A watermark crawl keeps all the pages
+        in the crawl `state`. The users are cached on disk too with a
+        `users_cache`. With a work `queue`, a tree crawl is shared by all
+        the workers of the queue, on this host or others, see `WorkQueue`:
+        only one of them gets the result of the run, the others have nothing
+        to report.
+
+        The pages most likely to be stale are crawled first: those edited
+        the longest ago, as last seen or as told by their parent's blocks.
+        Page scans are cached until the page is edited: this state is kept
+        warm when the same instance is used for several runs, see `reset`.
+        """
+        crawl = crawl if crawl is not None else CrawlConfig()
+        budget = budget if budget is not None else BudgetConfig()
+        users = users if users is not None else UsersConfig()
+        if crawl.scan not in SCAN_MODES:
+            msg = f"Unknown scan mode {crawl.scan}"
+            rlog.error(msg, modes=SCAN_MODES)
+            raise ValueError(msg)
+        if users.mode not in USERS_MODES:
+            msg = f"Unknown users mode {users.mode}"
+            rlog.error(msg, modes=USERS_MODES)
+            raise ValueError(msg)
+        if crawl.mode not in CRAWL_MODES:
+            msg = f"Unknown crawl mode {crawl.mode}"
+            rlog.error(msg, modes=CRAWL_MODES)
+            raise ValueError(msg)
+        if log_level is None:
+            log_level = logging.getLogger("nhound").getEffectiveLevel()
+        if transport is None:
+            transport = TransportConfig()
+        http = make_http_client(transport)
+        http.event_hooks["request"].append(self._spend)
+        self._notion = NotionClient(
+            client=http,
+            auth=token,
+            logger=logging.getLogger("notion-client"),
+            log_level=log_level,
+            properties=crawl.properties,
         )
-        self._notion = Client(auth=token, logger=logger, log_level=logging.DEBUG)
-        self._cohort = Cohort()
+        self._filter = (
+            {}
+            if crawl.properties is None
+            else {"filter_properties": list(crawl.properties)}
+        )
+        # The client sets one timeout for everything, use the per phase ones.
+        self._notion.client.timeout = transport.timeout
+        self._now = NOW
+        self._cohort = Cohort(self._now)
         self._nhound_default_threashold = threashold
-        rlog.info("Initialized INotion", threashold=self._nhound_default_threashold)
+        self._scan = crawl.scan
+        self._scan_blocks = max(1, crawl.scan_blocks)
+        self._users_ttl = users.ttl
+        self._users: list[tuple[str, str, str]] | None = None
+        self._users_time = NOW
+        self._known: set[str] = set()  # The uuids of the users.
+        self._others: set[str] = set()  # Bots, not users.
+        self._users_cache = users_cache
+        self._users_mode = users.mode
+        self._lookup_workers = max(1, users.lookup_workers)
+        self._lookups: dict[str, User | None] = {}  # Memoized for the run.
+        self._scans: dict[str, tuple[str, bool, PageScan]] = {}
+        self._crawl_mode = crawl.mode
+        self._state = state
+        self._resync_days = crawl.resync_days
+        self._processes = crawl.processes
+        self._queue = queue
+        self._lease_seconds = crawl.lease_seconds
+        self._worker = crawl.worker or worker_name()
+        self._run = crawl.run
+        self._spill = users.spill
+        self._spill_dir = users.spill_dir
+        self._prune = budget.prune if budget.prune is not None else Pruner()
+        self._deadline = budget.deadline
+        self._checkpoint = budget.checkpoint
+        self._checkpoint_seconds = budget.checkpoint_seconds
+        self._max_calls = budget.max_calls
+        self._database_partitions = max(1, crawl.database_partitions)
+        self._budget = CrawlBudget()
+        self._hints: dict[str, str] = {}  # Last edited times, from blocks.
+        self._child_pages: dict[str, typing.Any] = {}  # From blocks, for the run.
+        self._stale = ""  # The default threashold, as a Notion time.
+        self._thresholds: dict[Threshold | None, datetime] = {}  # For the run.
+        if (budget.deadline or budget.max_calls) and (
+            crawl.processes > 1 or queue is not None
+        ):
+            rlog.warning("The crawl budget is ignored with processes or a queue")
+        self._visited: set[str] = set()
+        # What a worker process needs to make its own INotion.
+        self._spawn_args = (
+            token,
+            {
+                "threashold": threashold,
+                "log_level": log_level,
+                "crawl": CrawlConfig(
+                    scan=crawl.scan,
+                    scan_blocks=crawl.scan_blocks,
+                    database_partitions=crawl.database_partitions,
+                    properties=crawl.properties,
+                ),
+                "budget": BudgetConfig(prune=self._prune),
+                "transport": transport,
+                "users": UsersConfig(
+                    mode=users.mode,
+                    ttl=users.ttl,
+                    lookup_workers=users.lookup_workers,
+                ),
+            },
+        )
+        rlog.info(
+            "Initialized INotion",
+            threashold=self._nhound_default_threashold,
+            scan=self._scan,
+            scan_blocks=self._scan_blocks,
+            crawl=self._crawl_mode,
+            users=self._users_mode,
+            processes=self._processes,
+            queue=type(queue).__name__ if queue else None,
+        )
+
+    def reset(self, now: DateTime | None = None) -> None:
+        """Start a new run at `now`, keeping the caches.
+
+        The cohort is rebuilt from scratch and every threashold is relative
+        to this time, so a long running process stays correct across days.
+        """
+        self._now = now if now is not None else pendulum.now("UTC")
+        self._cohort.close()
+        self._cohort = Cohort(
+            self._now,
+            self._lookup_users if self._users_mode == "lazy" else None,
+            EdgeSpill(self._spill_dir) if self._spill else None,
+        )
+        self._visited = set()
+        self._child_pages = {}
+        self._lookups = {}
+        self._budget = CrawlBudget(self._deadline, self._max_calls)
+        self._thresholds = {}
+        self._stale = format_time(self._threashold(None))
+        rlog.debug("Reset INotion", now=self._now, scans=len(self._scans))
+
+    def _spend(self, request: typing.Any) -> None:
+        """Count a request in the budget of the run."""
+        self._budget(request)
 
     def get_users(self) -> None:
-        """Get users."""
+        """Get users, from the cache unless it has expired.
+
+        Lazy users are looked up later, see `_lookup_users`.
+        """
         rlog.debug("get_users")
+        if self._users_mode == "lazy":
+            return
+        if (
+            self._users is None
+            and self._users_cache is not None
+            and self._users_cache.time is not None
+        ):
+            self.load_users(self._users_cache.users, self._users_cache.time)
+            self._others = set(self._users_cache.others)
+        if (
+            self._users is None
+            or self._users_time.add(hours=self._users_ttl) <= self._now
+        ):
+            self._fetch_users()
+        for uuid, name, email in self._users:  # type: ignore[union-attr]
+            self._cohort.add_user(User(uuid, name, email))
+        rlog.info("Got users from Notion", count=self._cohort.size)
+
+    def _fetch_users(self) -> None:
+        """Fetch all the users from Notion, page after page."""
         try:
-            list_users_response = self._notion.users.list()
+            items = list(iterate_paginated_api(self._notion.users.list))
         except APIResponseError as e:
             rlog.exception(e)
             msg = "Failed to get users from Notion."
             rlog.error(msg)
             raise INotionError(msg) from e
-        for item in list_users_response["results"]:  # type: ignore[index]
-            if item["type"] == "person":
-                self._cohort.add_user(
-                    User(item["id"], item["name"], item["person"]["email"])
+        users = [
+            (item["id"], item["name"], item["person"]["email"])
+            for item in items
+            if item["type"] == "person"
+        ]
+        self.load_users(users, self._now)
+        self._others = {item["id"] for item in items if item["type"] != "person"}
+        rlog.debug("Fetched users", users=len(users), others=len(self._others))
+        if self._users_cache is not None:
+            self._users_cache.time = self._now
+            self._users_cache.users = users
+            self._users_cache.others = sorted(self._others)
+            self._users_cache.save()
+
+    def _lookup_user(self, uuid: str) -> User | None:
+        """Look up a user, None for a bot or an unknown user."""
+        try:
+            item = self._notion.users.retrieve(uuid)
+        except APIResponseError as e:
+            rlog.warning("Failed to look up user", uuid=uuid, error=e)
+            return None
+        if item["type"] != "person":  # type: ignore[index]
+            return None
+        return User(
+            item["id"],  # type: ignore[index]
+            item["name"],  # type: ignore[index]
+            item["person"]["email"],  # type: ignore[index]
+        )
+
+    def _lookup_users(self, uuids: list[str]) -> dict[str, User | None]:
+        """Look up these users, each once per run, several at a time."""
+        missing = [x for x in dict.fromkeys(uuids) if x not in self._lookups]
+        if missing:
+            with ThreadPoolExecutor(
+                max_workers=min(self._lookup_workers, len(missing)),
+                thread_name_prefix="nhound-lookup",
+            ) as pool:
+                self._lookups.update(
+                    zip(missing, pool.map(self._lookup_user, missing), strict=True)
                 )
-        rlog.info("Got users from Notion", count=self._cohort.size)
+            rlog.info("Looked up users", count=len(missing))
+        return {x: self._lookups[x] for x in uuids}
+
+    def _refresh_users(self, uuid: str) -> None:
+        """Fetch the users again if this one is unheard of.
+
+        At most once per run: someone may have joined since the users were
+        cached.
+        """
+        if (
+            self._users is None
+            or self._users_time >= self._now
+            or uuid in self._known
+            or uuid in self._others
+        ):
+            return
+        rlog.info("Unknown user, fetching the users again", uuid=uuid)
+        known = self._known
+        self._fetch_users()
+        for _uuid, name, email in self._users:
+            if _uuid not in known:
+                self._cohort.add_user(User(_uuid, name, email))
+
+    def _threashold(self, threshold: Threshold | None) -> datetime:
+        """Get the threashold time of this run, the default one if None.
+
+        Each is computed once per run, as a standard datetime.
+        """
+        try:
+            return self._thresholds[threshold]
+        except KeyError:
+            pass
+        if threshold is None:
+            when = self._now.subtract(weeks=self._nhound_default_threashold)
+        else:
+            when = subtract(threshold, self._now)
+        self._thresholds[threshold] = plain(when)
+        return self._thresholds[threshold]
+
+    def _parse_callout(self, block: typing.Any) -> tuple[list[str], Threshold | None]:
+        """Analyse a callout block.
+
+        Returns the uuids of the mentioned users and the nhound threshold.
+        This is an owner callout if it has either.
+        """
+        owners: list[str] = []
+        threshold = None
+        for item in block["callout"]["rich_text"]:
+            if item["type"] == "mention":
+                if "user" not in item["mention"]:
+                    rlog.debug("No user in callout", item=item)
+                    continue
+                owners.append(item["mention"]["user"]["id"])
+                rlog.debug("Found callout user", uuid=owners[-1])
+            if item["type"] == "text":
+                match = search(self._nhound_delimiters, item["text"]["content"])
+                if match is None:
+                    continue
+                # This will overwirght the standard threashold.
+                date = match.group(1)
+                spec = parse_threshold(date)
+                if spec is None:
+                    rlog.warning(
+                        "Cannot parse nhound callout date, using default",
+                        text=item["text"]["content"],
+                        date=date,
+                    )
+                    continue
+                threshold = spec
+                rlog.debug(
+                    "Found nhoud callout date",
+                    text=item["text"]["content"],
+                    date=date,
+                    threshold=threshold,
+                )
+        return (owners, threshold)
 
     def _parse_callout_block(
-        self, blocks: list[typing.Any]
-    ) -> tuple[list[User], DateTime]:
+        self, blocks: Iterable[typing.Any]
+    ) -> tuple[list[User], datetime]:
         """Analyse any callout block."""
-        users: list[User] = []
-        threashold = NOW.subtract(weeks=self._nhound_default_threashold)
+        owners, threshold = self._parse_callout_blocks(blocks)
+        return (self._resolve(owners), self._threashold(threshold))
+
+    def _parse_callout_blocks(
+        self, blocks: Iterable[typing.Any]
+    ) -> tuple[list[str], Threshold | None]:
+        """Analyse all the callout blocks, the last threshold wins."""
+        owners: list[str] = []
+        threshold = None
         for block in blocks:
             if block["type"] == "callout":
-                for item in block["callout"]["rich_text"]:
-                    if item["type"] == "mention":
-                        if "user" not in item["mention"]:
-                            rlog.debug("No user in callout", item=item)
-                            continue
-                        usr = self._cohort.get_by_uuid(item["mention"]["user"]["id"])
-                        if usr is not None:
-                            users.append(usr)
-                        rlog.debug("Found callout user", user=usr)
-                    if item["type"] == "text":
-                        try:
-                            # This will overwirght the standard threashold.
-                            date = search(  # type: ignore [union-attr]
-                                self._nhound_delimiters, item["text"]["content"]
-                            ).group(  # pyright: ignore [reportOptionalMemberAccess]
-                                1
-                            )
-                            threashold = dehumanize(date)
-                            rlog.debug(
-                                "Found nhoud callout date",
-                                text=item["text"]["content"],
-                                date=date,
-                                threashold=threashold,
-                            )
-                        except AttributeError:
-                            continue
-        return (users, threashold)
-
-    def _get_page_data(self, _id: str) -> None:
-        page = self._notion.pages.retrieve(_id)
-        title = "UNSET"
+                _owners, _threshold = self._parse_callout(block)
+                owners.extend(_owners)
+                if _threshold is not None:
+                    threshold = _threshold
+        return (owners, threshold)
+
+    def _resolve(self, owners: Iterable[str]) -> list[User]:
+        """Get the cohort users, ignoring unknown ones."""
+        users = []
+        for uuid in owners:
+            self._refresh_users(uuid)
+            usr = self._cohort.get_by_uuid(uuid)
+            if usr is not None:
+                users.append(usr)
+        return users
+
+    def _iter_blocks(self, _id: str, discover: bool = True) -> Iterator[typing.Any]:
+        """Iterate over the blocks of a page, fetching them lazily.
+
+        Children are discovered from all the blocks, listed in full pages.
+        """
+        if self._scan == "full" or discover:
+            return iterate_paginated_api(
+                self._notion.blocks.children.list, block_id=_id
+            )
+        page_size = min(self._scan_blocks, 100)
+        blocks = iterate_paginated_api(
+            self._notion.blocks.children.list, block_id=_id, page_size=page_size
+        )
+        if self._scan == "head":
+            return islice(blocks, self._scan_blocks)
+        return blocks
+
+    def _scan_page(self, _id: str, discover: bool = True) -> PageScan:
+        """Scan the blocks of a page.
+
+        Without `discover`, the child page and database blocks are not
+        needed. The blocks are freshly listed: the child pages are kept for
+        the run, see `child_page`.
+        """
+        if self._scan == "full":
+            blocks = list(self._iter_blocks(_id))
+            owners, threshold = self._parse_callout_blocks(blocks)
+            children = [
+                x for x in blocks if x["type"] in ("child_page", "child_database")
+            ]
+        else:
+            owners = []
+            threshold = None
+            children = []
+            found = False
+            for index, block in enumerate(self._iter_blocks(_id, discover)):
+                head = self._scan != "head" or index < self._scan_blocks
+                if block["type"] == "callout" and not found and head:
+                    owners, threshold = self._parse_callout(block)
+                    found = bool(owners) or threshold is not None
+                elif discover and block["type"] in ("child_page", "child_database"):
+                    children.append(block)
+                if found and not discover and self._scan == "callout":
+                    rlog.debug("Found owner callout, stop scanning", uuid=_id)
+                    break
+        for block in children:
+            page = child_page(block) if block["type"] == "child_page" else None
+            if page is not None:
+                self._child_pages[block["id"]] = page
+        return PageScan(
+            tuple(owners), threshold, tuple(Child.from_block(x) for x in children)
+        )
+
+    def _cached_scan(
+        self, _id: str, last_edited_time: str, discover: bool = True
+    ) -> PageScan:
+        """Scan the blocks of a page, unless it was not edited since last time."""
         try:
-            title = page["url"].rsplit("/", 1)[-1].rsplit("-", 1)[0]  # type: ignore[index]
-        except KeyError as e:
-            rlog.exception(e)
-        blocks = self._notion.blocks.children.list(_id)["results"]  # type: ignore[index]
-        users, threashold = self._parse_callout_block(blocks)
+            edited, discovered, scan = self._scans[_id]
+        except KeyError:
+            pass
+        else:
+            if edited == last_edited_time and (discovered or not discover):
+                rlog.debug("Page unchanged, using cached scan", uuid=_id)
+                return scan
+        scan = self._scan_page(_id, discover)
+        self._scans[_id] = (last_edited_time, discover, scan)
+        return scan
+
+    def _add_page(
+        self, page: Page, owners: Iterable[str], authors: Iterable[str]
+    ) -> None:
+        """Add the page to its callout owners, or else to its authors."""
+        if self._users_mode == "lazy":
+            self._cohort.defer(page, owners, authors)
+            return
+        users = self._resolve(owners)
+        if not users:
+            # We have no users in the callout block.
+            users = self._resolve(authors)
+        for user in users:
+            self._cohort.add_page(user.uuid, page)
+
+    def _pruned(
+        self,
+        kind: str,
+        uuid: str,
+        title: str,
+        depth: int = 0,
+        archived: bool = False,
+    ) -> bool:
+        """Whether or not a page or database is pruned, see `Pruner`."""
+        reason = self._prune.match(kind, uuid, title, depth, archived)
+        if reason is not None:
+            rlog.debug("Pruned", kind=kind, uuid=uuid, title=title, reason=reason)
+        return reason is not None
+
+    def _get_page_data(
+        self, _id: str, discover: bool = True, depth: int = 0
+    ) -> list[Task]:
+        """Get page data, returns the child pages and databases to crawl.
+
+        Children are pruned from the titles of their blocks, before they
+        are requested. Child pages are only retrieved if their block,
+        listed in this run, does not tell all that is needed of them.
+        """
+        page = self._child_pages.pop(_id, None)
+        if page is None:
+            page = self._notion.pages.retrieve(_id, **self._filter)
+        archived = page.get("archived") or page.get("in_trash")
+        if self._pruned("page", _id, "", depth, bool(archived)):
+            return []
+        scan = self._cached_scan(_id, page.get("last_edited_time"), discover)
         my_page = Page(
             _id,
-            title,
-            page.get("url"),  # type: ignore[union-attr]
-            pendulum.parse(page.get("created_time")),  # type: ignore[union-attr]
-            pendulum.parse(page.get("last_edited_time")),  # type: ignore[union-attr]
-            threashold,
+            page_title(page),
+            page.get("url"),
+            parse_time(page.get("created_time")),
+            parse_time(page.get("last_edited_time")),
+            self._threashold(scan.threshold),
+        )
+        self._add_page(
+            my_page,
+            scan.owners,
+            (
+                page.get("created_by")["id"],
+                page.get("last_edited_by")["id"],
+            ),
         )
-        if not users:
-            # We have users in the callout block.
-            for user in users:
-                user.pages.add(my_page)  # pyright: ignore [reportOptionalMemberAccess]
-        else:
-            # Wehave no users in the callout block.
-            usr = self._cohort.get_by_uuid(page.get("created_by")["id"])  # type: ignore[union-attr]
-            if usr is not None:
-                usr.pages.add(my_page)
-            usr = self._cohort.get_by_uuid(page.get("last_edited_by")["id"])  # type: ignore[union-attr]
-            if usr is not None:
-                usr.pages.add(my_page)
 
-        for block in blocks:
-            if block["type"] == "child_page":
-                self._get_page_data(block["id"])
-            if (
-                block["type"] == "child_database"
-                and "meeting" not in block.get("child_database").get("title").lower()
+        children = []
+        for child in scan.children:
+            if not self._pruned(
+                child.kind, child.uuid, child.title, depth + 1, child.archived
             ):
-                self._get_database_data(block["id"])
+                children.append(Task(child.kind, child.uuid, depth + 1))
+                if child.last_edited_time:
+                    self._hints[child.uuid] = child.last_edited_time
+        return children
 
-    def _get_database_data(self, _id: str) -> None:
-        """Get database data."""
-        full_or_partial_pages = collect_paginated_api(
-            self._notion.databases.query, database_id=_id
+    def _get_database_data(self, _id: str, depth: int = 0) -> None:
+        """Get database data, see `query_database`."""
+        full_or_partial_pages = query_database(
+            partial(self._notion.databases.query, **self._filter),
+            _id,
+            self._database_partitions,
         )
         for page in full_or_partial_pages:
             if not is_full_page(page):
                 continue
-            title = "UNSET"
-            try:
-                title = page["url"].rsplit("/", 1)[-1].rsplit("-", 1)[0]
-            except KeyError as e:
-                rlog.exception(e)
+            if self._pruned(
+                "page",
+                page["id"],
+                "",
+                depth + 1,
+                bool(page.get("archived") or page.get("in_trash")),
+            ):
+                continue
             _tmp = Page(
                 _id,
-                title,
+                page_title(page),
                 page.get("url"),
-                pendulum.parse(  # pyright: ignore [reportPrivateImportUsage]
-                    page.get("created_time")
-                ),
-                pendulum.parse(  # pyright: ignore [reportPrivateImportUsage]
-                    page.get("last_edited_time")
-                ),  # pyright: ignore [reportPrivateImportUsage]
-                NOW.subtract(weeks=self._nhound_default_threashold),
+                parse_time(page["created_time"]),
+                parse_time(page["last_edited_time"]),
+                self._threashold(None),
+            )
+            self._add_page(
+                _tmp, (), (page["created_by"]["id"], page["last_edited_by"]["id"])
             )
-            usr = self._cohort.get_by_uuid(page.get("created_by")["id"])
-            if usr is not None:
-                usr.pages.add(_tmp)
-            usr = self._cohort.get_by_uuid(page.get("last_edited_by")["id"])
-            if usr is not None:
-                usr.pages.add(_tmp)
             rlog.info("Found a database entry", page=_tmp)
 
     def stuff(self, uuids: tuple[typing.Any, ...]) -> None:
         """Stuff."""
         rlog.debug("stuff start")
+        self.reset()
         self._get_users()
         self._get_pages(uuids)
+        self._cohort.resolve()
         self._cohort.print_data()
         rlog.debug("stuff end")
 
@@ -182,22 +816,418 @@ class INotion:
             rlog.error(msg)
             raise INotionError(msg) from e
 
-    def _get_pages(self, uuids: tuple[typing.Any, ...]) -> None:
-        """Get all the Notion pages."""
-        for _id in uuids:
+    def _crawl(
+        self,
+        tasks: Iterable[Task],
+        follow: tuple[str, ...] = ("page", "database"),
+        checkpoint: Checkpoint | None = None,
+    ) -> list[Task]:
+        """Crawl these pages and databases, and what they lead to.
+
+        The child pages and databases found are crawled too if their kind
+        is in `follow`, otherwise they are returned. The most likely to be
+        stale are crawled first, until the budget of the run is spent.
+
+        With a checkpoint, the crawl is saved every `checkpoint_seconds`
+        and when it is cut short. It is deleted once the crawl is done.
+        """
+        frontier: list[tuple[str, int, Task]] = []
+        order = count()  # Ties are crawled first come, first served.
+        for x in tasks:
+            heappush(frontier, (self._priority(x), next(order), x))
+        deferred = []
+        saved = time.monotonic()
+        task: Task | None = None  # The one being crawled.
+        try:
+            while frontier:
+                task = None
+                reason = self._budget.exhausted()
+                if reason is not None:
+                    rlog.warning(
+                        "Crawl budget spent",
+                        reason=reason,
+                        calls=self._budget.spent,
+                        left=len(frontier),
+                    )
+                    break
+                if (
+                    checkpoint is not None
+                    and time.monotonic() - saved >= self._checkpoint_seconds
+                ):
+                    self._save_checkpoint(checkpoint, frontier)
+                    saved = time.monotonic()
+                task = heappop(frontier)[2]
+                if task.uuid in self._visited:
+                    continue
+                self._visited.add(task.uuid)
+                try:
+                    if task.kind == "page":
+                        children = self._get_page_data(task.uuid, depth=task.depth)
+                    else:
+                        self._get_database_data(task.uuid, task.depth)
+                        continue
+                except APIResponseError as e:
+                    msg = f"Failed to get {task.kind} from Notion."
+                    rlog.error(msg, uuid=task.uuid, error=e)
+                    continue
+                for child in children:
+                    if child.kind in follow:
+                        heappush(frontier, (self._priority(child), next(order), child))
+                    else:
+                        deferred.append(child)
+        except BaseException:
+            if checkpoint is not None:
+                self._save_checkpoint(checkpoint, frontier, task)
+            raise
+        if checkpoint is not None:
+            if frontier:
+                self._save_checkpoint(checkpoint, frontier)
+            else:
+                checkpoint.delete()
+        return deferred
+
+    def _save_checkpoint(
+        self,
+        checkpoint: Checkpoint,
+        frontier: list[tuple[str, int, Task]],
+        task: Task | None = None,
+    ) -> None:
+        """Save the crawl so far, the task being crawled is to be done again."""
+        tasks = [x[2] for x in frontier]
+        visited = self._visited
+        if task is not None:
+            tasks.append(task)
+            visited = visited - {task.uuid}
+        checkpoint.frontier = [(x.kind, x.uuid, x.depth) for x in tasks]
+        checkpoint.visited = list(visited)
+        checkpoint.edges = self._cohort.edges()
+        checkpoint.deferred = self._cohort.deferred()
+        checkpoint.save()
+
+    def _priority(self, task: Task) -> str:
+        """Get the priority of a task, the last edited time, oldest first.
+
+        Unknown times are taken to be the default threashold: after the
+        pages known to be stale, before those known to be fresh.
+        """
+        try:
+            return self._scans[task.uuid][0]
+        except KeyError:
+            return self._hints.get(task.uuid, self._stale)
+
+    def _get_pages(
+        self, uuids: tuple[typing.Any, ...], resumed: Checkpoint | None = None
+    ) -> None:
+        """Get all the Notion pages, resuming a checkpoint if there is one."""
+        roots = [Task("page", x) for x in uuids]
+        if self._queue is not None:
+            self._crawl_queued(roots)
+            return
+        if self._processes <= 1:
+            self._crawl_local(roots, resumed)
+            return
+        count = 0
+        for uuid, page in crawl_sharded(
+            type(self),
+            self._spawn_args,
+            self._users or [],
+            self._now,
+            roots,
+            self._processes,
+        ):
+            count += self._cohort.add_page(uuid, page)
+        rlog.info("Merged sharded crawl", pages=count, processes=self._processes)
+
+    def _crawl_local(self, roots: list[Task], resumed: Checkpoint | None) -> None:
+        """Crawl in this process, with checkpoints if they are on."""
+        if self._checkpoint is None:
+            self._crawl(roots)
+            return
+        if resumed is None:
+            checkpoint = Checkpoint(self._checkpoint)
+            checkpoint.now = self._now
+            checkpoint.roots = [x.uuid for x in roots]
+            self._crawl(roots, checkpoint=checkpoint)
+            return
+        self._visited.update(resumed.visited)
+        pages = 0
+        for uuid, page in resumed.edges:
+            self._cohort.add_page(uuid, page)
+            pages += 1
+        for page, owners, authors in resumed.deferred:
+            self._cohort.defer(page, owners, authors)
+            pages += 1
+        rlog.info(
+            "Resuming crawl",
+            frontier=len(resumed.frontier),
+            visited=len(resumed.visited),
+            pages=pages,
+        )
+        self._crawl([Task(*x) for x in resumed.frontier], checkpoint=resumed)
+
+    def _resumable(self, uuids: tuple[typing.Any, ...]) -> Checkpoint | None:
+        """Get the checkpoint of an interrupted crawl of these pages, if any."""
+        if self._checkpoint is None:
+            reason = "there are no checkpoints"
+        elif self._crawl_mode != "tree":
+            reason = f"a {self._crawl_mode} crawl has no checkpoints"
+        elif self._queue is not None:
+            reason = "the work queue keeps a queued crawl"
+        elif self._processes > 1:
+            reason = "a sharded crawl has no checkpoints"
+        else:
+            reason = None
+        if reason is not None:
+            rlog.warning("Nothing to resume", reason=reason)
+            return None
+        checkpoint = Checkpoint.load(self._checkpoint)
+        if checkpoint is not None and checkpoint.roots != list(uuids):
+            rlog.warning("The checkpoint is of other pages, starting afresh")
+            return None
+        return checkpoint
+
+    def _crawl_queued(self, roots: list[Task], poll: float = 5.0) -> None:
+        """Crawl as one of the workers of the work queue."""
+        queue = typing.cast("WorkQueue", self._queue)
+        worker = self._worker
+        run, now = queue.open_run(self._run, self._now, self._lease_seconds)
+        queue.put(run, roots)
+        # The users are got once, each item only drops the pages.
+        self.reset(now)
+        self.get_users()
+        count = 0
+        while True:
+            lease = queue.lease(run, worker, self._lease_seconds)
+            if lease is None:
+                if not queue.unfinished(run):
+                    break
+                time.sleep(poll)  # Other workers have the rest.
+                continue
+            try:
+                with heartbeat(queue, lease, self._lease_seconds):
+                    # Each page is an item, for the load to be spread.
+                    edges, deferred = self.crawl_shard(
+                        Task(lease.kind, lease.uuid, lease.depth),
+                        now,
+                        follow=(),
+                        fresh=False,
+                    )
+            except Exception as e:
+                rlog.exception("Queued crawl failed", uuid=lease.uuid, error=e)
+                self._visited.discard(lease.uuid)  # To crawl it again if retried.
+                queue.fail(lease)
+                continue
+            count += queue.done(lease, edges, deferred)
+        rlog.info("Queued crawl done", run=run, worker=worker, items=count)
+        self._cohort.clear()
+        if not queue.finish(run, worker):
+            rlog.info("Another worker has the result", run=run, worker=worker)
+            return
+        pages = sum(self._cohort.add_page(u, p) for u, p in queue.edges(run))
+        rlog.info("Merged queued crawl", run=run, pages=pages)
+
+    def crawl_shard(
+        self,
+        task: Task,
+        now: DateTime,
+        follow: tuple[str, ...] = ("page",),
+        fresh: bool = True,
+    ) -> tuple[list[tuple[str, Page]], list[Task]]:
+        """Crawl one shard: a page tree or a database.
+
+        This is a run of its own, unless not `fresh`: then the users of the
+        current run are kept and only its pages are dropped. Returns the
+        pages found for each user uuid and the children found that are not
+        followed, by default the databases, which are other shards.
+        """
+        if fresh:
+            self.reset(now)
+            self.get_users()
+        else:
+            self._cohort.clear()
+        deferred = self._crawl([task], follow)
+        self._cohort.resolve()
+        return (list(self._cohort.edges()), deferred)
+
+    def load_users(self, users: list[tuple[str, str, str]], now: DateTime) -> None:
+        """Use these (uuid, name, email) users, fetched at now."""
+        self._users = users
+        self._users_time = now
+        self._known = {x[0] for x in users}
+
+    @property
+    def state(self) -> CrawlState:
+        """Get the crawl state, loading it on first use."""
+        if self._state is None:
+            self._state = CrawlState.load()
+        return self._state
+
+    def _database_title(self, _id: str) -> str:
+        """Get the title of a database, it is kept in the crawl state."""
+        try:
+            return self.state.databases[_id]
+        except KeyError:
+            database = self._notion.databases.retrieve(_id)
+            title = "".join(
+                x["plain_text"] for x in database.get("title", [])  # type: ignore[union-attr]
+            )
+            self.state.databases[_id] = title
+            return title
+
+    def _page_record(self, page: typing.Any) -> PageRecord | None:
+        """Get the record of a page from a search result.
+
+        Each page is pruned on its own: the children of a pruned page are
+        found by the search all the same, and there is no depth to prune
+        by. The entries of pruned databases are ignored, as in a tree crawl,
+        and have no callout. The children are found by the search, so there
+        is no need to discover them from the blocks.
+        """
+        title = page_title(page)
+        if self._pruned("page", page["id"], title):
+            return None
+        owners: tuple[str, ...] = ()
+        threshold = None
+        if page["parent"]["type"] == "database_id":
+            database = page["parent"]["database_id"]
+            if self._pruned("database", database, self._database_title(database)):
+                return None
+        else:
+            scan = self._cached_scan(page["id"], page["last_edited_time"], False)
+            owners, threshold = scan.owners, scan.threshold
+        return PageRecord(
+            title,
+            page["url"],
+            page["created_time"],
+            page["last_edited_time"],
+            owners,
+            (page["created_by"]["id"], page["last_edited_by"]["id"]),
+            threshold,
+        )
+
+    def _resync_due(self) -> bool:
+        """Whether all the pages should be searched, not just the changed ones."""
+        if self.state.watermark is None:
+            return True
+        if not self._resync_days:
+            return False
+        return (
+            self.state.synced is None
+            or parse_time(self.state.synced) + timedelta(days=self._resync_days)
+            <= self._now
+        )
+
+    def _get_changed_pages(self) -> int:
+        """Update the crawl state with the pages edited since the watermark.
+
+        The search is sorted by last edited time, newest first, so it stops
+        at the watermark. Notion's times are to the minute: the pages of the
+        watermark's minute are fetched again. Returns the number of pages.
+
+        The watermark does not move past a page that failed: it is fetched
+        again next time. Every `resync_days`, all the pages are searched,
+        and those that were deleted or unshared are forgotten, as are the
+        pages Notion no longer finds.
+        """
+        full = self._resync_due()
+        watermark = None if full else self.state.watermark
+        newest = watermark
+        failed = None  # The oldest time of the pages that failed.
+        seen: set[str] = set()
+        count = 0
+        for page in iterate_paginated_api(
+            self._notion.search,
+            filter={"property": "object", "value": "page"},
+            sort={"direction": "descending", "timestamp": "last_edited_time"},
+        ):
+            edited = page["last_edited_time"]
+            if watermark is not None and edited < watermark:
+                break
+            if newest is None or edited > newest:
+                newest = edited
+            if not is_full_page(page):
+                continue
+            count += 1
+            seen.add(page["id"])
+            if page.get("archived") or page.get("in_trash"):
+                self.state.pages.pop(page["id"], None)
+                continue
             try:
-                self._get_page_data(_id)
+                record = self._page_record(page)
             except APIResponseError as e:
+                if e.code == APIErrorCode.ObjectNotFound:
+                    rlog.info("Page is gone from Notion", uuid=page["id"])
+                    self.state.pages.pop(page["id"], None)
+                    continue
                 msg = "Failed to get page from Notion."
-                rlog.error(msg, uuid=_id, error=e)
+                rlog.error(msg, uuid=page["id"], error=e)
+                failed = edited  # Newest first.
                 continue
+            if record is None:
+                self.state.pages.pop(page["id"], None)
+            else:
+                self.state.pages[page["id"]] = record
+        if full:
+            gone = self.state.pages.keys() - seen
+            for _id in gone:
+                del self.state.pages[_id]
+            self.state.synced = format_time(self._now)
+            rlog.info("Searched all the pages", forgotten=len(gone))
+        self.state.watermark = newest if failed is None else failed
+        rlog.info(
+            "Got changed pages",
+            count=count,
+            since=watermark,
+            until=self.state.watermark,
+            failed=failed is not None,
+        )
+        return count
+
+    def _add_state_pages(self) -> None:
+        """Add all the pages of the crawl state to the cohort."""
+        for _id, record in self.state.pages.items():
+            self._add_page(
+                Page(
+                    _id,
+                    record.title,
+                    record.url,
+                    parse_time(record.created_time),
+                    parse_time(record.last_edited_time),
+                    self._threashold(record.threshold),
+                ),
+                record.owners,
+                record.authors,
+            )
+
+    def _crawl_changed(self) -> None:
+        """Get the pages with a watermark crawl, and save the state."""
+        self._get_changed_pages()
+        self.state.save()
+        self._add_state_pages()
 
     def get_email_data(
-        self, uuids: tuple[typing.Any, ...]
-    ) -> list[tuple[User, list[Page]]]:
-        """Get data suitable for sending emails."""
+        self,
+        uuids: tuple[typing.Any, ...],
+        now: DateTime | None = None,
+        resume: bool = False,
+    ) -> Iterator[tuple[User, list[Page]]]:
+        """Get data suitable for sending emails, user after user.
+
+        Each call is a new run at now, see `reset`. With `resume`, the run
+        of the checkpoint, if any, is carried on instead.
+        """
         rlog.debug("stuff start")
-        self._get_users()
-        self._get_pages(uuids)
-        self._cohort.print_data()
-        return self._cohort.get_data_for_email()
+        resumed = self._resumable(uuids) if resume else None
+        self.reset(resumed.now if resumed is not None else now)
+        with phase("users"):
+            self._get_users()
+        with phase("crawl"):
+            if self._crawl_mode == "watermark":
+                self._crawl_changed()
+            else:
+                self._get_pages(uuids, resumed)
+        with phase("aggregate"):
+            self._cohort.resolve()
+        with phase("report"):
+            self._cohort.print_data()
+        return self._cohort.iter_data_for_email()
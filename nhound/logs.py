@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+# Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
+"""Asynchronous logging pipeline.
+
+Records are put on a queue by the calling thread and rendered (JSON and
+coloured) then written by a background listener thread.
+"""
+import atexit
+import logging
+import logging.handlers
+import queue
+from collections.abc import Iterable
+
+import structlog
+from structlog.types import EventDict, WrappedLogger
+
+# Logging levels
+# https://www.structlog.org/en/stable/_modules/structlog/_log_levels.html?highlight=log%20level
+LOG_LEVELS = {
+    "critical": 50,
+    "error": 40,
+    "warning": 30,
+    "info": 20,
+    "debug": 10,
+    "notset": 0,
+}
+
+CALLSITE_PARAMETERS = [
+    structlog.processors.CallsiteParameter.FILENAME,
+    structlog.processors.CallsiteParameter.FUNC_NAME,
+    structlog.processors.CallsiteParameter.LINENO,
+]
+
+_listener: logging.handlers.QueueListener | None = None
+_queued: dict[str, list[logging.Handler]] = {}  # The handlers behind the queue.
+
+
+class LevelCallsiteAdder:
+    """Add the callsite parameters for some log levels only.
+
+    Walking the stack is expensive, so this can be switched off for the
+    chatty levels. It must run on the calling thread for structlog
+    events: the listener thread has no idea where the call came from.
+    """
+
+    def __init__(self, levels: Iterable[str]) -> None:
+        """Init."""
+        self.levels = frozenset(levels)
+        self._adder = structlog.processors.CallsiteParameterAdder(
+            CALLSITE_PARAMETERS,
+            additional_ignores=[__name__],
+        )
+
+    def __call__(
+        self, logger: WrappedLogger, method_name: str, event_dict: EventDict
+    ) -> EventDict:
+        """Process the event."""
+        if event_dict.get("level", method_name) in self.levels:
+            return self._adder(logger, method_name, event_dict)
+        return event_dict
+
+
+class StructlogQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that keeps structlog's event dictionary intact.
+
+    The standard handler renders the message to a string before queuing
+    it, which would turn structlog events into foreign records.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Prepare the record for the queue."""
+        if not isinstance(record.msg, dict):
+            # Foreign record: format now, the arguments may change later.
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+def install_queue(
+    names: Iterable[str],
+) -> logging.handlers.QueueListener:
+    """Move the handlers of the named loggers behind a queue.
+
+    All the handlers are served by one listener thread, which is stopped
+    (and thus flushed) at exit or when this is called again.
+    """
+    global _listener
+    stop_queue()
+
+    loggers = [logging.getLogger(name) for name in names]
+    handlers: list[logging.Handler] = []
+    for logger in loggers:
+        for handler in logger.handlers:
+            if handler not in handlers:
+                handlers.append(handler)
+
+    _queued.clear()
+    for name, logger in zip(names, loggers, strict=True):
+        _queued[name] = list(logger.handlers)
+
+    records: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    queue_handler = StructlogQueueHandler(records)
+    for logger in loggers:
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+        logger.addHandler(queue_handler)
+
+    _listener = logging.handlers.QueueListener(
+        records,
+        *handlers,
+        respect_handler_level=True,
+    )
+    _listener.start()
+    return _listener
+
+
+def stop_queue() -> None:
+    """Stop the listener, if any, once the queue is drained."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def unqueue() -> None:
+    """Put the handlers back on their loggers, without the queue.
+
+    For a forked process: it has a copy of the queue but not the listener
+    thread, so nothing would ever be logged.
+    """
+    global _listener
+    _listener = None  # The thread of the parent process.
+    for name, handlers in _queued.items():
+        logger = logging.getLogger(name)
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+        for handler in handlers:
+            logger.addHandler(handler)
+    _queued.clear()
+
+
+atexit.register(stop_queue)
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+# Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
+"""Memory use of each phase of a run, to find what a large workspace costs.
+
+It is off by default: tracing the allocations makes the run slower and
+takes memory of its own. Once enabled, each phase records the resident set
+size (RSS) of the process, the peak of the memory allocated by Python
+(tracemalloc) and the lines of code that allocated the most, from
+snapshots taken at its start and end.
+
+The peaks are those of the process, the phases of workspaces that run at
+the same time overlap.
+"""
+import os
+import threading
+import time
+import tracemalloc
+import typing
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+import structlog
+
+try:
+    import resource
+except ImportError:  # pragma: no cover, Windows.
+    resource = None  # type: ignore[assignment]
+
+rlog = structlog.get_logger("nhound.memory")
+
+try:
+    _PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):  # pragma: no cover
+    _PAGE_SIZE = 4096
+
+_FILTERS = (
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def rss() -> int:
+    """Get the resident set size of the process, in bytes, 0 if unknown."""
+    try:
+        pages = int(Path("/proc/self/statm").read_text().split()[1])
+    except (OSError, IndexError, ValueError):
+        return 0
+    return pages * _PAGE_SIZE
+
+
+def peak_rss() -> int:
+    """Get the peak resident set size of the process, in bytes, 0 if unknown."""
+    if resource is None:  # pragma: no cover
+        return 0
+    # In kibibytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class PhaseMemory(typing.NamedTuple):
+    """The memory use of a phase, in bytes."""
+
+    name: str
+    seconds: float
+    rss: int  # At the end.
+    rss_growth: int
+    peak_rss: int  # Of the process so far.
+    traced_peak: int
+    traced_growth: int
+    top: tuple[str, ...]  # The lines of code that allocated the most.
+
+
+class _Open:
+    """A phase that is not over yet."""
+
+    def __init__(self, name: str, snapshot: tracemalloc.Snapshot | None) -> None:
+        """Init."""
+        self.name = name
+        self.snapshot = snapshot
+        self.start = time.monotonic()
+        self.rss = rss()
+        self.traced = tracemalloc.get_traced_memory()[0]
+        self.peak = self.traced
+
+
+class MemoryProfile:
+    """The memory use of the phases of the runs."""
+
+    def __init__(self) -> None:
+        """Init."""
+        self.enabled = False
+        self.top = 10
+        self.phases: list[PhaseMemory] = []
+        self._open: list[_Open] = []
+        self._lock = threading.Lock()
+
+    def enable(self, top: int = 10, frames: int = 1) -> None:
+        """Start tracing the allocations, with this many frames each."""
+        self.enabled = True
+        self.top = top
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    def disable(self) -> None:
+        """Stop tracing and forget the phases."""
+        self.enabled = False
+        self.phases = []
+        self._open = []
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def _fold_peak(self) -> None:
+        """Give the peak so far to all the open phases, and start again."""
+        peak = tracemalloc.get_traced_memory()[1]
+        for x in self._open:
+            x.peak = max(x.peak, peak)
+        tracemalloc.reset_peak()
+
+    def _snapshot(self) -> tracemalloc.Snapshot | None:
+        if not self.top:
+            return None
+        return tracemalloc.take_snapshot().filter_traces(_FILTERS)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Record the memory use of a phase, if enabled."""
+        if not self.enabled:
+            yield
+            return
+        snapshot = self._snapshot()
+        with self._lock:
+            self._fold_peak()
+            current = _Open(name, snapshot)
+            self._open.append(current)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._fold_peak()
+                self._open.remove(current)
+            self._close(current)
+
+    def _close(self, phase: _Open) -> None:
+        """Record a phase that is over."""
+        top: tuple[str, ...] = ()
+        if phase.snapshot is not None:
+            stats = self._snapshot().compare_to(  # type: ignore[union-attr]
+                phase.snapshot, "lineno"
+            )
+            top = tuple(
+                f"{x.traceback[0].filename}:{x.traceback[0].lineno}"
+                f" {x.size_diff:+d} B in {x.count_diff:+d} blocks"
+                for x in stats[: self.top]
+                if x.size_diff > 0
+            )
+        now = rss()
+        record = PhaseMemory(
+            phase.name,
+            time.monotonic() - phase.start,
+            now,
+            now - phase.rss,
+            peak_rss(),
+            phase.peak,
+            tracemalloc.get_traced_memory()[0] - phase.traced,
+            top,
+        )
+        with self._lock:
+            self.phases.append(record)
+        rlog.info("Phase memory", **record._asdict())
+
+    def summary(self) -> list[PhaseMemory]:
+        """Get the worst of each phase, by traced peak, in order of first use."""
+        worst: dict[str, PhaseMemory] = {}
+        with self._lock:
+            for x in self.phases:
+                if x.name not in worst or x.traced_peak > worst[x.name].traced_peak:
+                    worst[x.name] = x
+        return list(worst.values())
+
+    def log_summary(self) -> None:
+        """Log the summary, then forget the phases, for the next run."""
+        if not self.enabled:
+            return
+        for x in self.summary():
+            rlog.info(
+                "Memory summary",
+                phase=x.name,
+                traced_peak_mib=round(x.traced_peak / 2**20, 1),
+                peak_rss_mib=round(x.peak_rss / 2**20, 1),
+                rss_growth_mib=round(x.rss_growth / 2**20, 1),
+                top=x.top[:3],
+            )
+        with self._lock:
+            self.phases = []
+
+
+# The phases of the process.
+profile = MemoryProfile()
+phase = profile.phase
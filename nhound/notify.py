@@ -0,0 +1,372 @@
+# -*- coding: utf-8 -*-
+# Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
+"""Notifiers: tell each user about their stale pages, on several channels.
+
+Email, Slack and Microsoft Teams (by incoming webhooks) are the channels.
+The fan out sends each user's pages to all the channels at the same time:
+each channel has its own threads, as many as it allows, and the users are
+sent to it in batches if it can take several at once. A failed batch is
+tried again, after a while.
+"""
+import abc
+import contextvars
+import time
+import typing
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+import httpx
+import structlog
+
+from nhound.email import IEMail
+from nhound.user import Page, User
+
+rlog = structlog.get_logger("nhound.notify")
+
+NOTIFIERS = ("email", "slack", "teams")
+
+Batch = list[tuple[User, list[Page]]]
+
+
+class NotifyError(Exception):
+    """A notification failed, it may be tried again.
+
+    Retry after is how long the channel asked to wait, if it did.
+    """
+
+    def __init__(self, message: str, retry_after: float | None = None) -> None:
+        """Init."""
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Notifier(abc.ABC):
+    """A notification channel.
+
+    Concurrency is how many batches it is sent at the same time, and batch
+    how many users at most are in each.
+    """
+
+    name = "notifier"
+
+    def __init__(self, concurrency: int = 1, batch: int = 1) -> None:
+        """Init."""
+        self.concurrency = max(1, concurrency)
+        self.batch = max(1, batch)
+
+    @abc.abstractmethod
+    def send(self, batch: Batch) -> bool:
+        """Notify the users of their pages.
+
+        Returns False if it failed for good, raises `NotifyError` if it
+        may be tried again.
+        """
+
+    def send_each(self, batch: Batch) -> list[bool]:
+        """Notify the users of their pages, tell whether each was.
+
+        By default, the batch is one message: all or none are.
+        """
+        return [self.send(batch)] * len(batch)
+
+
+class EmailNotifier(Notifier):
+    """Email each user: `IEMail` sends one batch at a time.
+
+    The batch is one email over SMTP, more with a mail transport.
+    """
+
+    name = "email"
+
+    def __init__(self, email: IEMail) -> None:
+        """Init."""
+        super().__init__(batch=email.batch)
+        self._email = email
+
+    def send(self, batch: Batch) -> bool:
+        """Send the emails."""
+        return all(self.send_each(batch))
+
+    def send_each(self, batch: Batch) -> list[bool]:
+        """Send the emails, tell whether each was sent.
+
+        Only if none was sent is it tried again: those sent are not sent
+        twice.
+        """
+        sent = self._email.send_many(
+            [
+                ([user.email], {"name": user.name, "pages": pages})
+                for user, pages in batch
+            ]
+        )
+        if not any(sent):
+            msg = f"Failed to email {', '.join(x.email for x, _ in batch)}"
+            raise NotifyError(msg)
+        return sent
+
+
+def _summary(user: User, pages: list[Page], link: Callable[[Page], str]) -> str:
+    """Summarize the pages of a user, in the markup of the channel."""
+    s = "s" if len(pages) > 1 else ""
+    lines = [f"*{user.name}*, {len(pages)} Notion page{s} require your attention:"]
+    lines += [f"• {link(x)}" for x in pages]
+    return "\n".join(lines)
+
+
+class WebhookNotifier(Notifier):
+    """Post to an incoming webhook: several users fit in one message."""
+
+    def __init__(
+        self,
+        url: str,
+        client: httpx.Client | None = None,
+        concurrency: int = 4,
+        batch: int = 10,
+    ) -> None:
+        """Init."""
+        super().__init__(concurrency, batch)
+        self._url = url
+        self._client = client or httpx.Client(timeout=30)
+
+    @abc.abstractmethod
+    def payload(self, batch: Batch) -> dict[str, typing.Any]:
+        """Get the message of the batch."""
+
+    def send(self, batch: Batch) -> bool:
+        """Post the message."""
+        try:
+            response = self._client.post(self._url, json=self.payload(batch))
+        except httpx.HTTPError as e:
+            msg = f"Failed to post to {self.name}: {e}"
+            raise NotifyError(msg) from e
+        if response.status_code == httpx.codes.TOO_MANY_REQUESTS:
+            retry_after = response.headers.get("Retry-After", "")
+            msg = f"Rate limited by {self.name}"
+            raise NotifyError(
+                msg, float(retry_after) if retry_after.isdigit() else None
+            )
+        if response.is_server_error:
+            msg = f"{self.name} failed with {response.status_code}"
+            raise NotifyError(msg)
+        if not response.is_success:
+            rlog.error(
+                "Webhook rejected the message",
+                notifier=self.name,
+                status=response.status_code,
+                body=response.text[:200],
+            )
+            return False
+        return True
+
+
+class SlackNotifier(WebhookNotifier):
+    """Slack, a section per user, Slack allows 50 blocks per message."""
+
+    name = "slack"
+
+    def __init__(self, url: str, **kwargs: typing.Any) -> None:
+        """Init."""
+        super().__init__(url, **kwargs)
+        self.batch = min(self.batch, 50)
+
+    def payload(self, batch: Batch) -> dict[str, typing.Any]:
+        """Get the message of the batch."""
+        sections = [
+            _summary(user, pages, lambda x: f"<{x.url}|{x.title}>")
+            for user, pages in batch
+        ]
+        return {
+            "text": f"{len(batch)} Notion users have stale pages",
+            "blocks": [
+                # A section has at most 3000 characters.
+                {"type": "section", "text": {"type": "mrkdwn", "text": x[:3000]}}
+                for x in sections
+            ],
+        }
+
+
+class TeamsNotifier(WebhookNotifier):
+    """Microsoft Teams, a message card."""
+
+    name = "teams"
+
+    def payload(self, batch: Batch) -> dict[str, typing.Any]:
+        """Get the message of the batch."""
+        sections = [
+            _summary(user, pages, lambda x: f"[{x.title}]({x.url})")
+            for user, pages in batch
+        ]
+        return {
+            "@type": "MessageCard",
+            "@context": "https://schema.org/extensions",
+            "summary": f"{len(batch)} Notion users have stale pages",
+            "sections": [{"text": x.replace("\n", "\n\n")} for x in sections],
+        }
+
+
+class _Pending:
+    """A user being notified, on the channels that are not done yet."""
+
+    def __init__(self, user: User, pages: list[Page], channels: int) -> None:
+        """Init."""
+        self.user = user
+        self.pages = pages
+        self.channels = channels
+        self.delivered = 0
+
+
+class FanOut:
+    """Send each user's pages to all the notifiers, at the same time.
+
+    A batch that fails is tried again up to retries times, waiting longer
+    each time, from backoff seconds, or as long as the channel asked.
+
+    A user counts as notified only if all the channels did it. If one
+    failed, they are notified again on the next run on all of them, those
+    that did it too: reminders are per user, not per channel. Better twice
+    on one channel than never on another.
+    """
+
+    def __init__(
+        self,
+        notifiers: list[Notifier],
+        retries: int = 2,
+        backoff: float = 1.0,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        """Init."""
+        self._notifiers = notifiers
+        self._retries = retries
+        self._backoff = backoff
+        self._sleep = sleep
+
+    def _attempt(self, notifier: Notifier, batch: Batch) -> list[bool]:
+        """Send a batch, trying again if it may work later.
+
+        Tells whether each user of the batch was notified.
+        """
+        for attempt in range(self._retries + 1):
+            try:
+                return notifier.send_each(batch)
+            except NotifyError as e:
+                if attempt == self._retries:
+                    rlog.error(
+                        "Notification failed",
+                        notifier=notifier.name,
+                        users=len(batch),
+                        error=str(e),
+                    )
+                    return [False] * len(batch)
+                delay = e.retry_after or self._backoff * 2**attempt
+                rlog.warning(
+                    "Notification failed, trying again",
+                    notifier=notifier.name,
+                    error=str(e),
+                    delay=delay,
+                )
+                self._sleep(delay)
+        return [False] * len(batch)  # pragma: no cover
+
+    def send(
+        self, data: Iterable[tuple[User, list[Page]]]
+    ) -> Iterator[tuple[User, list[Page], bool]]:
+        """Notify the users, each is yielded once done on all the channels.
+
+        A user is yielded with whether or not all the channels delivered.
+        Only a few batches per channel are queued at a time: the users are
+        read from data as the notifications are sent, and yielded in the
+        thread of the caller.
+        """
+        if not self._notifiers:
+            for user, pages in data:
+                yield user, pages, True
+            return
+        pools = {
+            x: ThreadPoolExecutor(
+                max_workers=x.concurrency, thread_name_prefix=f"nhound-{x.name}"
+            )
+            for x in self._notifiers
+        }
+        batches: dict[Notifier, list[_Pending]] = {x: [] for x in self._notifiers}
+        running: dict[Future[list[bool]], tuple[Notifier, list[_Pending]]] = {}
+        window = 2 * sum(x.concurrency for x in self._notifiers)
+
+        def submit(notifier: Notifier) -> None:
+            batch, batches[notifier] = batches[notifier], []
+            context = contextvars.copy_context()
+            emails = [(x.user, x.pages) for x in batch]
+
+            def attempt() -> list[bool]:
+                return context.run(self._attempt, notifier, emails)
+
+            running[pools[notifier].submit(attempt)] = (notifier, batch)
+
+        def drain(block: bool) -> Iterator[tuple[User, list[Page], bool]]:
+            done, _ = wait(
+                list(running),
+                timeout=None if block else 0,
+                return_when=FIRST_COMPLETED,
+            )
+            for future in done:
+                _, batch = running.pop(future)
+                for pending, sent in zip(batch, future.result(), strict=True):
+                    pending.channels -= 1
+                    pending.delivered += sent
+                    if not pending.channels:
+                        yield (
+                            pending.user,
+                            pending.pages,
+                            pending.delivered == len(self._notifiers),
+                        )
+
+        try:
+            for user, pages in data:
+                pending = _Pending(user, pages, len(self._notifiers))
+                for notifier in self._notifiers:
+                    batches[notifier].append(pending)
+                    if len(batches[notifier]) >= notifier.batch:
+                        submit(notifier)
+                while len(running) >= window:
+                    yield from drain(block=True)
+                if running:
+                    yield from drain(block=False)
+            for notifier in self._notifiers:
+                if batches[notifier]:
+                    submit(notifier)
+            while running:
+                yield from drain(block=True)
+        finally:
+            for pool in pools.values():
+                pool.shutdown(wait=True, cancel_futures=True)
+
+
+def make_notifiers(
+    kinds: Iterable[str],
+    email: IEMail | None = None,
+    slack_url: str | None = None,
+    teams_url: str | None = None,
+    client: httpx.Client | None = None,
+    concurrency: int = 4,
+    batch: int = 10,
+) -> list[Notifier]:
+    """Make the notifiers, the webhooks need their URL."""
+    notifiers: list[Notifier] = []
+    for kind in kinds:
+        if kind not in NOTIFIERS:
+            msg = f"Unknown notifier {kind}"
+            rlog.error(msg, kinds=NOTIFIERS)
+            raise ValueError(msg)
+        if kind == "email":
+            if email is None:
+                msg = "The email notifier needs an email sender"
+                raise ValueError(msg)
+            notifiers.append(EmailNotifier(email))
+            continue
+        url = slack_url if kind == "slack" else teams_url
+        if not url:
+            msg = f"The {kind} notifier needs a webhook URL"
+            rlog.error(msg)
+            raise ValueError(msg)
+        cls = SlackNotifier if kind == "slack" else TeamsNotifier
+        notifiers.append(cls(url, client=client, concurrency=concurrency, batch=batch))
+    return notifiers
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+# Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
+"""Query a large database in partitions, at the same time.
+
+A database query is a chain of cursors, one page of 100 rows after the
+other. A database of many rows is split into ranges of creation times,
+each queried with its own chain, in parallel:
+
+1. The first page is queried, oldest first. If it is the only one, that
+   is all.
+2. Otherwise the newest row is queried, and the times from the last row of
+   the first page to it are split in equal ranges.
+3. The ranges are queried at the same time. Rows are known by their ID:
+   those seen twice, at the bounds, are only kept once.
+
+The rows of the ranges are handed over as they come, through a queue of a
+page per range: a range is not queried further until its rows are taken.
+"""
+import queue
+import threading
+import typing
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import structlog
+from notion_client.helpers import iterate_paginated_api
+
+from nhound.times import format_time, parse_time
+
+rlog = structlog.get_logger("nhound.partition")
+
+OLDEST_FIRST = ({"timestamp": "created_time", "direction": "ascending"},)
+NEWEST_FIRST = ({"timestamp": "created_time", "direction": "descending"},)
+
+
+def time_ranges(
+    start: datetime, end: datetime, parts: int
+) -> list[tuple[datetime, datetime | None]]:
+    """Split the times from start to end in ranges, the last is open ended.
+
+    Notion's times are to the minute, so are the bounds: there may be fewer
+    ranges than parts.
+    """
+    step = (end - start) / max(1, parts)
+    bounds: list[datetime] = []
+    for x in range(max(1, parts)):
+        bound = (start + step * x).replace(second=0, microsecond=0)
+        if not bounds or bound > bounds[-1]:
+            bounds.append(bound)
+    return list(zip(bounds, [*bounds[1:], None], strict=True))
+
+
+def created_filter(start: datetime, end: datetime | None) -> dict[str, typing.Any]:
+    """Get the filter of the rows created from start to before end."""
+    after = {
+        "timestamp": "created_time",
+        "created_time": {"on_or_after": format_time(start)},
+    }
+    if end is None:
+        return after
+    before = {"timestamp": "created_time", "created_time": {"before": format_time(end)}}
+    return {"and": [after, before]}
+
+
+_DONE = object()  # A range is done.
+
+
+def _put(rows: queue.Queue, item: typing.Any, stop: threading.Event) -> bool:
+    """Put an item on the queue, unless the query is stopped meanwhile."""
+    while not stop.is_set():
+        try:
+            rows.put(item, timeout=0.1)
+        except queue.Full:
+            continue
+        return True
+    return False
+
+
+def _query_range(
+    query: Callable[..., typing.Any],
+    database_id: str,
+    bounds: tuple[datetime, datetime | None],
+    rows: queue.Queue,
+    stop: threading.Event,
+) -> None:
+    """Query the rows of a range, onto the queue, then tell it is done.
+
+    An error is put on the queue instead.
+    """
+    try:
+        for row in iterate_paginated_api(
+            query,
+            database_id=database_id,
+            filter=created_filter(*bounds),
+            sorts=list(OLDEST_FIRST),
+        ):
+            if not _put(rows, row, stop):
+                return
+    except Exception as e:  # Raised by the caller.
+        _put(rows, e, stop)
+        return
+    _put(rows, _DONE, stop)
+
+
+def query_database(
+    query: Callable[..., typing.Any], database_id: str, partitions: int = 1
+) -> Iterator[typing.Any]:
+    """Get all the rows of a database, querying up to partitions at a time.
+
+    With one partition, the rows are queried one page after the other.
+    """
+    if partitions <= 1:
+        yield from iterate_paginated_api(query, database_id=database_id)
+        return
+    first = query(database_id=database_id, sorts=list(OLDEST_FIRST))
+    rows = first["results"]
+    yield from rows
+    if not first["has_more"] or not rows:
+        return
+    start = parse_time(rows[-1]["created_time"])
+    newest = query(database_id=database_id, sorts=list(NEWEST_FIRST), page_size=1)
+    end = (
+        parse_time(newest["results"][0]["created_time"]) if newest["results"] else start
+    )
+    ranges = time_ranges(start, end, partitions)
+    rlog.info("Querying database in partitions", uuid=database_id, ranges=len(ranges))
+    # Only the rows created in the minute of a bound may be seen twice.
+    bounds = {x[0] for x in ranges}
+
+    def at_bound(row: typing.Any) -> bool:
+        created = parse_time(row["created_time"])
+        return created.replace(second=0, microsecond=0) in bounds
+
+    seen = {x["id"] for x in rows if at_bound(x)}
+    pending: queue.Queue = queue.Queue(maxsize=len(ranges) * len(rows))
+    stop = threading.Event()
+    with ThreadPoolExecutor(
+        max_workers=len(ranges), thread_name_prefix="nhound-partition"
+    ) as pool:
+        for x in ranges:
+            pool.submit(_query_range, query, database_id, x, pending, stop)
+        try:
+            done = 0
+            while done < len(ranges):
+                row = pending.get()
+                if row is _DONE:
+                    done += 1
+                elif isinstance(row, Exception):
+                    raise row
+                elif not at_bound(row):
+                    yield row
+                elif row["id"] not in seen:
+                    seen.add(row["id"])
+                    yield row
+        finally:
+            stop.set()
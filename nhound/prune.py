@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+# Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
+"""Crawl pruning rules: the pages and databases that are not crawled.
+
+The rules are in a JSON file:
+
+    {
+        "max_depth": 6,
+        "archived": true,
+        "rules": [
+            {"database": "*meeting*"},
+            {"title": "Archive*"},
+            {"title": "^20[0-9]{2} ", "regex": true},
+            {"id": "9b1d3c40e5a611ed8f2c2cf05d7be51f"}
+        ]
+    }
+
+A rule matches page titles, database titles or IDs, with a glob (case
+insensitive) or a regular expression (searched, case sensitive unless
+scoped, as in `(?i:archive)`). IDs are matched without their dashes.
+Pruned pages and databases are neither reported nor crawled: their
+children are never requested. Pages deeper than `max_depth` below the root
+pages are pruned, and so are archived ones unless `archived` is false.
+"""
+import re
+import typing
+from collections.abc import Iterable
+from fnmatch import translate
+from pathlib import Path
+
+import structlog
+from orjson import JSONDecodeError, loads
+
+rlog = structlog.get_logger("nhound.prune")
+
+PRUNE_FIELDS = ("title", "database", "id")
+
+
+class Rule(typing.NamedTuple):
+    """A pruning rule."""
+
+    field: str  # Either title, database or id.
+    pattern: str
+    regex: bool = False  # Otherwise a glob.
+
+    def __str__(self) -> str:
+        """Str."""
+        return f"{self.field} {'~' if self.regex else '='} {self.pattern}"
+
+    def expression(self) -> str:
+        """Get the regular expression of the rule, for a subject."""
+        if self.regex:
+            # A regular expression is as written, ids are in lower case.
+            return rf"{self.field}\n.*?(?:{self.pattern})"
+        pattern = self.pattern
+        if self.field == "id":
+            pattern = pattern.replace("-", "").lower()
+        return rf"{self.field}\n(?i:{translate(pattern)})"
+
+
+DEFAULT_RULES = (Rule("database", "*meeting*"),)
+
+
+def _subject(field: str, value: str) -> str:
+    """Get what the rules of a field are matched against."""
+    if field == "id":
+        value = value.replace("-", "").lower()
+    return f"{field}\n{value.replace(chr(10), ' ')}"
+
+
+class Pruner:
+    """Pruning rules, compiled into one matcher."""
+
+    def __init__(
+        self,
+        rules: Iterable[Rule] = DEFAULT_RULES,
+        max_depth: int | None = None,
+        archived: bool = True,
+    ) -> None:
+        """Init, prune by the rules, below max_depth and archived pages."""
+        self.rules = tuple(rules)
+        for rule in self.rules:
+            if rule.field not in PRUNE_FIELDS:
+                msg = f"Unknown pruning field {rule.field}"
+                rlog.error(msg, fields=PRUNE_FIELDS)
+                raise ValueError(msg)
+        self.max_depth = max_depth
+        self.archived = archived
+        # All the rules are alternatives of one expression, with a named
+        # group each to know which one matched.
+        self._matcher = (
+            re.compile(
+                "|".join(
+                    f"(?P<_rule{i}>{x.expression()})" for i, x in enumerate(self.rules)
+                ),
+                re.MULTILINE,
+            )
+            if self.rules
+            else None
+        )
+
+    def _rule(self, field: str, value: str) -> Rule | None:
+        if self._matcher is None or not value:
+            return None
+        match = self._matcher.match(_subject(field, value))
+        if match is None:
+            return None
+        for name, group in match.groupdict().items():
+            if group is not None and name.startswith("_rule"):
+                return self.rules[int(name[5:])]
+        return None  # pragma: no cover
+
+    def match(
+        self,
+        kind: str,
+        uuid: str,
+        title: str,
+        depth: int = 0,
+        archived: bool = False,
+    ) -> str | None:
+        """Get why a page or database is pruned, None if it is not."""
+        if archived and self.archived:
+            return "archived"
+        if self.max_depth is not None and depth > self.max_depth:
+            return "max depth"
+        rule = self._rule("title" if kind == "page" else "database", title)
+        if rule is None:
+            rule = self._rule("id", uuid)
+        return None if rule is None else str(rule)
+
+
+def _rule(item: dict[str, typing.Any]) -> Rule:
+    fields = [x for x in PRUNE_FIELDS if x in item]
+    if len(fields) != 1:
+        msg = f"A rule needs one of {', '.join(PRUNE_FIELDS)}"
+        raise ValueError(msg)
+    pattern = item[fields[0]]
+    if not isinstance(pattern, str):
+        msg = f"Invalid pattern {pattern}"
+        raise TypeError(msg)
+    return Rule(fields[0], pattern, bool(item.get("regex", False)))
+
+
+def load_pruner(path: Path) -> Pruner:
+    """Load the pruning rules from a JSON file."""
+    try:
+        data = loads(path.read_bytes())
+        max_depth = data.get("max_depth")
+        pruner = Pruner(
+            [_rule(x) for x in data.get("rules", ())],
+            None if max_depth is None else int(max_depth),
+            bool(data.get("archived", True)),
+        )
+    except (
+        AttributeError,
+        JSONDecodeError,
+        OSError,
+        TypeError,
+        ValueError,
+        re.error,
+    ) as e:
+        msg = f"Invalid pruning rules file {path}: {e}"
+        rlog.error(msg)
+        raise ValueError(msg) from e
+    rlog.info(
+        "Loaded pruning rules",
+        path=str(path),
+        rules=[str(x) for x in pruner.rules],
+        max_depth=pruner.max_depth,
+        archived=pruner.archived,
+    )
+    return pruner
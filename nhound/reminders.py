@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+# Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
+"""Reminders: when each user was last told about each page.
+
+A stale page is emailed about again only once the re-nag interval has
+passed, not on every run. The store is SQLite by default, or Redis (or
+anything that speaks its protocol) to share it between hosts.
+"""
+import abc
+import sqlite3
+import typing
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+import pendulum
+import structlog
+from pendulum.datetime import DateTime
+
+from nhound.dehumanize import Threshold, parse_threshold, subtract
+from nhound.state import state_dir
+from nhound.times import parse_time
+from nhound.user import Page, User
+
+rlog = structlog.get_logger("nhound.reminders")
+
+REMINDER_STORES = ("none", "sqlite", "redis")
+
+
+class ReminderStore(abc.ABC):
+    """A reminder store backend, pages are known by their URL."""
+
+    @abc.abstractmethod
+    def last_notified(self, user: str, pages: Iterable[str]) -> dict[str, DateTime]:
+        """Get when the user was last notified of these pages, if ever."""
+
+    @abc.abstractmethod
+    def record(self, user: str, pages: Iterable[str], when: DateTime) -> None:
+        """Record that the user was notified of these pages."""
+
+
+class SQLiteReminderStore(ReminderStore):
+    """A reminder store in a SQLite database."""
+
+    def __init__(self, path: Path) -> None:
+        """Init."""
+        self.path = path
+        db = self._connect()
+        try:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS reminders ("
+                " user TEXT NOT NULL, page TEXT NOT NULL, notified TEXT NOT NULL,"
+                " PRIMARY KEY (user, page))"
+            )
+        finally:
+            db.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=60)
+
+    def last_notified(self, user: str, pages: Iterable[str]) -> dict[str, DateTime]:
+        """Get when the user was last notified of these pages, if ever."""
+        wanted = set(pages)
+        db = self._connect()
+        try:
+            rows = db.execute(
+                "SELECT page, notified FROM reminders WHERE user = ?", (user,)
+            ).fetchall()
+        finally:
+            db.close()
+        return {
+            page: pendulum.instance(parse_time(notified))
+            for page, notified in rows
+            if page in wanted
+        }
+
+    def record(self, user: str, pages: Iterable[str], when: DateTime) -> None:
+        """Record that the user was notified of these pages."""
+        db = self._connect()
+        try:
+            with db:
+                db.executemany(
+                    "INSERT OR REPLACE INTO reminders (user, page, notified)"
+                    " VALUES (?, ?, ?)",
+                    [(user, page, when.isoformat()) for page in pages],
+                )
+        finally:
+            db.close()
+
+
+class RedisReminderStore(ReminderStore):
+    """A reminder store in Redis, a hash per user.
+
+    This needs the redis package.
+    """
+
+    def __init__(
+        self,
+        url: str = "redis://localhost:6379/0",
+        prefix: str = "nhound:reminders",
+        client: typing.Any = None,
+    ) -> None:
+        """Init."""
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                rlog.error("The Redis store needs the redis package: pip install redis")
+                raise
+            client = redis.Redis.from_url(url)
+        self._redis = client
+        self._prefix = prefix
+
+    def last_notified(self, user: str, pages: Iterable[str]) -> dict[str, DateTime]:
+        """Get when the user was last notified of these pages, if ever."""
+        pages = list(pages)
+        if not pages:
+            return {}
+        values = self._redis.hmget(f"{self._prefix}:{user}", pages)
+        return {
+            page: pendulum.instance(
+                parse_time(value.decode() if isinstance(value, bytes) else value)
+            )
+            for page, value in zip(pages, values, strict=True)
+            if value is not None
+        }
+
+    def record(self, user: str, pages: Iterable[str], when: DateTime) -> None:
+        """Record that the user was notified of these pages."""
+        mapping = {page: when.isoformat() for page in pages}
+        if mapping:
+            self._redis.hset(f"{self._prefix}:{user}", mapping=mapping)
+
+
+class Reminders:
+    """Only nag about a page again once the re-nag interval has passed."""
+
+    def __init__(self, store: ReminderStore, interval: Threshold) -> None:
+        """Init."""
+        self._store = store
+        self._interval = interval
+
+    def due(
+        self, data: Iterable[tuple[User, list[Page]]], now: DateTime
+    ) -> Iterator[tuple[User, list[Page]]]:
+        """Filter the email data down to the pages that are due a reminder.
+
+        This is lazy, user after user, like the data.
+        """
+        since = subtract(self._interval, now)
+        users = 0
+        skipped = 0
+        for user, pages in data:
+            notified = self._store.last_notified(user.uuid, (x.url for x in pages))
+            due = [x for x in pages if notified.get(x.url, since) <= since]
+            skipped += len(pages) - len(due)
+            if due:
+                users += 1
+                yield (user, due)
+        rlog.info("Filtered reminders", users=users, skipped=skipped)
+
+    def notified(self, user: User, pages: list[Page], now: DateTime) -> None:
+        """Record that the user was notified of these pages."""
+        self._store.record(user.uuid, (x.url for x in pages), now)
+
+
+def make_reminders(
+    kind: str,
+    interval: str = "a week",
+    path: str | Path | None = None,
+    url: str | None = None,
+    prefix: str = "nhound:reminders",
+) -> Reminders | None:
+    """Make the reminders, None for none.
+
+    The SQLite database defaults to `reminders.sqlite` in the state
+    directory.
+    """
+    if kind not in REMINDER_STORES:
+        msg = f"Unknown reminder store {kind}"
+        rlog.error(msg, kinds=REMINDER_STORES)
+        raise ValueError(msg)
+    threshold = parse_threshold(interval)
+    if threshold is None:
+        msg = f"Invalid re-nag interval {interval}"
+        rlog.error(msg)
+        raise ValueError(msg)
+    store: ReminderStore
+    if kind == "sqlite":
+        store = SQLiteReminderStore(
+            Path(path) if path else state_dir() / "reminders.sqlite"
+        )
+    elif kind == "redis":
+        store = RedisReminderStore(url or "redis://localhost:6379/0", prefix)
+    else:
+        return None
+    return Reminders(store, threshold)
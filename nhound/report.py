@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+# Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
+"""Stale and fresh pages report."""
+import csv
+import os
+import sys
+from collections.abc import Iterable
+from typing import IO, Any
+
+import pendulum
+import structlog
+from orjson import dumps
+from pendulum.datetime import DateTime
+from rich.console import Console
+
+from nhound import NOW
+from nhound.user import User
+from nhound.utils import env_flag, wprint
+
+rlog = structlog.get_logger("nhound.report")
+
+REPORT_FORMATS = ("rich", "jsonl", "csv", "none")
+
+FIELDS = (
+    "user_uuid",
+    "user_name",
+    "user_email",
+    "page_uuid",
+    "title",
+    "url",
+    "last_edited_time",
+    "threashold_time",
+    "stale",
+)
+
+
+class Report:
+    """Render the report of all the pages of a cohort, in one pass.
+
+    The rich format is for humans, jsonl and csv are for machines. With
+    `tty_only`, nothing is rendered unless the stream is a terminal.
+    """
+
+    def __init__(
+        self, fmt: str = "rich", stream: IO[str] | None = None, tty_only: bool = False
+    ) -> None:
+        """Init."""
+        if fmt not in REPORT_FORMATS:
+            msg = f"Unknown report format {fmt}"
+            rlog.error(msg, formats=REPORT_FORMATS)
+            raise ValueError(msg)
+        self.fmt = fmt
+        self.tty_only = tty_only
+        self._stream = stream
+
+    @classmethod
+    def from_env(cls) -> "Report":
+        """Create a report from the environment variables."""
+        return cls(
+            os.environ.get("NHOUND_REPORT_FORMAT", "rich").lower() or "rich",
+            tty_only=env_flag("NHOUND_REPORT_TTY_ONLY"),
+        )
+
+    @property
+    def stream(self) -> IO[str]:
+        """Get the output stream, standard output by default."""
+        return self._stream if self._stream is not None else sys.stdout
+
+    @property
+    def enabled(self) -> bool:
+        """Tell whether there is anything to render."""
+        if self.fmt == "none":
+            return False
+        return not self.tty_only or self.stream.isatty()
+
+    def render(self, users: Iterable[User], now: DateTime | None = None) -> int:
+        """Render the report, returns the number of pages reported.
+
+        Ages are relative to now, which defaults to when nhound started.
+        """
+        if not self.enabled:
+            rlog.debug("Report skipped", fmt=self.fmt, tty_only=self.tty_only)
+            return 0
+        if self.fmt == "rich":
+            return self._render_rich(users, NOW if now is None else now)
+        if self.fmt == "jsonl":
+            return self._render_jsonl(users)
+        return self._render_csv(users)
+
+    @staticmethod
+    def _rows(users: Iterable[User]) -> Iterable[dict[str, Any]]:
+        for user in users:
+            for page in user.pages:
+                yield {
+                    "user_uuid": user.uuid,
+                    "user_name": user.name,
+                    "user_email": user.email,
+                    "page_uuid": page.uuid,
+                    "title": page.title,
+                    "url": page.url,
+                    "last_edited_time": page.last_edited_time.isoformat(),
+                    "threashold_time": page.threashold_time.isoformat(),
+                    "stale": page.last_edited_time < page.threashold_time,
+                }
+
+    def _render_rich(self, users: Iterable[User], now: DateTime) -> int:
+        count = 0
+        console = Console(file=self.stream)
+        for user in users:
+            if not user.pages:
+                continue
+            with console:  # Buffer the section of one user, write it at once.
+                console.print(f"{user.uuid} {user.name} → ")
+                for page in user.pages:
+                    count += 1
+                    if page.last_edited_time < page.threashold_time:
+                        # Pendulum only here, for the humans.
+                        edited = pendulum.instance(page.last_edited_time)
+                        wprint(
+                            f"{page.title} is stale, "
+                            "it was editted "
+                            f"{edited.diff_for_humans(now)} now. "
+                            f"<{page.url}>",
+                            level="warning",
+                            console=console,
+                        )
+                    else:
+                        wprint(f"{page.title} is fresh.", level="info", console=console)
+        return count
+
+    def _render_jsonl(self, users: Iterable[User]) -> int:
+        count = 0
+        for row in self._rows(users):
+            self.stream.write(dumps(row).decode() + "\n")
+            count += 1
+        return count
+
+    def _render_csv(self, users: Iterable[User]) -> int:
+        count = 0
+        writer = csv.DictWriter(self.stream, fieldnames=FIELDS)
+        writer.writeheader()
+        for row in self._rows(users):
+            writer.writerow(row)
+            count += 1
+        return count
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+# Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
+"""Sharded crawl: the page trees and databases, crawled by a process pool.
+
+Each root page tree is a shard, and so is each database found in a tree,
+as databases are the bulk of the work. Each worker process has its own
+INotion, made once, and sends back the (user uuid, page) pairs it found.
+The parent dedupes the shards and merges the pages into its cohort.
+"""
+import typing
+from collections.abc import Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+
+import structlog
+
+from nhound import logs, transport
+
+if typing.TYPE_CHECKING:
+    from pendulum.datetime import DateTime
+
+    from nhound.inotion import INotion, Task
+    from nhound.user import Page
+
+rlog = structlog.get_logger("nhound.shard")
+
+_worker: "INotion | None" = None  # The INotion of this worker process.
+_now: "DateTime | None" = None
+
+
+def _init_worker(
+    cls: type["INotion"],
+    args: tuple[str, dict[str, typing.Any]],
+    users: list[tuple[str, str, str]],
+    now: "DateTime",
+) -> None:
+    global _worker, _now
+    # A forked worker has neither the log listener nor the connections.
+    logs.unqueue()
+    transport.forget_transports()
+    token, options = args
+    _worker = cls(token, **options)
+    _worker.load_users(users, now)
+    _now = now
+
+
+def _run_task(task: "Task") -> tuple[list[tuple[str, "Page"]], list["Task"]]:
+    worker = typing.cast("INotion", _worker)
+    return worker.crawl_shard(task, typing.cast("DateTime", _now))
+
+
+def crawl_sharded(
+    cls: type["INotion"],
+    args: tuple[str, dict[str, typing.Any]],
+    users: list[tuple[str, str, str]],
+    now: "DateTime",
+    roots: list["Task"],
+    processes: int,
+) -> Iterator[tuple[str, "Page"]]:
+    """Crawl the roots with a pool of processes.
+
+    Yields the (user uuid, page) pairs, shard after shard. A failed shard
+    is logged and skipped, like a failed page in a local crawl.
+    """
+    seen: set[str] = set()
+    with ProcessPoolExecutor(
+        max_workers=processes,
+        initializer=_init_worker,
+        initargs=(cls, args, users, now),
+    ) as pool:
+        pending: dict[Future[typing.Any], Task] = {}
+
+        def submit(tasks: list["Task"]) -> None:
+            for task in tasks:
+                if task.uuid not in seen:
+                    seen.add(task.uuid)
+                    pending[pool.submit(_run_task, task)] = task
+
+        submit(roots)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                task = pending.pop(future)
+                try:
+                    edges, deferred = future.result()
+                except Exception as e:
+                    rlog.exception("Shard failed", task=task, error=e)
+                    continue
+                rlog.debug("Shard done", task=task, pages=len(edges))
+                submit(deferred)
+                yield from edges
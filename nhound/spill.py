@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+# Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
+"""Out-of-core (user uuid, page) edges, for very large workspaces.
+
+Edges are buffered, then sorted and written to disk in runs. Reading them
+back is an external merge sort: the runs are merged, a line at a time, and
+grouped by user. Memory is bounded by the buffer and one user's pages.
+"""
+import heapq
+import shutil
+import tempfile
+import weakref
+from collections.abc import Iterator
+from contextlib import ExitStack
+from itertools import groupby
+from pathlib import Path
+
+import structlog
+
+from nhound.user import Page, dump_page, load_page
+
+rlog = structlog.get_logger("nhound.spill")
+
+FAN_IN = 64  # Most runs merged at once, that is open files.
+
+
+def _user(line: str) -> str:
+    return line.split("\t", 1)[0]
+
+
+class EdgeSpill:
+    """(user uuid, page) edges, spilled to disk in sorted runs.
+
+    The key of an edge need not be a user uuid, any string without a tab
+    nor a newline will do: the pages are grouped by key.
+    """
+
+    def __init__(self, directory: Path | None = None, chunk: int = 100_000) -> None:
+        """Init, the files are in a new temporary directory in `directory`.
+
+        Up to `chunk` edges are kept in memory before they are spilled.
+        """
+        self.path = Path(tempfile.mkdtemp(prefix="nhound-spill-", dir=directory))
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self.path, True)
+        self._chunk = max(1, chunk)
+        self._buffer: list[str] = []
+        self._runs: list[Path] = []
+        self._count = 0  # Run files written, for their names.
+
+    def add(self, user: str, page: Page) -> None:
+        """Add an edge."""
+        # The JSON of the page has no tab nor newline, they are escaped.
+        self._buffer.append(f"{user}\t{dump_page(page)}\n")
+        if len(self._buffer) >= self._chunk:
+            self._flush()
+
+    def _new_run(self) -> Path:
+        self._count += 1
+        return self.path / f"run-{self._count:06}.tsv"
+
+    def _flush(self) -> None:
+        """Write the buffer as a sorted run."""
+        if not self._buffer:
+            return
+        self._buffer.sort()
+        path = self._new_run()
+        path.write_text("".join(self._buffer))
+        self._buffer = []
+        self._runs.append(path)
+        if len(self._runs) >= FAN_IN:
+            self._compact()
+
+    def _compact(self) -> None:
+        """Merge all the runs into one."""
+        path = self._new_run()
+        with path.open("w") as out:
+            out.writelines(self._merged())
+        for run in self._runs:
+            run.unlink()
+        self._runs = [path]
+        rlog.debug("Compacted spilled edges", path=str(path))
+
+    def _merged(self) -> Iterator[str]:
+        """Merge the runs, without duplicates."""
+        with ExitStack() as stack:
+            files = [stack.enter_context(x.open()) for x in self._runs]
+            for line, _ in groupby(heapq.merge(*files)):
+                yield line
+
+    def groups(self) -> Iterator[tuple[str, list[Page]]]:
+        """Get the pages of each user, user after user.
+
+        This can be done several times.
+        """
+        self._flush()
+        for user, lines in groupby(self._merged(), key=_user):
+            yield (user, [load_page(x.split("\t", 1)[1]) for x in lines])
+
+    def spawn(self) -> "EdgeSpill":
+        """Make another spill in this one's directory, deleted with it."""
+        return EdgeSpill(self.path, self._chunk)
+
+    def clear(self) -> None:
+        """Drop all the edges, keeping the directory."""
+        self._buffer = []
+        for run in self._runs:
+            run.unlink()
+        self._runs = []
+
+    def close(self) -> None:
+        """Delete the files."""
+        self._buffer = []
+        self._runs = []
+        self._finalizer()
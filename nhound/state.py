@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+# Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
+"""State kept on disk between runs."""
+import os
+import typing
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+import pendulum
+import structlog
+from orjson import OPT_APPEND_NEWLINE, JSONDecodeError, dumps, loads
+
+from nhound.dehumanize import Threshold
+from nhound.times import parse_time
+from nhound.user import Page, dump_page, load_page
+
+if typing.TYPE_CHECKING:
+    from pendulum.datetime import DateTime
+
+rlog = structlog.get_logger("nhound.state")
+
+STATE_VERSION = 1
+
+
+def state_dir() -> Path:
+    """Get the directory where the state is kept, creating it if needed."""
+    path = Path(os.environ.get("NHOUND_STATE_DIR", "") or ".nhound")
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def write_atomically(path: Path, data: bytes) -> None:
+    """Write a file so that it is never seen half written."""
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_bytes(data)
+    tmp.replace(path)
+
+
+class PageRecord(typing.NamedTuple):
+    """What nhound needs to know about a page, as found on Notion."""
+
+    title: str
+    url: str
+    created_time: str
+    last_edited_time: str
+    owners: tuple[str, ...]  # User uuids from the callout.
+    authors: tuple[str, ...]  # Creator and last editor uuids.
+    threshold: Threshold | None  # From the callout, if any.
+
+    @classmethod
+    def from_json(cls, row: list[typing.Any]) -> "PageRecord":
+        """Create a record from its JSON array."""
+        title, url, created, edited, owners, authors, threshold = row
+        return cls(
+            title,
+            url,
+            created,
+            edited,
+            tuple(owners),
+            tuple(authors),
+            None if threshold is None else tuple((u, v) for u, v in threshold),
+        )
+
+
+class CrawlState:
+    """The state of the changed-since crawl.
+
+    The watermark is the newest `last_edited_time` seen. The pages are
+    all the pages seen so far, the cohort is rebuilt from them. Synced is
+    when all the pages were last searched, to forget those that are gone.
+    """
+
+    def __init__(self, path: Path) -> None:
+        """Init."""
+        self.path = path
+        self.watermark: str | None = None
+        self.synced: str | None = None
+        self.pages: dict[str, PageRecord] = {}
+        self.databases: dict[str, str] = {}  # Titles.
+
+    @classmethod
+    def load(cls, path: Path | None = None) -> "CrawlState":
+        """Load the state, an empty one if there is none."""
+        if path is None:
+            path = state_dir() / "crawl.json"
+        state = cls(path)
+        try:
+            data = loads(path.read_bytes())
+        except FileNotFoundError:
+            rlog.info("No crawl state, starting afresh", path=str(path))
+            return state
+        except JSONDecodeError as e:
+            rlog.error(
+                "Corrupted crawl state, starting afresh", path=str(path), error=e
+            )
+            return state
+        if data.get("version") != STATE_VERSION:
+            rlog.warning("Old crawl state, starting afresh", path=str(path))
+            return state
+        state.watermark = data["watermark"]
+        state.synced = data.get("synced")
+        state.pages = {k: PageRecord.from_json(v) for k, v in data["pages"].items()}
+        state.databases = data["databases"]
+        rlog.info(
+            "Loaded crawl state",
+            path=str(path),
+            watermark=state.watermark,
+            pages=len(state.pages),
+        )
+        return state
+
+    def save(self) -> None:
+        """Save the state."""
+        write_atomically(
+            self.path,
+            dumps(
+                {
+                    "version": STATE_VERSION,
+                    "watermark": self.watermark,
+                    "synced": self.synced,
+                    "pages": {k: list(v) for k, v in self.pages.items()},
+                    "databases": self.databases,
+                }
+            ),
+        )
+        rlog.debug("Saved crawl state", path=str(self.path), pages=len(self.pages))
+
+
+class UsersCache:
+    """The Notion users, kept between runs.
+
+    The users are the persons, as (uuid, name, email). The others are the
+    uuids of the bots, known not to be users.
+    """
+
+    def __init__(self, path: Path) -> None:
+        """Init."""
+        self.path = path
+        self.time: DateTime | None = None  # When the users were fetched.
+        self.users: list[tuple[str, str, str]] = []
+        self.others: list[str] = []
+
+    @classmethod
+    def load(cls, path: Path | None = None) -> "UsersCache":
+        """Load the cache, an empty one if there is none."""
+        if path is None:
+            path = state_dir() / "users.json"
+        cache = cls(path)
+        try:
+            data = loads(path.read_bytes())
+        except FileNotFoundError:
+            rlog.info("No users cache", path=str(path))
+            return cache
+        except JSONDecodeError as e:
+            rlog.error("Corrupted users cache, ignoring it", path=str(path), error=e)
+            return cache
+        if data.get("version") != STATE_VERSION:
+            rlog.warning("Old users cache, ignoring it", path=str(path))
+            return cache
+        cache.time = pendulum.instance(parse_time(data["time"]))
+        cache.users = [(uuid, name, email) for uuid, name, email in data["users"]]
+        cache.others = data["others"]
+        rlog.info("Loaded users cache", path=str(path), users=len(cache.users))
+        return cache
+
+    def save(self) -> None:
+        """Save the cache."""
+        write_atomically(
+            self.path,
+            dumps(
+                {
+                    "version": STATE_VERSION,
+                    "time": self.time.isoformat() if self.time else None,
+                    "users": self.users,
+                    "others": self.others,
+                }
+            ),
+        )
+        rlog.debug("Saved users cache", path=str(self.path), users=len(self.users))
+
+
+class Checkpoint:
+    """A tree crawl in progress, to resume it if it is cut short.
+
+    The time and the root pages of the run, the frontier of (kind, uuid,
+    depth) tasks, the pages and databases visited and the cohort so far:
+    the (user uuid, page) edges and the pages deferred until their users
+    are looked up.
+
+    The file is JSON lines: the crawl, then one line per edge or deferred
+    page. Those are streamed when saved and when loaded, they need not fit
+    in memory. Loaded, they can be iterated once.
+    """
+
+    def __init__(self, path: Path) -> None:
+        """Init."""
+        self.path = path
+        self.now: DateTime | None = None
+        self.roots: list[str] = []
+        self.frontier: list[tuple[str, str, int]] = []
+        self.visited: list[str] = []
+        self.edges: Iterable[tuple[str, Page]] = ()
+        self.deferred: Iterable[tuple[Page, tuple[str, ...], tuple[str, ...]]] = ()
+
+    @classmethod
+    def load(cls, path: Path | None = None) -> "Checkpoint | None":
+        """Load the checkpoint, None if there is none."""
+        if path is None:
+            path = state_dir() / "checkpoint.json"
+        checkpoint = cls(path)
+        try:
+            with path.open("rb") as f:
+                data = loads(f.readline())
+        except FileNotFoundError:
+            rlog.info("No checkpoint", path=str(path))
+            return None
+        except JSONDecodeError as e:
+            rlog.error("Corrupted checkpoint, ignoring it", path=str(path), error=e)
+            return None
+        if data.get("version") != STATE_VERSION:
+            rlog.warning("Old checkpoint, ignoring it", path=str(path))
+            return None
+        checkpoint.now = pendulum.instance(parse_time(data["now"]))
+        checkpoint.roots = data["roots"]
+        checkpoint.frontier = [(k, uuid, depth) for k, uuid, depth in data["frontier"]]
+        checkpoint.visited = data["visited"]
+        checkpoint.edges = ((u, load_page(p)) for _, u, p in checkpoint._lines("edge"))
+        checkpoint.deferred = (
+            (load_page(p), tuple(o), tuple(a))
+            for _, p, o, a in checkpoint._lines("deferred")
+        )
+        rlog.info(
+            "Loaded checkpoint",
+            path=str(path),
+            now=checkpoint.now,
+            frontier=len(checkpoint.frontier),
+            visited=len(checkpoint.visited),
+        )
+        return checkpoint
+
+    def _lines(self, kind: str) -> Iterator[list[typing.Any]]:
+        """Stream the lines of this kind after the crawl."""
+        with self.path.open("rb") as f:
+            f.readline()
+            for line in f:
+                data = loads(line)
+                if data[0] == kind:
+                    yield data
+
+    def save(self) -> None:
+        """Save the checkpoint, streaming the edges and deferred pages."""
+        tmp = self.path.with_name(f".{self.path.name}.tmp")
+        with tmp.open("wb") as f:
+            f.write(
+                dumps(
+                    {
+                        "version": STATE_VERSION,
+                        "now": self.now.isoformat() if self.now else None,
+                        "roots": self.roots,
+                        "frontier": [list(x) for x in self.frontier],
+                        "visited": self.visited,
+                    },
+                    option=OPT_APPEND_NEWLINE,
+                )
+            )
+            for user, page in self.edges:
+                f.write(
+                    dumps(("edge", user, dump_page(page)), option=OPT_APPEND_NEWLINE)
+                )
+            for page, owners, authors in self.deferred:
+                f.write(
+                    dumps(
+                        ("deferred", dump_page(page), owners, authors),
+                        option=OPT_APPEND_NEWLINE,
+                    )
+                )
+        tmp.replace(self.path)
+        rlog.debug(
+            "Saved checkpoint",
+            path=str(self.path),
+            frontier=len(self.frontier),
+            visited=len(self.visited),
+        )
+
+    def delete(self) -> None:
+        """Delete the checkpoint, the crawl is done."""
+        self.path.unlink(missing_ok=True)
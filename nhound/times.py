@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+# Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
+"""Fast timestamps for the crawl, without pendulum.
+
+Notion's times are ISO 8601, always in one format, to the millisecond and
+in UTC: `2023-05-21T22:00:00.000Z`. They are decoded into aware standard
+datetimes, that compare with pendulum's. Parsing them with pendulum is
+about 20 times slower: pendulum is for the presentation, like the report.
+"""
+from datetime import datetime, timezone
+
+import pendulum
+
+UTC = timezone.utc  # noqa: UP017, datetime.UTC is Python 3.11.
+NOTION_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.000Z"
+
+
+def parse_time(value: str) -> datetime:
+    """Parse a Notion time, or any ISO 8601 time, naive ones are in UTC."""
+    try:
+        if value[-1:] == "Z":
+            # Before Python 3.11, fromisoformat does not know about Z.
+            when = datetime.fromisoformat(f"{value[:-1]}+00:00")
+        else:
+            when = datetime.fromisoformat(value)
+    except ValueError:
+        # Not the usual format, like a bare year: the slow path.
+        parsed = pendulum.parse(value)  # pyright: ignore [reportPrivateImportUsage]
+        if isinstance(parsed, datetime):
+            return plain(parsed)
+        msg = f"Not a time: {value}"  # A date, a time of day or a duration.
+        raise ValueError(msg) from None
+    return when if when.tzinfo is not None else when.replace(tzinfo=UTC)
+
+
+def plain(when: datetime) -> datetime:
+    """Get a standard datetime, in UTC, from a pendulum one."""
+    when = when.astimezone(UTC)
+    return datetime(
+        when.year,
+        when.month,
+        when.day,
+        when.hour,
+        when.minute,
+        when.second,
+        when.microsecond,
+        UTC,
+    )
+
+
+def format_time(when: datetime) -> str:
+    """Format a time as Notion does, to the second."""
+    return when.astimezone(UTC).strftime(NOTION_TIME_FORMAT)
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+# Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
+"""HTTP transport for the Notion client.
+
+Connection pool limits, keep-alive and timeouts are configurable. By
+default, one transport (and its connection pool) is shared by all the
+clients of the process with the same settings, so the connections are
+set up once. A rate limit, if any, is per client.
+"""
+import threading
+import time
+import typing
+from collections.abc import Callable
+
+import httpx
+import structlog
+
+from nhound.utils import env_flag, env_float, env_int
+
+rlog = structlog.get_logger("nhound.transport")
+
+_transports: dict[tuple[typing.Any, ...], httpx.HTTPTransport] = {}  # Shared.
+_lock = threading.Lock()
+
+
+class TransportConfig(typing.NamedTuple):
+    """HTTP transport settings, the defaults are those of httpx."""
+
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 5.0
+    connect_timeout: float = 60.0
+    read_timeout: float = 60.0
+    write_timeout: float = 60.0
+    pool_timeout: float = 60.0
+    http2: bool = False  # Needs the h2 package.
+    shared: bool = True
+    rate_limit: float = 0.0  # Requests per second of each client, 0 for none.
+
+    @classmethod
+    def from_env(cls) -> "TransportConfig":
+        """Create a configuration from the environment variables."""
+        default = cls()
+        return cls(
+            max_connections=env_int(
+                "NHOUND_HTTP_MAX_CONNECTIONS", default.max_connections
+            ),
+            max_keepalive_connections=env_int(
+                "NHOUND_HTTP_MAX_KEEPALIVE", default.max_keepalive_connections
+            ),
+            keepalive_expiry=env_float(
+                "NHOUND_HTTP_KEEPALIVE_EXPIRY", default.keepalive_expiry
+            ),
+            connect_timeout=env_float(
+                "NHOUND_HTTP_CONNECT_TIMEOUT", default.connect_timeout
+            ),
+            read_timeout=env_float("NHOUND_HTTP_READ_TIMEOUT", default.read_timeout),
+            write_timeout=env_float("NHOUND_HTTP_WRITE_TIMEOUT", default.write_timeout),
+            pool_timeout=env_float("NHOUND_HTTP_POOL_TIMEOUT", default.pool_timeout),
+            http2=env_flag("NHOUND_HTTP2", default.http2),
+            shared=env_flag("NHOUND_HTTP_SHARED", default.shared),
+            rate_limit=env_float("NHOUND_HTTP_RATE_LIMIT", default.rate_limit),
+        )
+
+    @property
+    def limits(self) -> httpx.Limits:
+        """Get the connection pool limits."""
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    @property
+    def timeout(self) -> httpx.Timeout:
+        """Get the per phase timeouts."""
+        return httpx.Timeout(
+            connect=self.connect_timeout,
+            read=self.read_timeout,
+            write=self.write_timeout,
+            pool=self.pool_timeout,
+        )
+
+
+class RateLimiter:
+    """Space out the requests of a client, to keep to a rate limit.
+
+    Used as an httpx request hook, it is thread safe.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        """Init, the rate is in requests per second."""
+        self._interval = 1.0 / rate
+        self._clock = clock
+        self._sleep = sleep
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self, _: httpx.Request) -> None:
+        """Wait for the turn of this request."""
+        with self._lock:
+            now = self._clock()
+            when = max(now, self._next)
+            self._next = when + self._interval
+        if when > now:
+            self._sleep(when - now)
+
+
+def _new_transport(config: TransportConfig) -> httpx.HTTPTransport:
+    try:
+        return httpx.HTTPTransport(limits=config.limits, http2=config.http2)
+    except ImportError as e:
+        rlog.error("HTTP/2 needs the h2 package: pip install h2", error=e)
+        raise
+
+
+def get_transport(config: TransportConfig) -> httpx.HTTPTransport:
+    """Get a transport, shared across the process if the config says so."""
+    if not config.shared:
+        return _new_transport(config)
+    # Timeouts are set on the client, they do not matter here.
+    key = (
+        config.max_connections,
+        config.max_keepalive_connections,
+        config.keepalive_expiry,
+        config.http2,
+    )
+    with _lock:
+        try:
+            return _transports[key]
+        except KeyError:
+            rlog.debug("New shared HTTP transport", config=config)
+            _transports[key] = _new_transport(config)
+            return _transports[key]
+
+
+def forget_transports() -> None:
+    """Forget the shared transports, without closing them.
+
+    For a forked process: the connections belong to the parent process.
+    """
+    global _lock
+    _transports.clear()
+    _lock = threading.Lock()
+
+
+def make_http_client(config: TransportConfig) -> httpx.Client:
+    """Make an HTTP client with this transport configuration.
+
+    The rate limit is the client's own.
+    """
+    hooks: dict[str, list[Callable[..., typing.Any]]] = {}
+    if config.rate_limit:
+        hooks["request"] = [RateLimiter(config.rate_limit)]
+    return httpx.Client(
+        transport=get_transport(config), timeout=config.timeout, event_hooks=hooks
+    )
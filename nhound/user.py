@@ -2,8 +2,12 @@
 # Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
 """Simple Notion user model."""
 from collections import namedtuple
+from datetime import datetime
 
 import structlog
+from orjson import dumps, loads
+
+from nhound.times import parse_time
 
 rlog = structlog.get_logger("nhound.user")
 
@@ -20,6 +24,26 @@ Page = namedtuple(
 )
 
 
+def dump_page(page: Page) -> str:
+    """Dump a page to JSON."""
+    return dumps(
+        [x.isoformat() if isinstance(x, datetime) else x for x in page]
+    ).decode()
+
+
+def load_page(data: str) -> Page:
+    """Load a page from JSON."""
+    _id, title, url, created, edited, threshold = loads(data)
+    return Page(
+        _id,
+        title,
+        url,
+        parse_time(created),
+        parse_time(edited),
+        parse_time(threshold),
+    )
+
+
 class User:
     """A Notion user model."""
 
@@ -2,6 +2,7 @@
 # Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
 """Utilities."""
 import enum
+import os
 from typing import TYPE_CHECKING
 
 from rich.console import Console
@@ -65,12 +66,41 @@ def check_if_latest_version() -> VersionCheck:
     return VersionCheck.UNKNOWN
 
 
-def wprint(text: str, level: str = "") -> None:
+def env_flag(name: str, default: bool = False) -> bool:
+    """Read a boolean environment variable.
+
+    Anything but true, yes, on or 1 (in any case) is false.
+    """
+    value = os.environ.get(name, "")
+    if not value:
+        return default
+    return value.strip().lower() in ("true", "yes", "on", "1")
+
+
+def env_int(name: str, default: int) -> int:
+    """Read an integer environment variable, default if unset or invalid."""
+    try:
+        return int(os.environ.get(name, ""))
+    except ValueError:
+        return default
+
+
+def env_float(name: str, default: float) -> float:
+    """Read a float environment variable, default if unset or invalid."""
+    try:
+        return float(os.environ.get(name, ""))
+    except ValueError:
+        return default
+
+
+def wprint(text: str, level: str = "", console: Console | None = None) -> None:
     """Print wrapper.
 
-    If there is no level, we just print it with whatever markup.
+    If there is no level, we just print it with whatever markup. Pass a
+    console to share it across many calls.
     """
-    console = Console()
+    if console is None:
+        console = Console()
     if level == "note":
         console.print(f"   {text}", style=COLOUR_NOTE)
     elif level == "info":
@@ -0,0 +1,541 @@
+# -*- coding: utf-8 -*-
+# Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
+"""Shared work queue, so that several workers can crawl one workspace.
+
+The crawl frontier of a run lives in the queue: pages and databases to
+crawl. A worker leases an item, crawls it, then marks it done with the
+pages it found and the items it discovered. A lease is kept alive with
+heartbeats, an expired lease is put back in the queue. The pages found by
+all the workers are kept in the queue too, the result of the run.
+
+All the workers of a run use the same name and the same time, that of
+the first worker. The name is either given, the same to all the workers,
+or else a worker joins the run in progress, if any, or starts a new one.
+A run is in progress until its result is claimed, and is kept while its
+leases are alive: the runs whose leases have all expired are dropped.
+"""
+import abc
+import os
+import socket
+import sqlite3
+import threading
+import time
+import typing
+import uuid as _uuid
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+import pendulum
+import structlog
+from pendulum.datetime import DateTime
+
+from nhound.state import state_dir
+from nhound.times import parse_time
+from nhound.user import Page, dump_page, load_page
+
+rlog = structlog.get_logger("nhound.workqueue")
+
+QUEUE_KINDS = ("none", "local", "sqlite")
+MAX_ATTEMPTS = 3
+
+
+class Lease(typing.NamedTuple):
+    """An item leased by a worker."""
+
+    run: str
+    kind: str  # Either page or database.
+    uuid: str
+    token: str  # Unique to this lease.
+    depth: int = 0  # Below the root pages.
+
+
+def worker_name() -> str:
+    """Get the name of this worker, unique across hosts."""
+    return os.getenv("NHOUND_QUEUE_WORKER", "") or (
+        f"{socket.gethostname()}-{os.getpid()}"
+    )
+
+
+class WorkQueue(abc.ABC):
+    """A work queue backend."""
+
+    def __init__(self, clock: Callable[[], float] = time.time) -> None:
+        """Init."""
+        self._clock = clock
+
+    @abc.abstractmethod
+    def open_run(
+        self, run: str | None, now: DateTime, seconds: float
+    ) -> tuple[str, DateTime]:
+        """Join a run, creating it if needed. Returns its name and time.
+
+        Without a name, the run in progress is joined, or a new one named.
+        The run is kept alive for some seconds, like a lease, and the runs
+        that are no longer alive are dropped.
+        """
+
+    @abc.abstractmethod
+    def put(self, run: str, items: Iterable[tuple[str, str, int]]) -> int:
+        """Queue (kind, uuid, depth) items, unless queued. Returns the count."""
+
+    @abc.abstractmethod
+    def lease(self, run: str, worker: str, seconds: float) -> Lease | None:
+        """Lease an item for some seconds, None if there is none to lease.
+
+        Expired leases are put back in the queue first.
+        """
+
+    @abc.abstractmethod
+    def heartbeat(self, lease: Lease, seconds: float) -> bool:
+        """Extend a lease, False if it was lost."""
+
+    @abc.abstractmethod
+    def done(
+        self,
+        lease: Lease,
+        edges: Iterable[tuple[str, Page]],
+        items: Iterable[tuple[str, str, int]],
+    ) -> bool:
+        """Mark an item done, with its pages and the items it discovered.
+
+        False if the lease was lost: the result is dropped, as the item was
+        given to another worker.
+        """
+
+    @abc.abstractmethod
+    def fail(self, lease: Lease) -> None:
+        """Put an item back in the queue, or give up after a few attempts."""
+
+    @abc.abstractmethod
+    def unfinished(self, run: str) -> int:
+        """Count the items neither done nor given up."""
+
+    @abc.abstractmethod
+    def finish(self, run: str, worker: str) -> bool:
+        """Claim the result of a run. Only the first worker to ask gets it."""
+
+    @abc.abstractmethod
+    def edges(self, run: str) -> Iterator[tuple[str, Page]]:
+        """Get the (user uuid, page) pairs found in a run."""
+
+
+class LocalWorkQueue(WorkQueue):
+    """A work queue in memory, for the workers of one process."""
+
+    def __init__(self, clock: Callable[[], float] = time.time) -> None:
+        """Init."""
+        super().__init__(clock)
+        self._lock = threading.Lock()
+        self._runs: dict[str, list[typing.Any]] = {}  # Time, claimer, expires.
+        # Run, uuid: kind, state, token, expires, attempts and depth.
+        self._items: dict[tuple[str, str], list[typing.Any]] = {}
+        self._edges: dict[str, set[tuple[str, str]]] = {}
+
+    def open_run(
+        self, run: str | None, now: DateTime, seconds: float
+    ) -> tuple[str, DateTime]:
+        """Join a run, creating it if needed. Returns its name and time."""
+        clock = self._clock()
+        with self._lock:
+            if run is None:
+                run = self._in_progress(clock) or _uuid.uuid4().hex
+            if run not in self._runs:
+                self._runs[run] = [now, None, 0.0]
+                self._edges[run] = set()
+            self._alive(run, clock + seconds)
+            dead = {x for x, (*_, expires) in self._runs.items() if expires < clock}
+            for x in dead:
+                del self._runs[x]
+                del self._edges[x]
+            if dead:
+                rlog.info("Dropped runs", runs=sorted(dead))
+            self._items = {k: v for k, v in self._items.items() if k[0] not in dead}
+            return (run, self._runs[run][0])
+
+    def _in_progress(self, clock: float) -> str | None:
+        """Get the newest run that is alive and not claimed, if any."""
+        for run, (_, claimer, expires) in reversed(self._runs.items()):
+            if claimer is None and expires >= clock:
+                return run
+        return None
+
+    def _alive(self, run: str, expires: float) -> None:
+        """Keep a run alive until then, at least."""
+        self._runs[run][2] = max(self._runs[run][2], expires)
+
+    def put(self, run: str, items: Iterable[tuple[str, str, int]]) -> int:
+        """Queue (kind, uuid, depth) items, unless queued. Returns the count."""
+        count = 0
+        with self._lock:
+            for kind, uuid, depth in items:
+                if (run, uuid) not in self._items:
+                    self._items[(run, uuid)] = [kind, "queued", None, 0.0, 0, depth]
+                    count += 1
+        return count
+
+    def lease(self, run: str, worker: str, seconds: float) -> Lease | None:
+        """Lease an item for some seconds, None if there is none to lease."""
+        now = self._clock()
+        with self._lock:
+            for (_run, uuid), item in self._items.items():
+                if _run != run:
+                    continue
+                if item[1] == "leased" and item[3] < now:
+                    rlog.warning("Lease expired", uuid=uuid)
+                    self._attempt(item)
+                if item[1] == "queued":
+                    item[1:4] = ["leased", _uuid.uuid4().hex, now + seconds]
+                    self._alive(run, now + seconds)
+                    rlog.debug("Leased", uuid=uuid, worker=worker)
+                    return Lease(run, item[0], uuid, item[2], item[5])
+        return None
+
+    @staticmethod
+    def _attempt(item: list[typing.Any]) -> None:
+        item[4] += 1
+        item[1:3] = ["queued" if item[4] < MAX_ATTEMPTS else "failed", None]
+
+    def _held(self, lease: Lease) -> list[typing.Any] | None:
+        item = self._items.get((lease.run, lease.uuid))
+        if item is None or item[1] != "leased" or item[2] != lease.token:
+            return None
+        return item
+
+    def heartbeat(self, lease: Lease, seconds: float) -> bool:
+        """Extend a lease, False if it was lost."""
+        with self._lock:
+            item = self._held(lease)
+            if item is None:
+                return False
+            item[3] = self._clock() + seconds
+            self._alive(lease.run, item[3])
+            return True
+
+    def done(
+        self,
+        lease: Lease,
+        edges: Iterable[tuple[str, Page]],
+        items: Iterable[tuple[str, str, int]],
+    ) -> bool:
+        """Mark an item done, with its pages and the items it discovered."""
+        with self._lock:
+            item = self._held(lease)
+            if item is None:
+                return False
+            item[1:3] = ["done", None]
+            self._edges[lease.run].update((u, dump_page(p)) for u, p in edges)
+        self.put(lease.run, items)
+        return True
+
+    def fail(self, lease: Lease) -> None:
+        """Put an item back in the queue, or give up after a few attempts."""
+        with self._lock:
+            item = self._held(lease)
+            if item is not None:
+                self._attempt(item)
+
+    def unfinished(self, run: str) -> int:
+        """Count the items neither done nor given up."""
+        with self._lock:
+            return sum(
+                1
+                for (_run, _), item in self._items.items()
+                if _run == run and item[1] in ("queued", "leased")
+            )
+
+    def finish(self, run: str, worker: str) -> bool:
+        """Claim the result of a run. Only the first worker to ask gets it."""
+        with self._lock:
+            if self._runs[run][1] is None:
+                self._runs[run][1] = worker
+            claimer: str = self._runs[run][1]
+            return claimer == worker
+
+    def edges(self, run: str) -> Iterator[tuple[str, Page]]:
+        """Get the (user uuid, page) pairs found in a run."""
+        with self._lock:
+            edges = list(self._edges.get(run, ()))
+        for user, page in edges:
+            yield (user, load_page(page))
+
+
+class SQLiteWorkQueue(WorkQueue):
+    """A work queue in a SQLite database, for workers on several hosts.
+
+    The database must be on a volume shared by all the hosts, with working
+    file locks.
+    """
+
+    def __init__(self, path: Path, clock: Callable[[], float] = time.time) -> None:
+        """Init."""
+        super().__init__(clock)
+        self.path = path
+        db = self._connect()
+        try:
+            db.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS runs (
+                    run TEXT PRIMARY KEY,
+                    now TEXT NOT NULL,
+                    claimer TEXT,
+                    expires REAL NOT NULL DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS items (
+                    run TEXT NOT NULL,
+                    uuid TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    state TEXT NOT NULL DEFAULT 'queued',
+                    token TEXT,
+                    expires REAL NOT NULL DEFAULT 0,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    depth INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (run, uuid)
+                );
+                CREATE INDEX IF NOT EXISTS items_state ON items (run, state);
+                CREATE TABLE IF NOT EXISTS edges (
+                    run TEXT NOT NULL,
+                    user TEXT NOT NULL,
+                    page TEXT NOT NULL,
+                    PRIMARY KEY (run, user, page)
+                );
+                """
+            )
+            columns = {x[1] for x in db.execute("PRAGMA table_info(items)")}
+            if "depth" not in columns:  # A queue of an older version.
+                db.execute(
+                    "ALTER TABLE items ADD COLUMN depth INTEGER NOT NULL DEFAULT 0"
+                )
+        finally:
+            db.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Connect, the transactions are explicit."""
+        return sqlite3.connect(self.path, timeout=60, isolation_level=None)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run statements in one transaction, on a connection of their own.
+
+        A connection per transaction is thread safe, for the heartbeats.
+        """
+        db = self._connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+        finally:
+            db.close()
+
+    def open_run(
+        self, run: str | None, now: DateTime, seconds: float
+    ) -> tuple[str, DateTime]:
+        """Join a run, creating it if needed. Returns its name and time."""
+        clock = self._clock()
+        with self._transaction() as db:
+            if run is None:
+                row = db.execute(
+                    "SELECT run FROM runs WHERE claimer IS NULL AND expires >= ?"
+                    " ORDER BY rowid DESC LIMIT 1",
+                    (clock,),
+                ).fetchone()
+                run = row[0] if row is not None else _uuid.uuid4().hex
+            db.execute(
+                "INSERT OR IGNORE INTO runs (run, now) VALUES (?, ?)",
+                (run, now.isoformat()),
+            )
+            self._alive(db, run, clock + seconds)
+            dead = db.execute(
+                "SELECT run FROM runs WHERE expires < ?", (clock,)
+            ).fetchall()
+            db.executemany("DELETE FROM items WHERE run = ?", dead)
+            db.executemany("DELETE FROM edges WHERE run = ?", dead)
+            db.executemany("DELETE FROM runs WHERE run = ?", dead)
+            if dead:
+                rlog.info("Dropped runs", runs=[x[0] for x in dead])
+            row = db.execute("SELECT now FROM runs WHERE run = ?", (run,)).fetchone()
+        return (run, pendulum.instance(parse_time(row[0])))
+
+    @staticmethod
+    def _alive(db: sqlite3.Connection, run: str, expires: float) -> None:
+        """Keep a run alive until then, at least."""
+        db.execute(
+            "UPDATE runs SET expires = MAX(expires, ?) WHERE run = ?", (expires, run)
+        )
+
+    def put(self, run: str, items: Iterable[tuple[str, str, int]]) -> int:
+        """Queue (kind, uuid, depth) items, unless queued. Returns the count."""
+        with self._transaction() as db:
+            return self._put(db, run, items)
+
+    @staticmethod
+    def _put(
+        db: sqlite3.Connection, run: str, items: Iterable[tuple[str, str, int]]
+    ) -> int:
+        return db.executemany(
+            "INSERT OR IGNORE INTO items (run, uuid, kind, depth)"
+            " VALUES (?, ?, ?, ?)",
+            [(run, uuid, kind, depth) for kind, uuid, depth in items],
+        ).rowcount
+
+    def lease(self, run: str, worker: str, seconds: float) -> Lease | None:
+        """Lease an item for some seconds, None if there is none to lease."""
+        now = self._clock()
+        with self._transaction() as db:
+            expired = db.execute(
+                "UPDATE items SET attempts = attempts + 1, token = NULL,"
+                " state = CASE WHEN attempts + 1 < ? THEN 'queued' ELSE 'failed' END"
+                " WHERE run = ? AND state = 'leased' AND expires < ?",
+                (MAX_ATTEMPTS, run, now),
+            ).rowcount
+            if expired:
+                rlog.warning("Leases expired", count=expired)
+            row = db.execute(
+                "SELECT kind, uuid, depth FROM items WHERE run = ?"
+                " AND state = 'queued'"
+                " LIMIT 1",
+                (run,),
+            ).fetchone()
+            if row is None:
+                return None
+            lease = Lease(run, row[0], row[1], _uuid.uuid4().hex, row[2])
+            db.execute(
+                "UPDATE items SET state = 'leased', token = ?, expires = ?"
+                " WHERE run = ? AND uuid = ?",
+                (lease.token, now + seconds, run, lease.uuid),
+            )
+            self._alive(db, run, now + seconds)
+        rlog.debug("Leased", uuid=lease.uuid, worker=worker)
+        return lease
+
+    @staticmethod
+    def _held(db: sqlite3.Connection, lease: Lease) -> bool:
+        return (
+            db.execute(
+                "SELECT 1 FROM items WHERE run = ? AND uuid = ? AND token = ?"
+                " AND state = 'leased'",
+                (lease.run, lease.uuid, lease.token),
+            ).fetchone()
+            is not None
+        )
+
+    def heartbeat(self, lease: Lease, seconds: float) -> bool:
+        """Extend a lease, False if it was lost."""
+        expires = self._clock() + seconds
+        with self._transaction() as db:
+            held = (
+                db.execute(
+                    "UPDATE items SET expires = ? WHERE run = ? AND uuid = ?"
+                    " AND token = ? AND state = 'leased'",
+                    (expires, lease.run, lease.uuid, lease.token),
+                ).rowcount
+                == 1
+            )
+            if held:
+                self._alive(db, lease.run, expires)
+            return held
+
+    def done(
+        self,
+        lease: Lease,
+        edges: Iterable[tuple[str, Page]],
+        items: Iterable[tuple[str, str, int]],
+    ) -> bool:
+        """Mark an item done, with its pages and the items it discovered."""
+        with self._transaction() as db:
+            if not self._held(db, lease):
+                return False
+            db.execute(
+                "UPDATE items SET state = 'done', token = NULL"
+                " WHERE run = ? AND uuid = ?",
+                (lease.run, lease.uuid),
+            )
+            db.executemany(
+                "INSERT OR IGNORE INTO edges (run, user, page) VALUES (?, ?, ?)",
+                [(lease.run, user, dump_page(page)) for user, page in edges],
+            )
+            self._put(db, lease.run, items)
+        return True
+
+    def fail(self, lease: Lease) -> None:
+        """Put an item back in the queue, or give up after a few attempts."""
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE items SET attempts = attempts + 1, token = NULL,"
+                " state = CASE WHEN attempts + 1 < ? THEN 'queued' ELSE 'failed' END"
+                " WHERE run = ? AND uuid = ? AND token = ? AND state = 'leased'",
+                (MAX_ATTEMPTS, lease.run, lease.uuid, lease.token),
+            )
+
+    def unfinished(self, run: str) -> int:
+        """Count the items neither done nor given up."""
+        with self._transaction() as db:
+            (unfinished,) = db.execute(
+                "SELECT COUNT(*) FROM items WHERE run = ?"
+                " AND state IN ('queued', 'leased')",
+                (run,),
+            ).fetchone()
+        return int(unfinished)
+
+    def finish(self, run: str, worker: str) -> bool:
+        """Claim the result of a run. Only the first worker to ask gets it."""
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE runs SET claimer = ? WHERE run = ? AND claimer IS NULL",
+                (worker, run),
+            )
+            row = db.execute(
+                "SELECT claimer FROM runs WHERE run = ?", (run,)
+            ).fetchone()
+        return row is not None and row[0] == worker
+
+    def edges(self, run: str) -> Iterator[tuple[str, Page]]:
+        """Get the (user uuid, page) pairs found in a run."""
+        db = self._connect()
+        try:
+            for user, page in db.execute(
+                "SELECT user, page FROM edges WHERE run = ?", (run,)
+            ):
+                yield (user, load_page(page))
+        finally:
+            db.close()
+
+
+def make_queue(kind: str, path: str | Path | None = None) -> WorkQueue | None:
+    """Make a work queue backend, None for none.
+
+    The SQLite database defaults to `queue.sqlite` in the state directory.
+    """
+    if kind not in QUEUE_KINDS:
+        msg = f"Unknown work queue {kind}"
+        rlog.error(msg, kinds=QUEUE_KINDS)
+        raise ValueError(msg)
+    if kind == "local":
+        return LocalWorkQueue()
+    if kind == "sqlite":
+        return SQLiteWorkQueue(Path(path) if path else state_dir() / "queue.sqlite")
+    return None
+
+
+@contextmanager
+def heartbeat(queue: WorkQueue, lease: Lease, seconds: float) -> Iterator[None]:
+    """Keep a lease alive while the item is worked on."""
+    stop = threading.Event()
+
+    def beat() -> None:
+        while not stop.wait(seconds / 3):
+            if not queue.heartbeat(lease, seconds):
+                rlog.warning("Lease lost", uuid=lease.uuid)
+                return
+
+    thread = threading.Thread(target=beat, name="nhound-heartbeat", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+# Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
+"""Several Notion workspaces, run at the same time from one process.
+
+The workspaces are listed in a JSON file:
+
+    [
+        {
+            "name": "worldr",
+            "token_env": "WORLDR_NOTION_TOKEN",
+            "pages": ["9b1d3c40-e5a6-11ed-8f2c-2cf05d7be51f"],
+            "weeks": 13,
+            "rate_limit": 3
+        }
+    ]
+
+The token is either given as `token` or read from the environment
+variable `token_env`. The staleness `weeks` and the `rate_limit` of the
+HTTP requests are optional.
+"""
+import os
+import typing
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+import structlog
+from orjson import JSONDecodeError, loads
+
+from nhound.state import state_dir
+
+rlog = structlog.get_logger("nhound.workspaces")
+
+
+class Workspace(typing.NamedTuple):
+    """A Notion workspace, with its own integration token."""
+
+    name: str  # Empty for the one workspace of the environment variables.
+    token: str
+    uuids: tuple[str, ...]  # The root pages.
+    weeks: int | None = None
+    rate_limit: float | None = None  # Requests per second.
+
+    def state_path(self, filename: str) -> Path:
+        """Get the path of a state file, each workspace has its own."""
+        if not self.name:
+            return state_dir() / filename
+        path = Path(filename)
+        return state_dir() / f"{path.stem}-{self.name}{path.suffix}"
+
+
+def _workspace(item: dict[str, typing.Any]) -> Workspace:
+    token = item.get("token") or os.getenv(item.get("token_env", ""), "")
+    if not token:
+        msg = f"Workspace {item['name']} has no token"
+        raise ValueError(msg)
+    return Workspace(
+        item["name"],
+        token,
+        tuple(item["pages"]),
+        item.get("weeks"),
+        item.get("rate_limit"),
+    )
+
+
+def load_workspaces(path: Path) -> list[Workspace]:
+    """Load the workspaces from a JSON file."""
+    try:
+        workspaces = [_workspace(x) for x in loads(path.read_bytes())]
+    except (
+        AttributeError,
+        JSONDecodeError,
+        KeyError,
+        OSError,
+        TypeError,
+        ValueError,
+    ) as e:
+        msg = f"Invalid workspaces file {path}: {e}"
+        rlog.error(msg)
+        raise ValueError(msg) from e
+    names = [x.name for x in workspaces]
+    if not all(names) or len(set(names)) != len(names):
+        msg = f"Invalid workspaces file {path}: names must be unique"
+        rlog.error(msg, names=names)
+        raise ValueError(msg)
+    rlog.info("Loaded workspaces", path=str(path), names=names)
+    return workspaces
+
+
+def run_workspaces(jobs: dict[str, Callable[[], bool]]) -> dict[str, bool]:
+    """Run a job per workspace, all at the same time, on threads.
+
+    A failing job is logged, it does not stop the others. Returns the
+    status of each workspace.
+    """
+    status = {}
+    with ThreadPoolExecutor(
+        max_workers=max(1, len(jobs)), thread_name_prefix="nhound-workspace"
+    ) as pool:
+        futures = {pool.submit(_run_job, name, job): name for name, job in jobs.items()}
+        for future in as_completed(futures):
+            status[futures[future]] = future.result()
+    rlog.info("Ran workspaces", status=status)
+    return status
+
+
+def _run_job(name: str, job: Callable[[], bool]) -> bool:
+    with structlog.contextvars.bound_contextvars(workspace=name):
+        try:
+            return job()
+        except Exception as e:
+            rlog.exception("Workspace run failed", error=e)
+            return False
@@ -1,12 +1,35 @@
 # -*- coding: utf-8 -*-
 # Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
-"""Configuration for pytest."""
+"""Configuration for pytest, and the fake Notion workspace the tests share."""
+from contextlib import suppress
+from types import SimpleNamespace
 from typing import Any
 from unittest.mock import MagicMock, patch
 
 import pytest
 from rich.console import Console
 
+from nhound import NOW
+from nhound.inotion import CrawlConfig, INotion
+
+
+def pytest_addoption(parser: pytest.Parser) -> None:
+    """Add --slow, as pytest-skip-slow does when it is installed."""
+    with suppress(ValueError):  # Already added by pytest-skip-slow.
+        parser.addoption("--slow", action="store_true", help="Run the slow tests.")
+
+
+def pytest_collection_modifyitems(
+    config: pytest.Config, items: list[pytest.Item]
+) -> None:
+    """Skip the slow tests, unless with --slow."""
+    if config.getoption("--slow"):
+        return
+    skip = pytest.mark.skip(reason="Slow, run with --slow")
+    for item in items:
+        if "slow" in item.keywords:
+            item.add_marker(skip)
+
 
 @pytest.fixture(autouse=True, scope="package")
 def mock_console() -> Any:
@@ -16,3 +39,90 @@ def mock_console() -> Any:
         console.print = MagicMock()
         mocked.return_value = console
         yield console
+
+
+malenia = "17ceeff0-e5a5-11ed-aa7f-2cf05d7be51f"
+ranni = "5a1d3c40-e5a6-11ed-8f2c-2cf05d7be51f"
+users = [
+    (malenia, "Malenia", "malenia@haligtree.tree"),
+    (ranni, "Ranni", "ranni@caria.manor"),
+]
+
+
+def page(uuid: str, author: str) -> dict[str, Any]:
+    """Get a page, by this author."""
+    return {
+        "object": "page",
+        "id": uuid,
+        "url": f"https://www.notion.so/{uuid}-0123",
+        "created_time": "2023-05-21T22:00:00.000Z",
+        "last_edited_time": "2023-05-21T22:00:00.000Z",
+        "created_by": {"id": author},
+        "last_edited_by": {"id": author},
+    }
+
+
+def child(kind: str, uuid: str, title: str = "") -> dict[str, Any]:
+    """Get a child page or database block."""
+    return {"type": kind, "id": uuid, kind: {"title": title}}
+
+
+pages = {
+    "root-a": page("root-a", malenia),
+    "root-b": page("root-b", ranni),
+    "Haligtree": page("Haligtree", ranni),
+}
+blocks = {
+    "root-a": [
+        child("child_page", "Haligtree"),
+        child("child_database", "bosses", "Bosses"),
+        child("child_database", "meetings", "Meeting notes"),
+    ],
+    "root-b": [child("child_page", "Haligtree")],
+    "Haligtree": [
+        {
+            "type": "callout",
+            "callout": {
+                "rich_text": [{"type": "mention", "mention": {"user": {"id": malenia}}}]
+            },
+        }
+    ],
+}
+databases = {
+    "bosses": [page("Rennala", ranni), page("Radahn", malenia)],
+    "meetings": [page("Roundtable", ranni)],
+}
+
+
+def results(items: list[dict[str, Any]]) -> dict[str, Any]:
+    """Get the one page of results of a list or query."""
+    return {"results": items, "has_more": False, "next_cursor": None}
+
+
+class FakeINotion(INotion):
+    """Serve the Notion workspace above, in every process."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        """Init."""
+        super().__init__(*args, **kwargs)
+        self._notion = SimpleNamespace(
+            pages=SimpleNamespace(retrieve=lambda _id, **_: pages[_id]),
+            blocks=SimpleNamespace(
+                children=SimpleNamespace(
+                    list=lambda block_id, **_: results(blocks[block_id])
+                )
+            ),
+            databases=SimpleNamespace(
+                query=lambda database_id, **_: results(databases[database_id])
+            ),
+        )
+
+
+def crawl(processes: int) -> set[tuple[str, Any]]:
+    """Crawl the fake workspace, get the (user uuid, page) edges."""
+    sut = FakeINotion("secret_", crawl=CrawlConfig(processes=processes))
+    sut.load_users(users, NOW)
+    sut.reset(NOW)
+    sut.get_users()
+    sut._get_pages(("root-a", "root-b"))  # noqa: SLF001
+    return set(sut._cohort.edges())  # noqa: SLF001
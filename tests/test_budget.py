@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
+"""Crawl budget tests."""
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+from conftest import FakeINotion, blocks, child, users
+
+from nhound import NOW
+from nhound.budget import CrawlBudget
+from nhound.inotion import BudgetConfig
+
+
+class Clock:
+    """A clock that only moves when told to."""
+
+    def __init__(self) -> None:
+        """Init."""
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        """Get the time."""
+        return self.now
+
+
+def test_budget_calls() -> None:
+    sut = CrawlBudget(calls=2)
+    sut()
+    assert sut.exhausted() is None
+    sut()
+    assert sut.exhausted() == "calls"
+    assert sut.spent == 2
+
+
+def test_budget_deadline() -> None:
+    clock = Clock()
+    sut = CrawlBudget(seconds=60, clock=clock)
+    clock.now += 59
+    assert sut.exhausted() is None
+    clock.now += 1
+    assert sut.exhausted() == "deadline"
+
+
+def test_budget_unlimited() -> None:
+    sut = CrawlBudget()
+    for _ in range(1000):
+        sut()
+    assert sut.exhausted() is None
+
+
+def crawl(hints: dict[str, str], **kwargs: Any) -> set[str]:
+    sut = FakeINotion("secret_", budget=BudgetConfig(**kwargs))
+    notion = sut._notion
+
+    def spending(call: Any) -> Any:
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            sut._spend(None)
+            return call(*args, **kwargs)
+
+        return wrapper
+
+    notion.pages.retrieve = spending(notion.pages.retrieve)
+    notion.databases.query = spending(notion.databases.query)
+    sut.load_users(users, NOW)
+    sut.reset(NOW)
+    sut.get_users()
+    children = [
+        {**child("child_page", "Haligtree"), "last_edited_time": hints["Haligtree"]},
+        {**child("child_database", "bosses"), "last_edited_time": hints["bosses"]},
+    ]
+    with patch.dict(blocks, {"root-a": children}):
+        sut._get_pages(("root-a",))
+    return {p.title for _, p in sut._cohort.edges()}
+
+
+old = "2020-01-01T00:00:00.000Z"
+new = "2099-01-01T00:00:00.000Z"
+
+
+@pytest.mark.parametrize(
+    ("hints", "kwargs", "expected"),
+    [
+        (
+            {"Haligtree": old, "bosses": old},
+            {},
+            {"root-a", "Haligtree", "Rennala", "Radahn"},
+        ),
+        (
+            {"Haligtree": old, "bosses": new},
+            {"max_calls": 2},
+            {"root-a", "Haligtree"},
+        ),
+        (
+            {"Haligtree": new, "bosses": old},
+            {"max_calls": 2},
+            {"root-a", "Rennala", "Radahn"},
+        ),
+        ({"Haligtree": old, "bosses": old}, {"max_calls": 1}, {"root-a"}),
+        ({"Haligtree": old, "bosses": old}, {"deadline": 0}, set()),
+    ],
+)
+def test_budgeted_crawl(hints, kwargs, expected) -> None:
+    assert crawl(hints, **kwargs) == expected
@@ -8,6 +8,7 @@ import pendulum
 import pytest
 
 from nhound.cohort import NOW, Cohort
+from nhound.spill import EdgeSpill
 from nhound.user import Page, User
 
 uuid = "17ceeff0-e5a5-11ed-aa7f-2cf05d7be51f"
@@ -105,3 +106,91 @@ def test_get_data_for_email_has_pages() -> None:
     assert sut.get_data_for_email() == [
         (usr, [page]),
     ]
+
+
+def test_cohort_resolve() -> None:
+    now = pendulum.now("UTC")
+    ranni = User("ranni", "Ranni", "ranni@caria.manor")
+    malenia = User(uuid, name, email)
+    calls = []
+
+    def lookup(uuids: list[str]) -> dict[str, User | None]:
+        calls.append(uuids)
+        return {x: {"ranni": ranni, uuid: malenia}.get(x) for x in uuids}
+
+    def page(title: str, weeks: int) -> Page:
+        edited = now.subtract(weeks=weeks)
+        return Page(title, title, "", edited, edited, now.subtract(weeks=13))
+
+    sut = Cohort(now, lookup)
+    sut.defer(page("Haligtree", 20), ["bot", "ranni"], [uuid])
+    sut.defer(page("Elphael", 30), ["bot"], [uuid, "ranni"])
+    sut.defer(page("Caria", 1), ["guest"], ["guest"])  # Fresh, no lookup.
+    assert sut.add_page(uuid, page("Roundtable", 14))
+    assert sut.resolve() == 4
+    assert calls == [[uuid, "bot", "ranni"]]
+    assert {x.title for x in sut.get_by_uuid("ranni").pages} == {"Haligtree", "Elphael"}
+    assert {x.title for x in malenia.pages} == {"Elphael", "Roundtable"}
+    assert sut.resolve() == 0
+    sut.defer(page("Haligtree", 20), ["ranni"], [])
+    sut.clear()
+    assert not malenia.pages
+    assert sut.resolve() == 0
+    assert sut.size == 2
+
+
+def test_cohort_spill(tmp_path) -> None:
+    now = pendulum.now("UTC")
+    ranni = User("ranni", "Ranni", "ranni@caria.manor")
+    malenia = User(uuid, name, email)
+    old = now.subtract(weeks=20)
+    pages = [
+        Page(x, x, x, old, old, now.subtract(weeks=13)) for x in ("Caria", "Elphael")
+    ]
+    spill = EdgeSpill(tmp_path, chunk=1)
+    sut = Cohort(now, spill=spill)
+    sut.add_user(malenia)
+    sut.add_user(ranni)
+    assert sut.add_page("ranni", pages[0])
+    assert sut.add_page(uuid, pages[1])
+    assert sut.add_page("ranni", pages[0])
+    assert not ranni.pages  # On disk, not in memory.
+    assert [(x.uuid, y) for x, y in sut.iter_data_for_email()] == [
+        (uuid, [pages[1]]),
+        ("ranni", [pages[0]]),
+    ]
+    assert sorted(sut.edges()) == [(uuid, pages[1]), ("ranni", pages[0])]
+    sut.clear()
+    assert list(sut.edges()) == []
+    assert sut.size == 2
+    assert sut.add_page("ranni", pages[0])
+    assert list(sut.edges()) == [("ranni", pages[0])]
+    sut.close()
+    assert not spill.path.exists()
+
+
+def test_cohort_spill_deferred(tmp_path) -> None:
+    now = pendulum.now("UTC")
+    ranni = User("ranni", "Ranni", "ranni@caria.manor")
+    old = now.subtract(weeks=20)
+    pages = [Page(x, x, x, old, old, now.subtract(weeks=13)) for x in ("A", "B")]
+    calls = []
+
+    def lookup(uuids: list[str]) -> dict[str, User | None]:
+        calls.append(uuids)
+        return {x: ranni if x == "ranni" else None for x in uuids}
+
+    sut = Cohort(now, lookup, EdgeSpill(tmp_path, chunk=1))
+    sut.defer(pages[0], ["ranni"], [uuid])
+    sut.defer(pages[1], [], ["ranni"])
+    assert not sut._pending  # On disk, not in memory.
+    assert sorted(x[0].title for x in sut.deferred()) == ["A", "B"]
+    assert sut.resolve() == 2
+    assert len(calls) == 1
+    assert sorted(calls[0]) == sorted(["ranni", uuid])
+    assert sorted((x, y.title) for x, y in sut.edges()) == [
+        ("ranni", "A"),
+        ("ranni", "B"),
+    ]
+    assert list(sut.deferred()) == []
+    sut.close()
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
+"""Daemon mode tests."""
+import pendulum
+import pytest
+
+from nhound.daemon import next_run, run_daemon
+
+_now = pendulum.datetime(2077, 5, 21, 22, 0, tz="UTC")
+
+
+@pytest.mark.parametrize(
+    ("at", "expected"),
+    [
+        ("23:30", pendulum.datetime(2077, 5, 21, 23, 30, tz="UTC")),
+        ("22:00", pendulum.datetime(2077, 5, 22, 22, 0, tz="UTC")),
+        ("06:00", pendulum.datetime(2077, 5, 22, 6, 0, tz="UTC")),
+        ("0:5", pendulum.datetime(2077, 5, 22, 0, 5, tz="UTC")),
+    ],
+)
+def test_next_run(at, expected) -> None:
+    assert next_run(at, _now) == expected
+
+
+@pytest.mark.parametrize("at", ["", "noon", "6", "25:00", "06:00:00"])
+def test_next_run_invalid(at) -> None:
+    with pytest.raises(ValueError, match=f"Invalid daemon time {at}"):
+        next_run(at, _now)
+
+
+def test_run_daemon() -> None:
+    naps: list[float] = []
+    times = []
+
+    def job(now: pendulum.DateTime) -> bool:
+        times.append(now)
+        if len(times) == 1:
+            msg = "Let me solve it"
+            raise RuntimeError(msg)
+        return True
+
+    assert run_daemon(job, "06:00", runs=3, sleep=naps.append) == 3
+    assert len(times) == 3
+    assert all(0 < x <= 24 * 60 * 60 for x in naps)
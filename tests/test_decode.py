@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+# Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
+"""Response decoding tests."""
+from typing import Any
+
+import httpx
+import pytest
+from notion_client import APIResponseError
+from orjson import dumps, loads
+
+from nhound.decode import (
+    NOTION_VERSION,
+    NotionClient,
+    project,
+    project_object,
+    project_properties,
+)
+
+malenia = "17ceeff0-e5a5-11ed-aa7f-2cf05d7be51f"
+
+page = {
+    "object": "page",
+    "id": "page-0",
+    "url": "https://www.notion.so/Haligtree-0123",
+    "created_time": "2023-05-21T22:00:00.000Z",
+    "last_edited_time": "2023-05-21T22:00:00.000Z",
+    "created_by": {"object": "user", "id": malenia},
+    "last_edited_by": {"object": "user", "id": malenia},
+    "archived": False,
+    "parent": {"type": "page_id", "page_id": "root"},
+    "icon": {"type": "emoji", "emoji": "🌳"},
+    "properties": {
+        "title": {"id": "title", "title": [{"plain_text": "Haligtree"}]},
+        "Owner": {"id": "%3DxY", "people": [{"object": "user", "id": malenia}]},
+        "Notes": {"id": "n%40t", "rich_text": [{"plain_text": "Long" * 100}]},
+    },
+}
+block = {
+    "object": "block",
+    "id": "block-0",
+    "type": "callout",
+    "has_children": False,
+    "last_edited_time": "2023-05-21T22:00:00.000Z",
+    "callout": {
+        "icon": {"type": "emoji", "emoji": "🐕"},
+        "color": "gray_background",
+        "rich_text": [
+            {
+                "type": "mention",
+                "mention": {"type": "user", "user": {"object": "user", "id": malenia}},
+                "annotations": {"bold": False},
+                "plain_text": "@Malenia",
+                "href": None,
+            },
+            {
+                "type": "text",
+                "text": {"content": "nhound{a week}", "link": None},
+                "annotations": {"bold": True},
+                "plain_text": "nhound{a week}",
+            },
+        ],
+    },
+}
+
+
+def test_project() -> None:
+    spec = {"a": None, "b": {"c": None}, "d": [{"e": None}]}
+    data = {"a": {"x": 1}, "b": {"c": 2, "y": 3}, "d": [{"e": 4, "z": 5}], "f": 6}
+    assert project(data, spec) == {"a": {"x": 1}, "b": {"c": 2}, "d": [{"e": 4}]}
+    assert project({"b": None, "d": None}, spec) == {"b": None, "d": None}
+
+
+def test_project_object() -> None:
+    sut = project_object(
+        {"object": "list", "results": [page, block], "has_more": True, "type": "x"}
+    )
+    assert sut["has_more"]
+    assert sut["next_cursor"] is None
+    projected_page, projected_block = sut["results"]
+    assert "properties" not in projected_page
+    assert "icon" not in projected_page
+    assert projected_page["created_by"] == {"id": malenia}
+    assert projected_page["parent"] == page["parent"]
+    mention, text = projected_block["callout"]["rich_text"]
+    assert mention == {
+        "type": "mention",
+        "plain_text": "@Malenia",
+        "mention": {"type": "user", "user": {"id": malenia}},
+    }
+    assert text["text"] == {"content": "nhound{a week}"}
+    assert project_object({"object": "comment", "id": "x"}) == {
+        "object": "comment",
+        "id": "x",
+    }
+
+
+@pytest.mark.parametrize(
+    ("properties", "expected"),
+    [
+        ((), None),
+        (None, ["title", "Owner", "Notes"]),
+        (("title",), ["title"]),
+        (("title", "%3DxY"), ["title", "Owner"]),  # By ID.
+        (("Notes", "missing"), ["Notes"]),  # By name.
+    ],
+)
+def test_project_page_properties(properties, expected) -> None:
+    got = project_object(page, properties)
+    if expected is None:
+        assert "properties" not in got
+    else:
+        assert list(got["properties"]) == expected
+    assert project_properties(None, ("title",)) is None
+
+
+def client(
+    status: int, content: bytes, requests: list[httpx.Request] | None = None, **kwargs
+) -> NotionClient:
+    def handler(request: httpx.Request) -> httpx.Response:
+        if requests is not None:
+            requests.append(request)
+        return httpx.Response(status, content=content)
+
+    return NotionClient(
+        client=httpx.Client(transport=httpx.MockTransport(handler)),
+        auth="secret_",
+        **kwargs,
+    )
+
+
+def test_client() -> None:
+    sut = client(200, dumps(page))
+    got: Any = sut.pages.retrieve("page-0")
+    assert got["url"] == page["url"]
+    assert "properties" not in got
+
+
+def test_client_version() -> None:
+    requests: list[httpx.Request] = []
+    client(200, dumps(page), requests).pages.retrieve("page-0")
+    client(200, dumps(page), requests, notion_version="2025-09-03").pages.retrieve("x")
+    assert [x.headers["Notion-Version"] for x in requests] == [
+        NOTION_VERSION,
+        "2025-09-03",
+    ]
+
+
+def test_client_error() -> None:
+    body = {"object": "error", "status": 404, "code": "object_not_found"}
+    sut = client(404, dumps({**body, "message": "Not found"}))
+    with pytest.raises(APIResponseError, match="Not found"):
+        sut.pages.retrieve("page-0")
+
+
+def test_client_properties() -> None:
+    requests: list[httpx.Request] = []
+    sut = client(200, dumps(page), requests, properties=("title",))
+    got: Any = sut.pages.retrieve("page-0", filter_properties=["title"])
+    assert list(got["properties"]) == ["title"]
+    assert requests[0].url.params.get_list("filter_properties") == ["title"]
+
+
+def test_client_database_query() -> None:
+    requests: list[httpx.Request] = []
+    body = {"object": "list", "results": [page], "has_more": False}
+    sut = client(200, dumps(body), requests, properties=("title", "%3DxY"))
+    got: Any = sut.databases.query(
+        database_id="db-0",
+        filter_properties=["title", "%3DxY"],
+        page_size=10,
+        start_cursor="cursor",
+    )
+    assert list(got["results"][0]["properties"]) == ["title", "Owner"]
+    (request,) = requests
+    assert request.method == "POST"
+    assert request.url.path == "/v1/databases/db-0/query"
+    assert request.url.params.get_list("filter_properties") == ["title", "%3DxY"]
+    assert loads(request.content) == {"page_size": 10, "start_cursor": "cursor"}
@@ -2,12 +2,13 @@
 # Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
 """Test suite for reversing humanize strings."""
 # pyright: reportGeneralTypeIssues=false
+import time
 from unittest.mock import patch
 
 import pendulum
 import pytest
 
-from nhound.dehumanize import dehumanize
+from nhound.dehumanize import _parse, dehumanize, parse_threshold
 
 _now = pendulum.parse(  # pyright: ignore [reportPrivateImportUsage]
     "2077-05-21T22:00:00",
@@ -43,3 +44,58 @@ _now = pendulum.parse(  # pyright: ignore [reportPrivateImportUsage]
 @patch("nhound.dehumanize.NOW", _now)
 def test_dehumanize(humanized, expected) -> None:
     assert dehumanize(humanized) == expected
+
+
+@pytest.mark.parametrize(
+    ("text", "expected"),
+    [
+        ("", None),
+        ("something wrong", None),
+        ("3 fortnights", None),
+        ("p", None),
+        ("now", ()),
+        ("a day", (("days", 1),)),
+        ("an year", (("years", 1),)),
+        ("6m", (("months", 6),)),
+        ("6 M", (("months", 6),)),
+        ("2w3d", (("days", 3), ("weeks", 2))),
+        ("1 year 2 months", (("months", 2), ("years", 1))),
+        ("1 year, and 2 months.", (("months", 2), ("years", 1))),
+        ("1 week 1 wk", (("weeks", 2),)),
+        ("P3M", (("months", 3),)),
+        ("P1Y2M3W4D", (("days", 4), ("months", 2), ("weeks", 3), ("years", 1))),
+    ],
+)
+def test_parse_threshold(text, expected) -> None:
+    assert parse_threshold(text) == expected
+
+
+@pytest.mark.parametrize("term", ["1 day ", "1d", "a week "])
+def test_parse_threshold_nearly(term) -> None:
+    """Text that nearly matches is rejected in linear time."""
+    _parse.cache_clear()
+    start = time.perf_counter()
+    assert parse_threshold(term * 10_000 + "1 ?") is None
+    assert time.perf_counter() - start < 1
+    assert parse_threshold(term * 10_000) is not None
+
+
+def test_parse_threshold_cached() -> None:
+    _parse.cache_clear()
+    parse_threshold("1 Year, 2 Months")
+    parse_threshold("1 year 2 months")
+    info = _parse.cache_info()
+    assert info.hits == 1
+    assert info.misses == 1
+
+
+@pytest.mark.parametrize(
+    ("humanized", "expected"),
+    [
+        ("1 year 2 months", _now.subtract(years=1, months=2)),
+        ("6m", _now.subtract(months=6)),
+        ("P2W", _now.subtract(weeks=2)),
+    ],
+)
+def test_dehumanize_now(humanized, expected) -> None:
+    assert dehumanize(humanized, _now) == expected
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+# Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
+"""Bulk email delivery tests."""
+import mailbox
+import sys
+from email import message_from_bytes
+from email.message import EmailMessage
+from pathlib import Path
+
+import pytest
+
+from nhound.delivery import (
+    MaildirTransport,
+    PickupTransport,
+    SendmailTransport,
+    make_mail_transport,
+)
+
+
+def message(receiver: str) -> EmailMessage:
+    msg = EmailMessage()
+    msg["From"] = "nhound@worldr.com"
+    msg["To"] = receiver
+    msg["Subject"] = "1 Notion page requires your attention"
+    msg.set_content("Either update them or archive them!")
+    return msg
+
+
+def sendmail(out: Path, status: int = 0) -> list[str]:
+    """Get a sendmail stand-in, writing each message in a file of the directory."""
+    script = (
+        "import sys, uuid\n"
+        f"open({str(out)!r} + '/' + uuid.uuid4().hex, 'wb')"
+        ".write(sys.stdin.buffer.read())\n"
+        f"sys.exit({status})\n"
+    )
+    return [sys.executable, "-c", script]
+
+
+def test_maildir(tmp_path: Path) -> None:
+    sut = MaildirTransport(tmp_path / "Maildir")
+    sut.deliver(message("malenia@haligtree.com"))
+    assert sut.send([message("rennala@academy.com")]) == [True]
+    got = mailbox.Maildir(tmp_path / "Maildir", create=False)
+    assert sorted(x["To"] for x in got) == [
+        "malenia@haligtree.com",
+        "rennala@academy.com",
+    ]
+    assert len(list((tmp_path / "Maildir" / "new").iterdir())) == 2
+
+
+def test_pickup(tmp_path: Path) -> None:
+    sut = PickupTransport(tmp_path / "pickup")
+    sut.deliver(message("malenia@haligtree.com"))
+    (got,) = (tmp_path / "pickup").iterdir()
+    assert got.suffix == ".eml"
+    assert message_from_bytes(got.read_bytes())["To"] == "malenia@haligtree.com"
+
+
+def test_sendmail(tmp_path: Path) -> None:
+    sut = SendmailTransport(sendmail(tmp_path), 4)
+    assert sut.batch == 4
+    sut.deliver(message("tarnished@lands-between.com"))
+    assert (
+        sut.send([message(f"tarnished{x}@lands-between.com") for x in range(4)])
+        == [True] * 4
+    )
+    got = [message_from_bytes(x.read_bytes()) for x in tmp_path.iterdir()]
+    assert sorted(x["To"] for x in got) == sorted(
+        f"tarnished{x}@lands-between.com" for x in ("", 0, 1, 2, 3)
+    )
+
+
+def test_sendmail_failed(tmp_path: Path) -> None:
+    sut = SendmailTransport(sendmail(tmp_path, 75))
+    with pytest.raises(OSError, match="sendmail failed"):
+        sut.deliver(message("malenia@haligtree.com"))
+    ok = SendmailTransport(sendmail(tmp_path))
+    assert ok.send([message("malenia@haligtree.com")]) == [True]
+    missing = SendmailTransport([str(tmp_path / "sendmail")])
+    assert missing.send([message("malenia@haligtree.com")]) == [False]
+
+
+def test_send_failed(tmp_path: Path) -> None:
+    """Each message is told apart."""
+    sut = PickupTransport(tmp_path / "pickup")
+    deliver = sut.deliver
+
+    def full(msg: EmailMessage) -> None:
+        if msg["To"] == "rennala@academy.com":
+            msg = "Disk full"
+            raise OSError(msg)
+        deliver(msg)
+
+    sut.deliver = full  # type: ignore[method-assign]
+    got = sut.send([message("malenia@haligtree.com"), message("rennala@academy.com")])
+    assert got == [True, False]
+    assert len(list((tmp_path / "pickup").iterdir())) == 1
+
+
+@pytest.mark.parametrize(
+    ("kind", "path", "expected"),
+    [
+        ("smtp", None, type(None)),
+        ("maildir", "Maildir", MaildirTransport),
+        ("pickup", "pickup", PickupTransport),
+        ("sendmail", None, SendmailTransport),
+        ("sendmail", "/usr/bin/msmtp -t", SendmailTransport),
+    ],
+)
+def test_make_mail_transport(tmp_path: Path, kind, path, expected) -> None:
+    if path and kind != "sendmail":
+        path = str(tmp_path / path)
+    assert isinstance(make_mail_transport(kind, path), expected)
+
+
+@pytest.mark.parametrize(
+    ("kind", "match"),
+    [
+        ("carrier-pigeon", "Unknown email transport"),
+        ("maildir", "needs a directory"),
+        ("pickup", "needs a directory"),
+    ],
+)
+def test_make_mail_transport_invalid(kind, match) -> None:
+    with pytest.raises(ValueError, match=match):
+        make_mail_transport(kind)
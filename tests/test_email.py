@@ -4,10 +4,12 @@
 
 https://red-mail.readthedocs.io/en/stable/tutorials/testing.html
 """
+import smtplib
 from unittest.mock import Mock
 
 import pendulum
 import pytest
+from redmail import EmailSender  # pyright: ignore [reportPrivateImportUsage]
 
 from nhound.email import IEMail
 from nhound.user import Page
@@ -49,3 +51,68 @@ def test_send_email(sut: IEMail) -> None:
     ret = sut.send(["fu@bar.com"], {"pages": [fake_page, fake_page]})
     assert ret is True
     assert sut._email.send.called
+
+
+def test_send_in_session(sut: IEMail) -> None:
+    sut._email.is_alive = False
+    with sut.session():
+        sut.send(["fu@bar.com"], {"pages": [fake_page]})
+        sut._email.is_alive = True
+        sut.send(["fu@bar.com"], {"pages": [fake_page]})
+    assert sut._email.connect.call_count == 1
+    assert sut._email.send.call_count == 2
+    assert not sut._email.__enter__.called
+    sut._email.close.assert_called_once()
+
+
+def test_send_in_session_reconnect(sut: IEMail) -> None:
+    sut._email.send.side_effect = [smtplib.SMTPServerDisconnected, None]
+    with sut.session():
+        assert sut.send(["fu@bar.com"], {"pages": [fake_page]})
+    assert sut._email.connect.call_count == 1
+    assert sut._email.send.call_count == 2
+
+
+def transport(*failed: str) -> Mock:
+    """Get a transport, failing for these receivers."""
+    sut = Mock(batch=10)
+    sut.send.side_effect = lambda messages: [x["To"] not in failed for x in messages]
+    return sut
+
+
+def test_send_with_transport() -> None:
+    sut = IEMail(
+        EmailSender(host="localhost", port=0), "nhound@worldr.com", transport()
+    )
+    with sut.session():
+        assert sut.send(["fu@bar.com"], {"name": "Fu", "pages": [fake_page]})
+        assert sut.send_many(
+            [
+                (["bar@bar.com"], {"name": "Bar", "pages": [fake_page]}),
+                (["baz@bar.com"], {"name": "Baz", "pages": []}),
+            ]
+        ) == [True, True]
+    assert sut.batch == 10
+    first, second = (x.args[0] for x in sut._transport.send.call_args_list)
+    assert len(first) == len(second) == 1
+    assert first[0]["To"] == "fu@bar.com"
+    assert first[0]["Subject"] == "1 Notion page requires your attention"
+    assert "fake title" in first[0].get_body(("plain",)).get_content()
+    assert second[0]["To"] == "bar@bar.com"
+
+
+def test_send_with_transport_failed() -> None:
+    sut = IEMail(
+        EmailSender(host="localhost", port=0), "nhound@worldr.com", transport("b@b.c")
+    )
+    assert not sut.send(["b@b.c"], {"name": "B", "pages": [fake_page]})
+    emails = [([x], {"name": x, "pages": [fake_page]}) for x in ("a@b.c", "b@b.c")]
+    assert sut.send_many(emails) == [True, False]
+
+
+def test_send_many_smtp(sut: IEMail) -> None:
+    sut._email.send.side_effect = [None, ConnectionRefusedError]
+    sut._email.__exit__.return_value = False
+    emails = [([x], {"pages": [fake_page]}) for x in ("a@b.c", "b@b.c")]
+    assert sut.batch == 1
+    assert sut.send_many(emails) == [True, False]
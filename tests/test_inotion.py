@@ -0,0 +1,455 @@
+# -*- coding: utf-8 -*-
+# Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
+"""Notion interface tests."""
+from typing import Any
+from unittest.mock import MagicMock, patch
+
+import httpx
+import pendulum
+import pytest
+from notion_client import APIErrorCode, APIResponseError
+
+from nhound import NOW
+from nhound.inotion import (
+    BudgetConfig,
+    CrawlConfig,
+    INotion,
+    UsersConfig,
+    child_page,
+    page_title,
+)
+from nhound.prune import Pruner, Rule
+from nhound.state import CrawlState, PageRecord, UsersCache
+from nhound.times import format_time
+from nhound.user import User
+
+malenia = "17ceeff0-e5a5-11ed-aa7f-2cf05d7be51f"
+
+
+def callout(*items: dict[str, Any]) -> dict[str, Any]:
+    return {"type": "callout", "callout": {"rich_text": list(items)}}
+
+
+def mention(uuid: str) -> dict[str, Any]:
+    return {"type": "mention", "mention": {"user": {"id": uuid}}}
+
+
+def text(content: str) -> dict[str, Any]:
+    return {"type": "text", "text": {"content": content}}
+
+
+def child(kind: str, uuid: str, title: str = "") -> dict[str, Any]:
+    return {"type": kind, "id": uuid, kind: {"title": title}}
+
+
+def paginate(blocks: list[dict[str, Any]]) -> Any:
+    """Serve blocks like blocks.children.list, with page_size defaulting to 100."""
+
+    def _list(start_cursor: int | None = None, **kwargs: Any) -> Any:
+        start = start_cursor or 0
+        end = start + kwargs.get("page_size", 100)
+        return {
+            "results": blocks[start:end],
+            "has_more": end < len(blocks),
+            "next_cursor": end if end < len(blocks) else None,
+        }
+
+    return MagicMock(side_effect=_list)
+
+
+def make_sut(**kwargs: Any) -> INotion:
+    with patch("nhound.inotion.NotionClient") as mocked:
+        mocked.return_value = MagicMock()
+        sut = INotion("secret_", 13, **kwargs)
+    sut._cohort.add_user(User(malenia, "Malenia", "malenia@haligtree.tree"))
+    return sut
+
+
+@pytest.fixture()
+def sut() -> INotion:
+    return make_sut()
+
+
+@pytest.mark.parametrize(
+    ("content", "expected"),
+    [
+        ("nhound{1 year 2 months}", NOW.subtract(years=1, months=2)),
+        ("nhound{P3M}", NOW.subtract(months=3)),
+        ("nhound{soon}", NOW.subtract(weeks=13)),  # Default, not now.
+        ("no braces", NOW.subtract(weeks=13)),
+    ],
+)
+def test_parse_callout_block(sut, content, expected) -> None:
+    users, threashold = sut._parse_callout_block(
+        [callout(mention(malenia), text(content))]
+    )
+    assert [x.uuid for x in users] == [malenia]
+    assert threashold == expected
+
+
+def test_unknown_scan_mode() -> None:
+    with pytest.raises(ValueError, match="Unknown scan mode everything"):
+        make_sut(crawl=CrawlConfig(scan="everything"))
+
+
+page_blocks = [
+    callout(mention(malenia), text("nhound{6m}")),
+    *(text(f"paragraph {x}") | {"type": "paragraph"} for x in range(25)),
+    child("child_page", "page-1"),
+    callout(text("nhound{1 day}")),
+    child("child_database", "db-1", "Godrick"),
+]
+
+
+@pytest.mark.parametrize(
+    ("scan", "discover", "calls", "threshold", "children"),
+    [
+        ("full", True, 1, (("days", 1),), ["page-1", "db-1"]),
+        ("full", False, 1, (("days", 1),), ["page-1", "db-1"]),
+        ("callout", True, 1, (("months", 6),), ["page-1", "db-1"]),
+        ("callout", False, 1, (("months", 6),), []),
+        ("head", True, 1, (("months", 6),), ["page-1", "db-1"]),
+        ("head", False, 1, (("months", 6),), []),
+    ],
+)
+def test_scan_page(scan, discover, calls, threshold, children) -> None:
+    sut = make_sut(crawl=CrawlConfig(scan=scan, scan_blocks=10))
+    sut._notion.blocks.children.list = paginate(page_blocks)
+    scan = sut._scan_page("page-0", discover)
+    assert sut._notion.blocks.children.list.call_count == calls
+    assert scan.owners == (malenia,)
+    assert scan.threshold == threshold
+    assert [x.uuid for x in scan.children] == children
+
+
+def test_scan_page_head_discover() -> None:
+    sut = make_sut(crawl=CrawlConfig(scan="head", scan_blocks=10))
+    sut._notion.blocks.children.list = paginate(page_blocks[1:])
+    scan = sut._scan_page("page-0")
+    assert scan.owners == ()
+    assert scan.threshold is None  # The callout is past the head.
+    assert [x.uuid for x in scan.children] == ["page-1", "db-1"]
+
+
+def page_response(uuid: str, edited: str = "2023-05-21T22:00:00.000Z") -> Any:
+    return {
+        "url": "https://www.notion.so/Haligtree-0123",
+        "created_time": "2023-05-21T22:00:00.000Z",
+        "last_edited_time": edited,
+        "created_by": {"id": uuid},
+        "last_edited_by": {"id": uuid},
+    }
+
+
+def test_get_page_data_callout_owners() -> None:
+    sut = make_sut()
+    creator = "creator"
+    sut._cohort.add_user(User(creator, "Godrick", "godrick@stormveil.castle"))
+    sut._notion.pages.retrieve.return_value = page_response(creator)
+    sut._notion.blocks.children.list = paginate([callout(mention(malenia))])
+    sut._get_page_data("page-0")
+    assert [x.title for x in sut._cohort.get_by_uuid(malenia).pages] == ["Haligtree"]
+    assert not sut._cohort.get_by_uuid(creator).pages
+
+
+@pytest.mark.parametrize(
+    ("properties", "expected"),
+    [
+        (None, {}),
+        (("title", "Owner"), {"filter_properties": ["title", "Owner"]}),
+    ],
+)
+def test_filter_properties(properties, expected) -> None:
+    sut = make_sut(crawl=CrawlConfig(properties=properties))
+    sut._notion.pages.retrieve.return_value = page_response(malenia)
+    sut._notion.blocks.children.list = paginate([])
+    sut._notion.databases.query = paginate([])
+    sut._get_page_data("page-0")
+    sut._get_database_data("db-0")
+    sut._notion.pages.retrieve.assert_called_once_with("page-0", **expected)
+    sut._notion.databases.query.assert_called_once_with(
+        database_id="db-0", start_cursor=None, **expected
+    )
+
+
+def test_filter_properties_default(sut) -> None:
+    sut._notion.pages.retrieve.return_value = page_response(malenia)
+    sut._notion.blocks.children.list = paginate([])
+    sut._get_page_data("page-0")
+    sut._notion.pages.retrieve.assert_called_once_with(
+        "page-0", filter_properties=["title"]
+    )
+
+
+def test_warm_runs() -> None:
+    sut = make_sut(users=UsersConfig(ttl=24))
+    sut._notion.users.list.return_value = {
+        "results": [
+            {
+                "type": "person",
+                "id": malenia,
+                "name": "Malenia",
+                "person": {"email": "malenia@haligtree.tree"},
+            },
+            {"type": "bot", "id": "bot"},
+        ]
+    }
+    sut._notion.pages.retrieve.return_value = page_response(malenia)
+    sut._notion.blocks.children.list = paginate([callout(text("nhound{a week}"))])
+    day = NOW.add(days=1)
+
+    (_, pages), *_ = sut.get_email_data(("page-0",), day)
+    assert pages[0].threashold_time == day.subtract(weeks=1)
+
+    sut.reset(day.add(hours=12))  # Users are cached, so is the page scan.
+    sut.get_users()
+    sut._get_pages(("page-0",))
+    page, *_ = sut._cohort.get_by_uuid(malenia).pages
+    assert page.threashold_time == day.add(hours=12).subtract(weeks=1)
+    assert sut._notion.users.list.call_count == 1
+    assert sut._notion.blocks.children.list.call_count == 1
+
+    sut.reset(day.add(days=2))  # Users are expired, the page was edited.
+    sut._notion.pages.retrieve.return_value = page_response(malenia, "2077")
+    sut.get_users()
+    sut._get_pages(("page-0",))
+    assert sut._notion.users.list.call_count == 2
+    assert sut._notion.blocks.children.list.call_count == 2
+
+
+def person(uuid: str, name: str) -> dict[str, Any]:
+    return {
+        "type": "person",
+        "id": uuid,
+        "name": name,
+        "person": {"email": f"{name.lower()}@lands.between"},
+    }
+
+
+def test_users_paginated_and_cached(tmp_path) -> None:
+    people = [person(f"user-{x}", f"Tarnished{x}") for x in range(250)]
+    sut = make_sut(users_cache=UsersCache(tmp_path / "users.json"))
+    sut._notion.users.list = paginate([*people, {"type": "bot", "id": "bot"}])
+    sut.reset(NOW)
+    sut.get_users()
+    assert sut._cohort.size == 250
+    assert sut._notion.users.list.call_count == 3
+
+    again = make_sut(users_cache=UsersCache.load(tmp_path / "users.json"))
+    again._notion.users.list = paginate([])
+    again.reset(NOW.add(hours=1))
+    again.get_users()
+    assert again._cohort.size == 250
+    assert not again._notion.users.list.called
+    assert again._resolve(["bot"]) == []  # A known bot, no refresh.
+    assert not again._notion.users.list.called
+
+
+def test_users_refresh_on_unknown() -> None:
+    sut = make_sut()
+    sut.load_users([(malenia, "Malenia", "malenia@haligtree.tree")], NOW)
+    sut._notion.users.list = paginate([person(malenia, "Malenia")])
+    sut.reset(NOW.add(hours=1))
+    sut.get_users()
+    assert sut._resolve(["ranni"]) == []
+    assert sut._notion.users.list.call_count == 1
+    sut._notion.users.list = paginate([person("ranni", "Ranni")])
+    assert sut._resolve(["ranni"]) == []  # Once per run.
+    sut.reset(NOW.add(hours=2))
+    sut.get_users()
+    assert [x.name for x in sut._resolve(["ranni"])] == ["Ranni"]
+
+
+def test_lazy_users() -> None:
+    sut = make_sut(users=UsersConfig(mode="lazy", lookup_workers=4))
+    people = {malenia: person(malenia, "Malenia"), "bot": {"type": "bot", "id": "bot"}}
+    sut._notion.users.retrieve = MagicMock(side_effect=lambda x: people[x])
+    sut._notion.pages.retrieve.return_value = page_response(malenia)
+    sut._notion.blocks.children.list = paginate([callout(mention("bot"))])
+    sut.reset(NOW)
+    sut.get_users()
+    assert sut._cohort.size == 0
+    sut._get_pages(("page-0", "page-1"))
+    sut._cohort.resolve()
+    assert [x.name for x in sut._resolve([malenia])] == ["Malenia"]
+    assert len(sut._cohort.get_by_uuid(malenia).pages) == 2
+    assert sorted(x.args[0] for x in sut._notion.users.retrieve.call_args_list) == [
+        "17ceeff0-e5a5-11ed-aa7f-2cf05d7be51f",
+        "bot",
+    ]
+    assert sut._lookup_users(["bot", malenia, "bot"])["bot"] is None
+    assert sut._notion.users.retrieve.call_count == 2
+
+
+def search_result(
+    uuid: str, edited: str, parent: Any = None, **kwargs: Any
+) -> dict[str, Any]:
+    return {
+        "object": "page",
+        "id": uuid,
+        "url": f"https://www.notion.so/{uuid}-0123",
+        "created_time": "2023-05-21T22:00:00.000Z",
+        "last_edited_time": edited,
+        "created_by": {"id": malenia},
+        "last_edited_by": {"id": malenia},
+        "parent": parent or {"type": "workspace", "workspace": True},
+        "properties": {},
+        **kwargs,
+    }
+
+
+def test_watermark_crawl(tmp_path) -> None:
+    state = CrawlState(tmp_path / "crawl.json")
+    sut = make_sut(crawl=CrawlConfig(mode="watermark", scan="callout"), state=state)
+    sut._notion.search = paginate(
+        [
+            search_result("new", "2023-06-01T10:00:00.000Z"),
+            search_result(
+                "entry",
+                "2023-05-30T10:00:00.000Z",
+                {"type": "database_id", "database_id": "db"},
+            ),
+            search_result(
+                "meeting",
+                "2023-05-29T10:00:00.000Z",
+                {"type": "database_id", "database_id": "meetings"},
+            ),
+            search_result("gone", "2023-05-28T10:00:00.000Z", archived=True),
+            search_result("same-minute", "2023-05-21T22:00:00.000Z"),
+            search_result("old", "2023-05-01T10:00:00.000Z"),
+        ]
+    )
+    sut._notion.databases.retrieve.side_effect = lambda _id: {
+        "title": [{"plain_text": "Meetings" if _id == "meetings" else "Roundtable"}]
+    }
+    sut._notion.blocks.children.list = paginate(
+        [callout(mention(malenia), text("nhound{1 day}"))]
+    )
+    state.watermark = "2023-05-21T22:00:00.000Z"
+    state.synced = format_time(NOW)
+    state.pages["gone"] = state.pages["old"] = PageRecord(
+        "Old", "url", "2023", "2023-05-01T10:00:00.000Z", (), (malenia,), None
+    )
+
+    assert sut._get_changed_pages() == 5
+    assert state.watermark == "2023-06-01T10:00:00.000Z"
+    assert set(state.pages) == {"new", "entry", "same-minute", "old"}
+    assert state.pages["new"].threshold == (("days", 1),)
+    assert state.pages["entry"].threshold is None
+    assert sut._notion.blocks.children.list.call_count == 2
+    assert sut._notion.databases.retrieve.call_count == 2
+
+    sut._add_state_pages()
+    pages = {x.uuid: x for x in sut._cohort.get_by_uuid(malenia).pages}
+    assert set(pages) == {"new", "entry", "same-minute", "old"}
+    assert pages["new"].threashold_time == NOW.subtract(days=1)
+
+
+def test_watermark_crawl_pruned(tmp_path) -> None:
+    state = CrawlState(tmp_path / "crawl.json")
+    prune = Pruner([Rule("title", "Archive*"), Rule("id", "secret")])
+    sut = make_sut(
+        crawl=CrawlConfig(mode="watermark"),
+        budget=BudgetConfig(prune=prune),
+        state=state,
+    )
+    sut._notion.search = paginate(
+        [
+            search_result("new", "2023-06-01T10:00:00.000Z"),
+            search_result("Archive 2019", "2023-05-31T10:00:00.000Z"),
+            search_result("secret", "2023-05-30T10:00:00.000Z"),
+        ]
+    )
+    sut._notion.blocks.children.list = paginate([])
+    state.watermark = "2023-05-21T22:00:00.000Z"
+    state.synced = format_time(NOW)
+    state.pages["secret"] = PageRecord(
+        "Secret", "url", "2023", "2023-05-01T10:00:00.000Z", (), (malenia,), None
+    )
+
+    assert sut._get_changed_pages() == 3
+    assert set(state.pages) == {"new"}
+    assert sut._notion.blocks.children.list.call_count == 1
+
+
+def api_error(code: APIErrorCode) -> APIResponseError:
+    return APIResponseError(httpx.Response(400), "Boom", code)
+
+
+@pytest.mark.parametrize(
+    ("synced", "full"),
+    [
+        ("2023-05-31T10:00:00.000Z", False),
+        ("2023-05-01T10:00:00.000Z", True),  # A week ago.
+        (None, True),
+    ],
+)
+def test_watermark_crawl_failures(tmp_path, synced, full) -> None:
+    state = CrawlState(tmp_path / "crawl.json")
+    sut = make_sut(crawl=CrawlConfig(mode="watermark"), state=state)
+    sut.reset(pendulum.datetime(2023, 6, 2, 10))
+    sut._notion.search = paginate(
+        [
+            search_result("new", "2023-06-01T10:00:00.000Z"),
+            search_result("unshared", "2023-05-30T10:00:00.000Z"),
+            search_result("failed", "2023-05-29T10:00:00.000Z"),
+        ]
+    )
+    blocks = {
+        "unshared": api_error(APIErrorCode.ObjectNotFound),
+        "failed": api_error(APIErrorCode.InternalServerError),
+    }
+
+    def _list(block_id: str, **_kwargs: Any) -> Any:
+        if block_id in blocks:
+            raise blocks[block_id]
+        return {"results": [], "has_more": False, "next_cursor": None}
+
+    sut._notion.blocks.children.list = MagicMock(side_effect=_list)
+    state.watermark = "2023-05-21T22:00:00.000Z"
+    state.synced = synced
+    state.pages["unshared"] = state.pages["old"] = PageRecord(
+        "Old", "url", "2023", "2023-05-01T10:00:00.000Z", (), (malenia,), None
+    )
+
+    assert sut._get_changed_pages() == 3
+    # The failed page is fetched again next time.
+    assert state.watermark == "2023-05-29T10:00:00.000Z"
+    if full:
+        # The pages that are not found are forgotten.
+        assert set(state.pages) == {"new"}
+        assert state.synced == "2023-06-02T10:00:00.000Z"
+    else:
+        assert set(state.pages) == {"new", "old"}
+        assert state.synced == synced
+
+
+@pytest.mark.parametrize(
+    ("title", "url"),
+    [
+        (
+            "Malenia's notes (2023)",
+            "https://www.notion.so/Malenia-s-notes-2023-0123abcd",
+        ),
+        ("", "https://www.notion.so/0123abcd"),
+        ("🌳", "https://www.notion.so/0123abcd"),
+        ("Élden Ring: 黄金樹", "https://www.notion.so/lden-Ring-0123abcd"),
+    ],
+)
+def test_child_page(title, url) -> None:
+    block = {
+        **child("child_page", "0123-abcd", title),
+        "created_time": "2023-05-21T22:00:00.000Z",
+        "last_edited_time": "2023-05-22T22:00:00.000Z",
+        "created_by": {"id": malenia},
+        "last_edited_by": {"id": "ranni"},
+        "in_trash": True,
+    }
+    page = child_page(block)
+    assert page is not None
+    assert page["url"] == url
+    assert page_title(page) == (title or "0123abcd")
+    assert page["last_edited_by"] == {"id": "ranni"}
+    assert page["archived"]
+    del block["created_by"]
+    assert child_page(block) is None
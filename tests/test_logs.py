@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
+"""Logging pipeline tests."""
+import logging
+import threading
+
+import pytest
+
+from nhound.logs import (
+    LevelCallsiteAdder,
+    StructlogQueueHandler,
+    install_queue,
+    stop_queue,
+)
+
+
+@pytest.mark.parametrize(
+    ("levels", "level", "expected"),
+    [
+        (("debug", "info"), "info", True),
+        (("debug", "info"), "warning", False),
+        (("warning",), "warning", True),
+        ((), "error", False),
+    ],
+)
+def test_level_callsite_adder(levels, level, expected) -> None:
+    sut = LevelCallsiteAdder(levels)
+    event_dict = sut(None, level, {"event": "test", "level": level})
+    assert ("func_name" in event_dict) is expected
+    if expected:
+        assert event_dict["func_name"] == "test_level_callsite_adder"
+
+
+def test_queue_handler_keeps_event_dict() -> None:
+    event = {"event": "test", "level": "info"}
+    record = logging.LogRecord("nhound", logging.INFO, "", 0, event, None, None)
+    sut = StructlogQueueHandler(None)  # type: ignore[arg-type]
+    assert sut.prepare(record).msg is event
+
+
+def test_queue_handler_formats_foreign_record() -> None:
+    args = ["Malenia"]
+    record = logging.LogRecord("foreign", logging.INFO, "", 0, "%s", (args,), None)
+    sut = StructlogQueueHandler(None)  # type: ignore[arg-type]
+    prepared = sut.prepare(record)
+    args.append("Miquella")
+    assert prepared.getMessage() == "['Malenia']"
+
+
+class _ThreadHandler(logging.Handler):
+    def __init__(self) -> None:
+        super().__init__()
+        self.threads: list[str] = []
+
+    def emit(self, _: logging.LogRecord) -> None:
+        self.threads.append(threading.current_thread().name)
+
+
+def test_install_queue() -> None:
+    handler = _ThreadHandler()
+    logger = logging.getLogger("nhound.test_logs")
+    logger.addHandler(handler)
+    install_queue(["nhound.test_logs"])
+    assert handler not in logger.handlers
+    logger.warning("Let me solve it.")
+    stop_queue()
+    assert handler.threads
+    assert threading.current_thread().name not in handler.threads
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+# Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
+"""Memory instrumentation tests."""
+from collections.abc import Iterator
+from types import SimpleNamespace
+
+import pytest
+from conftest import FakeINotion, child, malenia, page, results, users
+
+from nhound import NOW
+from nhound.memory import MemoryProfile, peak_rss, profile, rss
+
+
+@pytest.fixture()
+def sut() -> Iterator[MemoryProfile]:
+    sut = MemoryProfile()
+    sut.enable(top=5)
+    yield sut
+    sut.disable()
+
+
+def allocate(size: int) -> list[bytes]:
+    return [bytes(1024) for _ in range(size)]
+
+
+def test_phase(sut: MemoryProfile) -> None:
+    with sut.phase("crawl"):
+        kept = allocate(1024)
+    (got,) = sut.phases
+    assert got.name == "crawl"
+    assert got.traced_peak >= 2**20
+    assert got.traced_growth >= 2**20
+    assert "test_memory.py" in got.top[0]
+    assert got.rss > 0
+    assert got.peak_rss > 0
+    assert kept
+
+
+def test_phase_nested(sut: MemoryProfile) -> None:
+    with sut.phase("outer"):
+        with sut.phase("inner"):
+            allocate(2048)  # Freed at once.
+        with sut.phase("empty"):
+            pass
+    inner, empty, outer = sut.phases
+    assert inner.traced_peak >= 2 * 2**20
+    assert outer.traced_peak >= inner.traced_peak
+    assert empty.traced_peak < 2**20
+    assert inner.traced_growth < 2**20
+
+
+def test_phase_failed(sut: MemoryProfile) -> None:
+    msg = "Boom"
+    with pytest.raises(ValueError, match=msg), sut.phase("send"):
+        raise ValueError(msg)
+    assert [x.name for x in sut.phases] == ["send"]
+
+
+def test_phase_disabled() -> None:
+    sut = MemoryProfile()
+    with sut.phase("crawl"):
+        allocate(16)
+    assert sut.phases == []
+    sut.log_summary()
+
+
+def test_summary(sut: MemoryProfile) -> None:
+    for size in (16, 1024, 64):
+        with sut.phase("crawl"):
+            allocate(size)
+    with sut.phase("send"):
+        pass
+    crawl, send = sut.summary()
+    assert crawl.name == "crawl"
+    assert crawl.traced_peak >= 2**20
+    assert send.name == "send"
+    sut.log_summary()
+    assert sut.phases == []
+
+
+def test_rss() -> None:
+    assert rss() > 0
+    assert peak_rss() > 0
+
+
+def test_run_phases() -> None:
+    sut = FakeINotion("secret_")
+    sut.load_users(users, NOW)
+    profile.enable(top=0)
+    try:
+        list(sut.get_email_data(("root-a", "root-b"), NOW))
+        assert [x.name for x in profile.summary()] == [
+            "users",
+            "crawl",
+            "aggregate",
+            "report",
+        ]
+    finally:
+        profile.disable()
+
+
+class LargeINotion(FakeINotion):
+    """A workspace of one root page, with a large database of entries."""
+
+    def __init__(self, size: int) -> None:
+        """Init."""
+        super().__init__("secret_")
+        entries = [page(f"entry-{x}", users[x % 2][0]) for x in range(size)]
+        self._notion = SimpleNamespace(
+            pages=SimpleNamespace(retrieve=lambda _id, **_: page(_id, malenia)),
+            blocks=SimpleNamespace(
+                children=SimpleNamespace(
+                    list=lambda block_id, **_: results(
+                        [child("child_database", "tasks", "Tasks")]
+                        if block_id == "root"
+                        else []
+                    )
+                )
+            ),
+            databases=SimpleNamespace(query=lambda **_: results(entries)),
+        )
+
+
+@pytest.mark.slow
+def test_memory_benchmark(monkeypatch) -> None:
+    """Benchmark: the memory of each phase of a run of many pages."""
+    monkeypatch.setenv("NHOUND_REPORT_FORMAT", "none")
+    size = 20_000
+    sut = LargeINotion(size)
+    sut.load_users(users, NOW)
+    profile.enable()
+    try:
+        data = list(sut.get_email_data(("root",), NOW))
+        with profile.phase("send"):
+            assert sum(len(pages) for _, pages in data) == size + 1
+        phases = profile.summary()
+        for x in phases:
+            print(  # noqa: T201
+                f"{x.name:10} peak {x.traced_peak / 1024:9.1f} KiB"
+                f" rss {x.rss / 2**20:7.1f} MiB  {x.top[:1]}"
+            )
+    finally:
+        profile.disable()
+    crawl = next(x for x in phases if x.name == "crawl")
+    assert 0 < crawl.traced_peak < size * 1024  # Less than 1 KiB a page.
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+# Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
+"""Notifiers tests, the webhooks are posted to a local HTTP stand-in."""
+import threading
+import time
+from collections.abc import Iterator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from unittest.mock import Mock
+
+import pendulum
+import pytest
+from orjson import loads
+
+from nhound.notify import (
+    EmailNotifier,
+    FanOut,
+    Notifier,
+    NotifyError,
+    SlackNotifier,
+    TeamsNotifier,
+    make_notifiers,
+)
+from nhound.user import Page, User
+
+now = pendulum.now("UTC")
+
+
+def page(x: int) -> Page:
+    return Page(f"page-{x}", f"Page {x}", f"https://notion.so/{x}", now, now, now)
+
+
+users = [
+    (User(f"user-{x}", f"Tarnished {x}", f"tarnished{x}@lands-between.com"), [page(x)])
+    for x in range(7)
+]
+
+
+class Webhook(ThreadingHTTPServer):
+    """An incoming webhook stand-in, answering with the given statuses first."""
+
+    def __init__(self, statuses: list[int]) -> None:
+        """Init."""
+        super().__init__(("127.0.0.1", 0), Handler)
+        self.statuses = statuses
+        self.posted: list[Any] = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        """Get the URL of the webhook."""
+        return f"http://127.0.0.1:{self.server_address[1]}/hook"
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Record the messages."""
+
+    server: Webhook
+
+    def do_POST(self) -> None:
+        """Post a message."""
+        body = loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with self.server.lock:
+            status = self.server.statuses.pop(0) if self.server.statuses else 200
+            if status == 200:
+                self.server.posted.append(body)
+        self.send_response(status)
+        if status == 429:
+            self.send_header("Retry-After", "7")
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args: Any) -> None:
+        """Be quiet."""
+
+
+@pytest.fixture()
+def webhook(request: pytest.FixtureRequest) -> Iterator[Webhook]:
+    server = Webhook(list(getattr(request, "param", [])))
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_slack(webhook: Webhook) -> None:
+    sut = SlackNotifier(webhook.url, batch=3)
+    sleeps: list[float] = []
+    got = list(FanOut([sut], sleep=sleeps.append).send(users))
+    assert len(got) == len(users)
+    assert all(sent for *_, sent in got)
+    assert sorted(len(x["blocks"]) for x in webhook.posted) == [1, 3, 3]
+    texts = [y["text"]["text"] for x in webhook.posted for y in x["blocks"]]
+    assert (
+        "*Tarnished 0*, 1 Notion page require your attention:\n"
+        "• <https://notion.so/0|Page 0>"
+    ) in texts
+    assert any("<https://notion.so/6|Page 6>" in x for x in texts)
+    assert not sleeps
+
+
+def test_teams(webhook: Webhook) -> None:
+    sut = TeamsNotifier(webhook.url, batch=10)
+    assert sut.send(users)
+    (posted,) = webhook.posted
+    assert posted["@type"] == "MessageCard"
+    assert len(posted["sections"]) == len(users)
+    assert "[Page 3](https://notion.so/3)" in posted["sections"][3]["text"]
+
+
+@pytest.mark.parametrize(
+    ("webhook", "sent", "sleeps"),
+    [
+        ([429, 503], True, [7.0, 2.0]),
+        ([503, 503, 503], False, [1.0, 2.0]),
+        ([400], False, []),
+    ],
+    indirect=["webhook"],
+)
+def test_webhook_retries(webhook: Webhook, sent, sleeps) -> None:
+    delays: list[float] = []
+    sut = FanOut([SlackNotifier(webhook.url, batch=10)], sleep=delays.append)
+    got = list(sut.send(users[:2]))
+    assert [x for *_, x in got] == [sent, sent]
+    assert delays == sleeps
+
+
+def test_webhook_unreachable() -> None:
+    sut = SlackNotifier("http://127.0.0.1:1/hook")
+    with pytest.raises(NotifyError, match="Failed to post to slack"):
+        sut.send(users[:1])
+
+
+def test_email() -> None:
+    email = Mock(batch=1)
+    email.send_many.side_effect = [[True], [False]]
+    sut = EmailNotifier(email)
+    assert sut.send(users[:1])
+    email.send_many.assert_called_once_with(
+        [
+            (
+                ["tarnished0@lands-between.com"],
+                {"name": "Tarnished 0", "pages": users[0][1]},
+            )
+        ]
+    )
+    with pytest.raises(NotifyError, match="tarnished1"):
+        sut.send(users[1:2])
+
+
+def test_email_batch() -> None:
+    """Each user of a batch is told apart, those sent are not sent again."""
+    email = Mock(batch=3)
+    email.send_many.side_effect = [[True, False, True], [False, False], [True]]
+    sut = EmailNotifier(email)
+    assert sut.batch == 3
+    got = list(FanOut([sut], backoff=0).send(users[:4]))
+    assert [(user.uuid, sent) for user, _, sent in got] == [
+        ("user-0", True),
+        ("user-1", False),
+        ("user-2", True),
+        ("user-3", True),
+    ]
+    assert email.send_many.call_count == 3  # The last batch was tried again.
+
+
+class Slow(Notifier):
+    """A channel that takes its time, recording how many batches it had at once."""
+
+    name = "slow"
+
+    def __init__(self, concurrency: int, fail: str = "") -> None:
+        """Init."""
+        super().__init__(concurrency, 2)
+        self.fail = fail
+        self.running = 0
+        self.most = 0
+        self.lock = threading.Lock()
+
+    def send(self, batch: Any) -> bool:
+        """Send."""
+        with self.lock:
+            self.running += 1
+            self.most = max(self.most, self.running)
+        time.sleep(0.02)
+        with self.lock:
+            self.running -= 1
+        return all(user.uuid != self.fail for user, _ in batch)
+
+
+def test_fan_out() -> None:
+    fast, slow = Slow(4), Slow(1, fail="user-3")
+    got = list(FanOut([fast, slow]).send(iter(users)))
+    assert sorted(user.uuid for user, *_ in got) == [x.uuid for x, _ in users]
+    failed = {user.uuid for user, _, sent in got if not sent}
+    assert failed == {"user-2", "user-3"}  # In the same batch.
+    assert fast.most > 1
+    assert slow.most == 1
+
+
+def test_fan_out_nothing() -> None:
+    got = list(FanOut([]).send(users[:2]))
+    assert [sent for *_, sent in got] == [True, True]
+
+
+@pytest.mark.parametrize(
+    ("kinds", "expected"),
+    [
+        ([], []),
+        (["email"], [EmailNotifier]),
+        (["email", "slack", "teams"], [EmailNotifier, SlackNotifier, TeamsNotifier]),
+    ],
+)
+def test_make_notifiers(kinds, expected) -> None:
+    got = make_notifiers(kinds, Mock(batch=1), "https://slack", "https://teams")
+    assert [type(x) for x in got] == expected
+
+
+@pytest.mark.parametrize(
+    ("kinds", "match"),
+    [
+        (["pigeon"], "Unknown notifier"),
+        (["slack"], "needs a webhook URL"),
+        (["teams"], "needs a webhook URL"),
+    ],
+)
+def test_make_notifiers_invalid(kinds, match) -> None:
+    with pytest.raises(ValueError, match=match):
+        make_notifiers(kinds, Mock())
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+# Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
+"""Partitioned database query tests."""
+import threading
+from datetime import datetime, timedelta
+from typing import Any
+
+import pytest
+from conftest import FakeINotion, users
+
+from nhound import NOW
+from nhound.inotion import CrawlConfig
+from nhound.partition import created_filter, query_database, time_ranges
+from nhound.times import UTC, format_time
+
+start = datetime(2023, 5, 21, 22, tzinfo=UTC)
+
+
+@pytest.mark.parametrize(
+    ("end", "parts", "expected"),
+    [
+        (start + timedelta(hours=3), 3, [0, 60, 120]),
+        (start + timedelta(minutes=2), 4, [0, 1]),  # To the minute.
+        (start, 4, [0]),
+        (start + timedelta(hours=1), 1, [0]),
+    ],
+)
+def test_time_ranges(end, parts, expected) -> None:
+    bounds = [start + timedelta(minutes=x) for x in expected]
+    assert time_ranges(start, end, parts) == list(
+        zip(bounds, [*bounds[1:], None], strict=True)
+    )
+
+
+def test_created_filter() -> None:
+    end = start + timedelta(hours=1)
+    assert created_filter(start, None) == {
+        "timestamp": "created_time",
+        "created_time": {"on_or_after": "2023-05-21T22:00:00.000Z"},
+    }
+    assert created_filter(start, end)["and"][1] == {
+        "timestamp": "created_time",
+        "created_time": {"before": "2023-05-21T23:00:00.000Z"},
+    }
+
+
+class Database:
+    """A database of rows, a few created each minute, that can be queried."""
+
+    def __init__(self, rows: int) -> None:
+        """Init."""
+        self.rows = [
+            {
+                "id": f"row-{x}",
+                "created_time": format_time(start + timedelta(minutes=x // 3)),
+            }
+            for x in range(rows)
+        ]
+        self.calls: list[dict[str, Any]] = []
+        self.threads: set[str] = set()
+        self.lock = threading.Lock()
+
+    def _matches(self, row: dict[str, Any], where: dict[str, Any] | None) -> bool:
+        if where is None:
+            return True
+        if "and" in where:
+            return all(self._matches(row, x) for x in where["and"])
+        ((op, value),) = where["created_time"].items()
+        if op == "on_or_after":
+            return row["created_time"] >= value
+        return row["created_time"] < value
+
+    def query(self, **kwargs: Any) -> dict[str, Any]:
+        """Query a page of rows, like Notion."""
+        with self.lock:
+            self.calls.append(kwargs)
+            self.threads.add(threading.current_thread().name)
+        rows = [x for x in self.rows if self._matches(x, kwargs.get("filter"))]
+        if kwargs.get("sorts", [{}])[0].get("direction") == "descending":
+            rows.reverse()
+        offset = int(kwargs.get("start_cursor") or 0)
+        size = kwargs.get("page_size", 100)
+        more = offset + size < len(rows)
+        return {
+            "results": rows[offset : offset + size],
+            "has_more": more,
+            "next_cursor": str(offset + size) if more else None,
+        }
+
+
+@pytest.mark.parametrize(
+    ("rows", "partitions", "calls"),
+    [
+        (0, 4, 1),
+        (80, 4, 1),  # One page.
+        (101, 4, 2 + 1),
+        (1000, 4, 2 + 4 * 3),  # Ranges of 75 minutes, 225 rows.
+        (1000, 1, 10),
+    ],
+)
+def test_query_database(rows, partitions, calls) -> None:
+    database = Database(rows)
+    got = [x["id"] for x in query_database(database.query, "bosses", partitions)]
+    assert sorted(got) == sorted(x["id"] for x in database.rows)
+    assert len(database.calls) == calls
+    if partitions > 1 and rows > 100:
+        assert any(x.startswith("nhound-partition") for x in database.threads)
+
+
+class Inclusive(Database):
+    """A database that also has the rows of the minute before the end."""
+
+    def _matches(self, row: dict[str, Any], where: dict[str, Any] | None) -> bool:
+        if where is not None and "created_time" in where:
+            ((op, value),) = where["created_time"].items()
+            if op == "before":
+                return row["created_time"] <= value
+        return super()._matches(row, where)
+
+
+def test_query_database_bounds() -> None:
+    """The rows at the bounds of the ranges are only got once."""
+    database = Inclusive(1000)
+    got = [x["id"] for x in query_database(database.query, "bosses", 4)]
+    assert sorted(got) == sorted(x["id"] for x in database.rows)
+
+
+def test_partitioned_crawl() -> None:
+    def crawl(partitions: int) -> set[tuple[str, str]]:
+        sut = FakeINotion("secret_", crawl=CrawlConfig(database_partitions=partitions))
+        sut.load_users(users, NOW)
+        sut.reset(NOW)
+        sut.get_users()
+        sut._get_pages(("root-a", "root-b"))
+        return {(u, p.title) for u, p in sut._cohort.edges()}
+
+    assert crawl(4) == crawl(1)
+
+
+def test_query_database_streamed() -> None:
+    """The ranges are only queried as their rows are taken."""
+    database = Database(10_000)
+    got = query_database(database.query, "bosses", 4)
+    for _ in range(150):
+        next(got)
+    got.close()  # The ranges are stopped, not waited for to the end.
+    assert len(database.calls) < 2 + 4 * 5  # Rather than 2 + 4 * 25.
+
+
+def test_query_database_failed() -> None:
+    database = Database(1000)
+    query = database.query
+
+    def failing(**kwargs: Any) -> dict[str, Any]:
+        if kwargs.get("start_cursor"):
+            msg = "Boom"
+            raise RuntimeError(msg)
+        return query(**kwargs)
+
+    with pytest.raises(RuntimeError, match="Boom"):
+        list(query_database(failing, "bosses", 4))
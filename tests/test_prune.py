@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+# Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
+"""Crawl pruning tests."""
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+from conftest import FakeINotion, pages, users
+
+from nhound import NOW
+from nhound.inotion import BudgetConfig
+from nhound.prune import DEFAULT_RULES, Pruner, Rule, load_pruner
+
+
+@pytest.mark.parametrize(
+    ("rule", "kind", "uuid", "title", "expected"),
+    [
+        (Rule("database", "*meeting*"), "database", "a", "Weekly Meetings", True),
+        (Rule("database", "*meeting*"), "page", "a", "Weekly Meetings", False),
+        (Rule("title", "Archive*"), "page", "a", "archive 2019", True),
+        (Rule("title", "Archive*"), "page", "a", "Old archive", False),
+        (Rule("title", "^20[0-9]{2} ", True), "page", "a", "2019 notes", True),
+        (Rule("title", "^20[0-9]{2} ", True), "page", "a", "Notes 2019 ", False),
+        (Rule("title", "notes", True), "page", "a", "Old notes here", True),
+        (Rule("title", "notes", True), "page", "a", "Old Notes", False),
+        (Rule("title", "(?i:notes)", True), "page", "a", "Old Notes", True),
+        (Rule("title", "x$", True), "page", "a", "x\ny", False),
+        (Rule("id", "9B1D3C40-E5A6"), "page", "9b1d3c40e5a6", "", True),
+        (Rule("id", "9b1d3c40*"), "database", "9b1d3c40-e5a6", "", True),
+        (Rule("id", "9b1d3c40"), "page", "9b1d3c40-e5a6", "", False),
+        (Rule("id", r"^9b1d\D", True), "page", "9b1d-3c40", "", False),
+        (Rule("id", r"^9b1d\dc", True), "page", "9B1D-3C40-E5A6", "", True),
+        (Rule("id", "^[0-9a-f]{4}3", True), "page", "9b1d-3c40", "", True),
+    ],
+)
+def test_rules(rule, kind, uuid, title, expected) -> None:
+    sut = Pruner([Rule("title", "Unrelated"), rule])
+    assert (sut.match(kind, uuid, title) == str(rule)) is expected
+
+
+def test_depth_archived() -> None:
+    sut = Pruner((), max_depth=1)
+    assert sut.match("page", "a", "", depth=1) is None
+    assert sut.match("page", "a", "", depth=2) == "max depth"
+    assert sut.match("page", "a", "", archived=True) == "archived"
+    assert Pruner((), archived=False).match("page", "a", "", archived=True) is None
+
+
+def test_unknown_field() -> None:
+    with pytest.raises(ValueError, match="Unknown pruning field owner"):
+        Pruner([Rule("owner", "*")])
+
+
+def test_load_pruner(tmp_path) -> None:
+    path = tmp_path / "prune.json"
+    path.write_text(
+        '{"max_depth": 3, "archived": false,'
+        ' "rules": [{"database": "*meeting*"}, {"title": "^Old", "regex": true}]}'
+    )
+    sut = load_pruner(path)
+    assert sut.rules == (Rule("database", "*meeting*"), Rule("title", "^Old", True))
+    assert (sut.max_depth, sut.archived) == (3, False)
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        "",
+        "[]",
+        '{"rules": [{"title": "a", "id": "b"}]}',
+        '{"rules": [{"title": 1}]}',
+        '{"rules": [{"title": "(", "regex": true}]}',
+        '{"max_depth": "deep"}',
+    ],
+)
+def test_load_pruner_invalid(tmp_path, content) -> None:
+    path = tmp_path / "prune.json"
+    path.write_text(content)
+    with pytest.raises(ValueError, match="Invalid pruning rules file"):
+        load_pruner(path)
+
+
+@pytest.mark.parametrize(
+    ("prune", "expected"),
+    [
+        (None, {"root-a", "Haligtree", "Rennala", "Radahn"}),
+        (Pruner(()), {"root-a", "Haligtree", "Rennala", "Radahn", "Roundtable"}),
+        (Pruner(max_depth=0), {"root-a"}),
+        (
+            Pruner([*DEFAULT_RULES, Rule("id", "Haligtree")]),
+            {"root-a", "Rennala", "Radahn"},
+        ),
+        (Pruner([Rule("database", "boss*")]), {"root-a", "Haligtree", "Roundtable"}),
+    ],
+)
+def test_pruned_crawl(prune, expected) -> None:
+    sut = FakeINotion("secret_", budget=BudgetConfig(prune=prune))
+    retrieve = sut._notion.pages.retrieve
+    retrieved = []
+
+    def spy(_id: str, **kwargs: Any) -> dict:
+        retrieved.append(_id)
+        return retrieve(_id, **kwargs)
+
+    sut._notion.pages.retrieve = spy
+    sut.load_users(users, NOW)
+    sut.reset(NOW)
+    sut.get_users()
+    sut._get_pages(("root-a",))
+    assert {p.title for _, p in sut._cohort.edges()} == expected
+    assert set(retrieved) <= expected
+
+
+def test_pruned_archived() -> None:
+    sut = FakeINotion("secret_")
+    sut.load_users(users, NOW)
+    sut.reset(NOW)
+    sut.get_users()
+    with patch.dict(pages, {"root-b": {**pages["root-b"], "archived": True}}):
+        sut._get_pages(("root-b",))
+    assert list(sut._cohort.edges()) == []
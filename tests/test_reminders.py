@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+# Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
+"""Reminder store tests."""
+import sys
+from typing import Any
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from nhound import NOW
+from nhound.reminders import (
+    RedisReminderStore,
+    Reminders,
+    SQLiteReminderStore,
+    make_reminders,
+)
+from nhound.user import Page, User
+
+malenia = User("17ceeff0-e5a5-11ed-aa7f-2cf05d7be51f", "Malenia", "m@haligtree.tree")
+
+
+def page(title: str) -> Page:
+    return Page(
+        "uuid",
+        title,
+        f"https://www.notion.so/{title}-0123",
+        NOW.subtract(weeks=20),
+        NOW.subtract(weeks=14),
+        NOW.subtract(weeks=13),
+    )
+
+
+class FakeRedis:
+    """Just enough of a Redis client."""
+
+    def __init__(self) -> None:
+        """Init."""
+        self.hashes: dict[str, dict[str, bytes]] = {}
+
+    def hmget(self, key: str, fields: list[str]) -> list[bytes | None]:
+        """Get fields of a hash."""
+        return [self.hashes.get(key, {}).get(x) for x in fields]
+
+    def hset(self, key: str, mapping: dict[str, str]) -> None:
+        """Set fields of a hash."""
+        self.hashes.setdefault(key, {}).update(
+            {k: v.encode() for k, v in mapping.items()}
+        )
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def store(request, tmp_path) -> Any:
+    if request.param == "sqlite":
+        return SQLiteReminderStore(tmp_path / "reminders.sqlite")
+    return RedisReminderStore(client=FakeRedis())
+
+
+def test_store(store) -> None:
+    assert store.last_notified("malenia", ["a", "b"]) == {}
+    store.record("malenia", ["a", "b"], NOW)
+    store.record("malenia", ["b"], NOW.add(days=1))
+    store.record("ranni", ["c"], NOW)
+    assert store.last_notified("malenia", ["b", "c"]) == {"b": NOW.add(days=1)}
+    assert store.last_notified("malenia", []) == {}
+
+
+def test_reminders_due(store) -> None:
+    sut = Reminders(store, (("weeks", 1),))
+    data = [(malenia, [page("Haligtree"), page("Elphael")])]
+    assert list(sut.due(data, NOW)) == data
+    sut.notified(malenia, [page("Haligtree")], NOW)
+    assert list(sut.due(data, NOW.add(days=6))) == [(malenia, [page("Elphael")])]
+    assert list(sut.due(data, NOW.add(weeks=1))) == data
+    sut.notified(malenia, data[0][1], NOW)
+    assert list(sut.due(data, NOW.add(days=1))) == []
+
+
+def test_make_reminders(tmp_path) -> None:
+    assert make_reminders("none") is None
+    sut = make_reminders("sqlite", "3 days", tmp_path / "reminders.sqlite")
+    assert isinstance(sut, Reminders)
+    with pytest.raises(ValueError, match="Unknown reminder store memcached"):
+        make_reminders("memcached")
+    with pytest.raises(ValueError, match="Invalid re-nag interval often"):
+        make_reminders("sqlite", "often", tmp_path / "reminders.sqlite")
+
+
+def test_redis_needs_redis() -> None:
+    with patch.dict(sys.modules, {"redis": None}), pytest.raises(ImportError):
+        RedisReminderStore()
+    redis = MagicMock()
+    with patch.dict(sys.modules, {"redis": redis}):
+        RedisReminderStore("redis://valkey:6379/1")
+    redis.Redis.from_url.assert_called_once_with("redis://valkey:6379/1")
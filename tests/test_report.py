@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+# Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
+"""Report tests."""
+import csv
+import io
+import os
+from collections.abc import Iterator
+from unittest.mock import patch
+
+import orjson
+import pendulum
+import pytest
+
+from nhound.cohort import Cohort
+from nhound.report import Report
+from nhound.user import Page, User
+
+_now = pendulum.datetime(2077, 5, 21, tz="UTC")
+_threashold = _now.subtract(weeks=13)
+stale = Page("p1", "Haligtree", "http://h", _now, _now.subtract(years=1), _threashold)
+fresh = Page("p2", "Leyndell", "http://l", _now, _now, _threashold)
+
+
+class _Stream(io.StringIO):
+    def __init__(self, tty: bool = False) -> None:
+        super().__init__()
+        self._tty = tty
+
+    def isatty(self) -> bool:
+        return self._tty
+
+
+@pytest.fixture()
+def users() -> list[User]:
+    malenia = User("u1", "Malenia", "malenia@haligtree.tree")
+    malenia.pages.update((stale, fresh))
+    return [malenia, User("u2", "Miquella", "miquella@haligtree.tree")]
+
+
+def test_report_unknown_format() -> None:
+    with pytest.raises(ValueError, match="Unknown report format html"):
+        Report("html")
+
+
+@pytest.mark.parametrize(
+    ("env", "fmt", "tty_only"),
+    [
+        ({}, "rich", False),
+        ({"NHOUND_REPORT_FORMAT": "CSV"}, "csv", False),
+        (
+            {"NHOUND_REPORT_FORMAT": "jsonl", "NHOUND_REPORT_TTY_ONLY": "true"},
+            "jsonl",
+            True,
+        ),
+    ],
+)
+def test_report_from_env(env, fmt, tty_only) -> None:
+    with patch.dict(os.environ, env, clear=True):
+        sut = Report.from_env()
+    assert sut.fmt == fmt
+    assert sut.tty_only is tty_only
+
+
+def test_report_from_env_unknown_format() -> None:
+    env = {"NHOUND_REPORT_FORMAT": "html"}
+    with patch.dict(os.environ, env, clear=True), pytest.raises(
+        ValueError, match="Unknown report format html"
+    ):
+        Report.from_env()
+
+
+@pytest.mark.parametrize(
+    ("fmt", "tty_only", "tty", "expected"),
+    [
+        ("none", False, True, False),
+        ("rich", False, False, True),
+        ("rich", True, False, False),
+        ("csv", True, True, True),
+    ],
+)
+def test_report_enabled(fmt, tty_only, tty, expected) -> None:
+    sut = Report(fmt, _Stream(tty), tty_only)
+    assert sut.enabled is expected
+
+
+def test_report_skipped(users) -> None:
+    stream = _Stream()
+    assert Report("rich", stream, tty_only=True).render(users) == 0
+    assert stream.getvalue() == ""
+
+
+def test_report_rich(users) -> None:
+    stream = _Stream()
+    assert Report("rich", stream).render(users) == 2
+    text = stream.getvalue()
+    assert "u1 Malenia" in text
+    assert "Haligtree is stale" in text
+    assert "Leyndell is fresh." in text
+    assert "Miquella" not in text
+
+
+def test_report_rich_streams(users) -> None:
+    stream = _Stream()
+    radahn = User("u3", "Radahn", "radahn@redmane.castle")
+    radahn.pages.add(fresh)
+
+    def produce() -> Iterator[User]:
+        yield users[0]
+        # Written before the next user is produced.
+        assert "Haligtree is stale" in stream.getvalue()
+        yield radahn
+
+    assert Report("rich", stream).render(produce()) == 3
+    assert "u3 Radahn" in stream.getvalue()
+
+
+def test_report_jsonl(users) -> None:
+    stream = _Stream()
+    assert Report("jsonl", stream).render(users) == 2
+    rows = {
+        row["page_uuid"]: row
+        for row in map(orjson.loads, stream.getvalue().splitlines())
+    }
+    assert rows["p1"]["stale"] is True
+    assert rows["p2"]["stale"] is False
+    assert rows["p1"]["user_email"] == "malenia@haligtree.tree"
+
+
+def test_report_csv(users) -> None:
+    stream = _Stream()
+    assert Report("csv", stream).render(users) == 2
+    rows = list(csv.DictReader(io.StringIO(stream.getvalue())))
+    assert {row["page_uuid"]: row["stale"] for row in rows} == {
+        "p1": "True",
+        "p2": "False",
+    }
+
+
+def test_cohort_print_data(users) -> None:
+    sut = Cohort()
+    for user in users:
+        sut.add_user(user)
+    stream = _Stream()
+    assert sut.print_data(Report("jsonl", stream)) == 2
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+# Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
+"""Sharded crawl tests."""
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+from conftest import FakeINotion, blocks, child, crawl, malenia, pages, ranni, users
+from structlog.testing import capture_logs
+
+from nhound import NOW
+from nhound.inotion import BudgetConfig, CrawlConfig, Task
+
+
+@pytest.mark.parametrize("processes", [2, 3])
+def test_crawl_sharded(processes) -> None:
+    local = crawl(1)
+    assert {(u, p.title) for u, p in local} == {
+        (malenia, "root-a"),
+        (ranni, "root-b"),
+        (malenia, "Haligtree"),  # From the callout.
+        (ranni, "Rennala"),
+        (malenia, "Radahn"),
+    }
+    assert crawl(processes) == local
+
+
+def test_crawl_shard() -> None:
+    sut = FakeINotion("secret_")
+    sut.load_users(users, NOW)
+    edges, deferred = sut.crawl_shard(Task("page", "root-a"), NOW)
+    assert {p.title for _, p in edges} == {"root-a", "Haligtree"}
+    assert deferred == [Task("database", "bosses", 1)]
+
+
+def test_crawl_resume(tmp_path) -> None:
+    path = tmp_path / "checkpoint.json"
+    sut = FakeINotion(
+        "secret_", budget=BudgetConfig(checkpoint=path, checkpoint_seconds=0)
+    )
+    retrieve = sut._notion.pages.retrieve
+
+    def interrupted(_id: str, **kwargs: Any) -> Any:
+        if _id == "Haligtree":
+            raise KeyboardInterrupt
+        return retrieve(_id, **kwargs)
+
+    sut._notion.pages.retrieve = interrupted
+    sut.load_users(users, NOW)
+    with pytest.raises(KeyboardInterrupt):
+        list(sut.get_email_data(("root-a", "root-b"), NOW))
+    assert path.exists()
+
+    sut = FakeINotion("secret_", budget=BudgetConfig(checkpoint=path))
+    sut.load_users(users, NOW)
+    retrieved = []
+    retrieve = sut._notion.pages.retrieve
+    sut._notion.pages.retrieve = lambda _id, **_: retrieved.append(_id) or retrieve(_id)
+    data = sut.get_email_data(("root-a", "root-b"), NOW.add(days=1), resume=True)
+    assert sut._now == NOW
+    assert "root-a" not in retrieved
+    assert {(u.uuid, p.title) for u, pages in data for p in pages} == {
+        (u, p.title) for u, p in crawl(1)
+    }
+    assert not path.exists()
+
+
+@pytest.mark.parametrize(
+    ("kwargs", "reason"),
+    [
+        ({}, "there are no checkpoints"),
+        (
+            {"crawl": CrawlConfig(mode="watermark")},
+            "a watermark crawl has no checkpoints",
+        ),
+        ({"crawl": CrawlConfig(processes=2)}, "a sharded crawl has no checkpoints"),
+    ],
+)
+def test_crawl_resume_none(tmp_path, kwargs, reason) -> None:
+    if kwargs:
+        kwargs["budget"] = BudgetConfig(checkpoint=tmp_path / "checkpoint.json")
+    sut = FakeINotion("secret_", **kwargs)
+    with capture_logs() as logs:
+        assert sut._resumable(("root-a",)) is None
+    assert logs[-1]["event"] == "Nothing to resume"
+    assert logs[-1]["reason"] == reason
+
+
+def described(block: dict[str, Any], author: str) -> dict[str, Any]:
+    """Get a child page block that tells all about its page."""
+    return {
+        **block,
+        "created_time": "2023-05-21T22:00:00.000Z",
+        "last_edited_time": "2023-05-21T22:00:00.000Z",
+        "created_by": {"id": author},
+        "last_edited_by": {"id": author},
+    }
+
+
+def test_crawl_child_pages_from_blocks() -> None:
+    sut = FakeINotion("secret_")
+    retrieved = []
+    retrieve = sut._notion.pages.retrieve
+    sut._notion.pages.retrieve = lambda _id, **_: retrieved.append(_id) or retrieve(_id)
+    sut.load_users(users, NOW)
+    children = [described(child("child_page", "Haligtree", "The Haligtree 🌳"), ranni)]
+
+    def run() -> set[tuple[str, str, str]]:
+        retrieved.clear()
+        sut.reset(NOW)
+        sut.get_users()
+        with patch.dict(blocks, {"root-a": children}):
+            sut._get_pages(("root-a",))
+        return {(u, p.title, p.url) for u, p in sut._cohort.edges()}
+
+    url = "https://www.notion.so/The-Haligtree-Haligtree"
+    expected = {
+        (malenia, "root-a", pages["root-a"]["url"]),
+        (malenia, "The Haligtree 🌳", url),  # From the callout.
+    }
+    assert run() == expected
+    assert retrieved == ["root-a"]
+    # The scan of root-a is cached, its blocks may be out of date.
+    assert {x[:2] for x in run()} == {(malenia, "root-a"), (malenia, "Haligtree")}
+    assert retrieved == ["root-a", "Haligtree"]
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+# Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
+"""Spilled edges tests."""
+from unittest.mock import patch
+
+import pytest
+
+from nhound import NOW
+from nhound.spill import EdgeSpill
+from nhound.user import Page
+
+
+def page(title: str) -> Page:
+    return Page(
+        f"page-{title}",
+        title,
+        f"https://www.notion.so/{title}-0123",
+        NOW.subtract(weeks=20),
+        NOW.subtract(weeks=14),
+        NOW.subtract(weeks=13),
+    )
+
+
+edges = [
+    ("ranni", page("Caria")),
+    ("malenia", page("Haligtree")),
+    ("ranni", page("Tab\tNew\nLine")),
+    ("malenia", page("Elphael")),
+    ("ranni", page("Caria")),  # Duplicate.
+]
+expected = [
+    ("malenia", sorted([page("Elphael"), page("Haligtree")])),
+    ("ranni", sorted([page("Caria"), page("Tab\tNew\nLine")])),
+]
+
+
+def groups(sut: EdgeSpill) -> list[tuple[str, list[Page]]]:
+    return [(user, sorted(pages)) for user, pages in sut.groups()]
+
+
+@pytest.mark.parametrize("chunk", [1, 2, 100])
+def test_groups(tmp_path, chunk) -> None:
+    sut = EdgeSpill(tmp_path, chunk)
+    for user, x in edges:
+        sut.add(user, x)
+    assert groups(sut) == expected
+    assert groups(sut) == expected  # Again.
+    assert len(list(sut.path.iterdir())) == min(len(edges), -(-len(edges) // chunk))
+
+
+def test_compact(tmp_path) -> None:
+    sut = EdgeSpill(tmp_path, 1)
+    with patch("nhound.spill.FAN_IN", 2):
+        for user, x in edges:
+            sut.add(user, x)
+        assert len(list(sut.path.iterdir())) == 1
+        assert groups(sut) == expected
+
+
+def test_close(tmp_path) -> None:
+    sut = EdgeSpill(tmp_path)
+    sut.add(*edges[0])
+    assert list(tmp_path.iterdir()) == [sut.path]
+    sut.close()
+    assert list(tmp_path.iterdir()) == []
+    assert list(sut.groups()) == []
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+# Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
+"""State tests."""
+import os
+from unittest.mock import patch
+
+from nhound import NOW
+from nhound.state import Checkpoint, CrawlState, PageRecord, UsersCache, state_dir
+from nhound.user import Page
+
+record = PageRecord(
+    "Haligtree",
+    "https://www.notion.so/Haligtree-0123",
+    "2023-05-21T22:00:00.000Z",
+    "2023-05-21T22:00:00.000Z",
+    ("malenia",),
+    ("miquella", "miquella"),
+    (("months", 6),),
+)
+
+
+def test_state_dir(tmp_path) -> None:
+    path = tmp_path / "state"
+    with patch.dict(os.environ, {"NHOUND_STATE_DIR": str(path)}):
+        assert state_dir() == path
+    assert path.is_dir()
+
+
+def test_crawl_state_round_trip(tmp_path) -> None:
+    sut = CrawlState(tmp_path / "crawl.json")
+    sut.watermark = "2023-05-21T22:00:00.000Z"
+    sut.synced = "2023-05-22T22:00:00.000Z"
+    sut.pages["page"] = record
+    sut.pages["entry"] = record._replace(owners=(), threshold=None)
+    sut.databases["db"] = "Meetings"
+    sut.save()
+    loaded = CrawlState.load(tmp_path / "crawl.json")
+    assert loaded.watermark == sut.watermark
+    assert loaded.synced == sut.synced
+    assert loaded.pages == sut.pages
+    assert loaded.databases == sut.databases
+
+
+def test_crawl_state_missing(tmp_path) -> None:
+    sut = CrawlState.load(tmp_path / "crawl.json")
+    assert sut.watermark is None
+    assert sut.pages == {}
+
+
+def test_crawl_state_corrupted(tmp_path) -> None:
+    (tmp_path / "crawl.json").write_text("{Let me solve it")
+    assert CrawlState.load(tmp_path / "crawl.json").watermark is None
+
+
+def test_crawl_state_old_version(tmp_path) -> None:
+    (tmp_path / "crawl.json").write_text('{"version": 0, "watermark": "x"}')
+    assert CrawlState.load(tmp_path / "crawl.json").watermark is None
+
+
+def test_users_cache_round_trip(tmp_path) -> None:
+    sut = UsersCache(tmp_path / "users.json")
+    sut.time = NOW
+    sut.users = [("malenia", "Malenia", "malenia@haligtree.tree")]
+    sut.others = ["bot"]
+    sut.save()
+    loaded = UsersCache.load(tmp_path / "users.json")
+    assert loaded.time == NOW
+    assert loaded.users == sut.users
+    assert loaded.others == sut.others
+
+
+def test_users_cache_corrupted(tmp_path) -> None:
+    (tmp_path / "users.json").write_text("{Let me solve it")
+    assert UsersCache.load(tmp_path / "users.json").time is None
+    assert UsersCache.load(tmp_path / "missing.json").time is None
+
+
+def test_checkpoint_round_trip(tmp_path) -> None:
+    page = Page("a", "Haligtree", "https://www.notion.so/a", NOW, NOW, NOW)
+    sut = Checkpoint(tmp_path / "checkpoint.json")
+    sut.now = NOW
+    sut.roots = ["root"]
+    sut.frontier = [("page", "b", 1), ("database", "c", 2)]
+    sut.visited = ["root", "a"]
+    sut.edges = [("malenia", page)]
+    sut.deferred = [(page, ("ranni",), ("malenia", "bot"))]
+    sut.save()
+    loaded = Checkpoint.load(tmp_path / "checkpoint.json")
+    assert loaded is not None
+    assert loaded.now == NOW
+    assert (loaded.roots, loaded.frontier, loaded.visited) == (
+        sut.roots,
+        sut.frontier,
+        sut.visited,
+    )
+    assert list(loaded.edges) == sut.edges
+    assert list(loaded.deferred) == sut.deferred
+    assert list(loaded.edges) == []  # Streamed once.
+    sut.delete()
+    assert Checkpoint.load(tmp_path / "checkpoint.json") is None
+    sut.delete()  # Already gone.
+
+
+def test_checkpoint_corrupted(tmp_path) -> None:
+    (tmp_path / "checkpoint.json").write_text("{Let me solve it")
+    assert Checkpoint.load(tmp_path / "checkpoint.json") is None
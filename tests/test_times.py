@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+# Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
+"""Timestamps tests."""
+from datetime import datetime, timedelta, timezone
+from timeit import timeit
+
+import pendulum
+import pytest
+
+from nhound.times import UTC, format_time, parse_time, plain
+
+
+@pytest.mark.parametrize(
+    ("value", "expected"),
+    [
+        ("2023-05-21T22:00:00.000Z", datetime(2023, 5, 21, 22, tzinfo=UTC)),
+        ("2023-05-21T22:00:00.123Z", datetime(2023, 5, 21, 22, 0, 0, 123000, UTC)),
+        ("2023-05-21T22:00:00+00:00", datetime(2023, 5, 21, 22, tzinfo=UTC)),
+        ("2023-05-21T23:00:00+01:00", datetime(2023, 5, 21, 22, tzinfo=UTC)),
+        ("2023-05-21T22:00:00", datetime(2023, 5, 21, 22, tzinfo=UTC)),
+        ("2023", datetime(2023, 1, 1, tzinfo=UTC)),  # The slow path.
+    ],
+)
+def test_parse_time(value, expected) -> None:
+    when = parse_time(value)
+    assert when == expected
+    assert when.tzinfo is not None
+    assert when == pendulum.parse(value)
+
+
+def test_parse_time_invalid() -> None:
+    with pytest.raises(ValueError, match="Not a time: P1D"):
+        parse_time("P1D")  # A duration.
+
+
+def test_plain() -> None:
+    when = pendulum.datetime(2023, 5, 21, 23, 0, 0, 1, tz="Europe/London")
+    sut = plain(when)
+    assert type(sut) is datetime
+    assert sut == when
+    assert sut.utcoffset() == timedelta(0)
+
+
+def test_format_time() -> None:
+    when = datetime(2023, 5, 21, 23, tzinfo=timezone(timedelta(hours=1)))
+    assert format_time(when) == "2023-05-21T22:00:00.000Z"
+    assert format_time(when) < "2023-05-21T22:00:00.001Z"
+
+
+@pytest.mark.slow
+def test_parse_time_benchmark() -> None:
+    """Microbenchmark: the fast path against pendulum, on Notion's format."""
+    values = [f"2023-05-{x:02}T22:{x:02}:00.000Z" for x in range(1, 29)]
+    fast = timeit(lambda: [parse_time(x) for x in values], number=200)
+    slow = timeit(
+        lambda: [pendulum.parse(x) for x in values],  # type: ignore[attr-defined]
+        number=200,
+    )
+    print(f"parse_time {fast:.4f}s, pendulum.parse {slow:.4f}s")  # noqa: T201
+    assert fast * 5 < slow
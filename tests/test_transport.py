@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+# Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
+"""HTTP transport tests."""
+import os
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+from nhound.inotion import INotion
+from nhound.transport import (
+    RateLimiter,
+    TransportConfig,
+    get_transport,
+    make_http_client,
+)
+
+
+def test_transport_config_from_env() -> None:
+    env = {
+        "NHOUND_HTTP_MAX_CONNECTIONS": "7",
+        "NHOUND_HTTP_KEEPALIVE_EXPIRY": "30.5",
+        "NHOUND_HTTP_CONNECT_TIMEOUT": "SeVeN",  # Nonsense, so default.
+        "NHOUND_HTTP_READ_TIMEOUT": "120",
+        "NHOUND_HTTP_SHARED": "false",
+        "NHOUND_HTTP_RATE_LIMIT": "3",
+    }
+    with patch.dict(os.environ, env, clear=True):
+        sut = TransportConfig.from_env()
+    assert sut == TransportConfig(
+        max_connections=7,
+        keepalive_expiry=30.5,
+        read_timeout=120.0,
+        shared=False,
+        rate_limit=3.0,
+    )
+
+
+def test_transport_config_timeout() -> None:
+    sut = TransportConfig(connect_timeout=5, read_timeout=90)
+    assert sut.timeout == httpx.Timeout(connect=5, read=90, write=60, pool=60)
+
+
+@pytest.mark.parametrize(
+    ("one", "two", "same"),
+    [
+        (TransportConfig(), TransportConfig(), True),
+        (TransportConfig(), TransportConfig(read_timeout=1), True),
+        (TransportConfig(), TransportConfig(max_connections=3), False),
+        (TransportConfig(shared=False), TransportConfig(shared=False), False),
+    ],
+)
+def test_get_transport(one, two, same) -> None:
+    assert (get_transport(one) is get_transport(two)) is same
+
+
+def test_make_http_client() -> None:
+    sut = make_http_client(TransportConfig(connect_timeout=3))
+    assert sut.timeout.connect == 3
+    assert not sut.event_hooks["request"]
+    sut = make_http_client(TransportConfig(rate_limit=3))
+    assert isinstance(sut.event_hooks["request"][0], RateLimiter)
+
+
+def test_rate_limiter() -> None:
+    now = [10.0]
+    naps: list[float] = []
+
+    def sleep(seconds: float) -> None:
+        naps.append(seconds)
+        now[0] += seconds
+
+    sut = RateLimiter(4, clock=lambda: now[0], sleep=sleep)
+    for _ in range(3):
+        sut(httpx.Request("GET", "https://api.notion.com"))
+    now[0] += 1
+    sut(httpx.Request("GET", "https://api.notion.com"))
+    assert naps == [0.25, 0.25]
+
+
+def test_inotion_shares_transport() -> None:
+    config = TransportConfig(max_connections=13, read_timeout=7)
+    one = INotion("secret_one", transport=config)
+    two = INotion("secret_two", transport=config)
+    assert one._notion.client._transport is two._notion.client._transport
+    assert one._notion.client.timeout.read == 7
+    assert one._notion.client.headers["Authorization"] == "Bearer secret_one"
+    assert two._notion.client.headers["Authorization"] == "Bearer secret_two"
@@ -1,16 +1,20 @@
 # -*- coding: utf-8 -*-
 # Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
 """Utilities."""
+import os
 from pathlib import Path
+from unittest.mock import MagicMock, patch
 
 import pytest
 import requests_mock
+from rich.console import Console
 
 from nhound import __version__
 from nhound.utils import (
     GITHUB_URL,
     VersionCheck,
     check_if_latest_version,
+    env_flag,
     join_with_oxford_commas,
     wprint,
 )
@@ -88,3 +92,29 @@ def test_wprint(level, extra, text, mock_console):
     assert text in mock_console.print.call_args.args[0]
     if extra is not None:
         assert extra in mock_console.print.call_args.args[0]
+
+
+def test_wprint_shared_console():
+    console = MagicMock(spec=Console)
+    wprint(TXT, "info", console=console)
+    assert console.print.called
+    assert TXT in console.print.call_args.args[0]
+
+
+@pytest.mark.parametrize(
+    ("value", "default", "expected"),
+    [
+        (None, False, False),
+        (None, True, True),
+        ("", True, True),
+        ("true", False, True),
+        ("YES", False, True),
+        ("1", False, True),
+        ("false", True, False),
+        ("SeVeN", True, False),
+    ],
+)
+def test_env_flag(value, default, expected) -> None:
+    env = {} if value is None else {"NHOUND_TEST_FLAG": value}
+    with patch.dict(os.environ, env, clear=True):
+        assert env_flag("NHOUND_TEST_FLAG", default) is expected
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+# Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
+"""Shared work queue tests."""
+import threading
+import time
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+from conftest import FakeINotion, crawl, ranni, users
+
+from nhound import NOW
+from nhound.inotion import CrawlConfig, INotion, Task
+from nhound.user import Page
+from nhound.workqueue import (
+    MAX_ATTEMPTS,
+    LocalWorkQueue,
+    SQLiteWorkQueue,
+    WorkQueue,
+    make_queue,
+)
+
+page = Page(
+    "page-0",
+    "Haligtree",
+    "https://www.notion.so/Haligtree-0123",
+    NOW.subtract(weeks=20),
+    NOW.subtract(weeks=14),
+    NOW.subtract(weeks=13),
+)
+
+
+class Clock:
+    """A clock that only moves when told to."""
+
+    def __init__(self) -> None:
+        """Init."""
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        """Get the time."""
+        return self.now
+
+
+@pytest.fixture(params=["local", "sqlite"])
+def queue(request, tmp_path) -> Any:
+    clock = Clock()
+    if request.param == "local":
+        sut: WorkQueue = LocalWorkQueue(clock)
+    else:
+        sut = SQLiteWorkQueue(tmp_path / "queue.sqlite", clock)
+    sut.clock = clock  # type: ignore[attr-defined]
+    sut.open_run("run", NOW, 60)
+    return sut
+
+
+def test_put(queue) -> None:
+    assert queue.put("run", [Task("page", "a"), Task("page", "b")]) == 2
+    assert queue.put("run", [Task("page", "a"), Task("database", "c")]) == 1
+    assert queue.unfinished("run") == 3
+
+
+def test_lease_done(queue) -> None:
+    queue.put("run", [Task("page", "a")])
+    lease = queue.lease("run", "tarnished", 60)
+    assert (lease.kind, lease.uuid) == ("page", "a")
+    assert queue.lease("run", "tarnished", 60) is None
+    assert queue.done(lease, [("malenia", page)], [Task("database", "b")])
+    assert queue.unfinished("run") == 1
+    assert list(queue.edges("run")) == [("malenia", page)]
+    assert not queue.done(lease, [], [])  # Done already.
+
+
+def test_lease_depth(queue) -> None:
+    queue.put("run", [Task("page", "a", 2)])
+    lease = queue.lease("run", "tarnished", 60)
+    assert queue.done(lease, [], [Task("database", "b", 3)])
+    assert queue.lease("run", "tarnished", 60).depth == 3
+
+
+def test_lease_expired(queue) -> None:
+    queue.put("run", [Task("page", "a")])
+    lease = queue.lease("run", "tarnished", 60)
+    queue.clock.now += 50
+    assert queue.heartbeat(lease, 60)
+    queue.clock.now += 100
+    again = queue.lease("run", "maiden", 60)
+    assert again.uuid == "a"
+    assert not queue.heartbeat(lease, 60)
+    assert not queue.done(lease, [("malenia", page)], [])
+    assert queue.done(again, [], [])
+    assert list(queue.edges("run")) == []
+
+
+def test_fail(queue) -> None:
+    queue.put("run", [Task("page", "a")])
+    for _ in range(MAX_ATTEMPTS):
+        lease = queue.lease("run", "tarnished", 60)
+        assert lease is not None
+        queue.fail(lease)
+    assert queue.lease("run", "tarnished", 60) is None
+    assert queue.unfinished("run") == 0
+
+
+def test_runs(queue) -> None:
+    queue.put("run", [Task("page", "a")])
+    later = NOW.add(hours=1)
+    assert queue.open_run("run", later, 60) == ("run", NOW)
+    assert queue.open_run(None, later, 60) == ("run", NOW)  # In progress.
+    assert queue.finish("run", "tarnished")
+    assert not queue.finish("run", "maiden")
+    assert queue.finish("run", "tarnished")
+    run, when = queue.open_run(None, later, 60)  # The other is claimed.
+    assert run != "run"
+    assert when == later
+    assert queue.unfinished("run") == 1  # Kept while alive.
+    queue.clock.now += 100
+    assert queue.open_run(run, NOW, 60) == (run, later)
+    assert queue.unfinished("run") == 0  # Dropped once expired.
+
+
+def test_runs_alive(queue) -> None:
+    queue.put("run", [Task("page", "a")])
+    queue.clock.now += 50
+    lease = queue.lease("run", "tarnished", 60)
+    queue.clock.now += 50
+    assert queue.heartbeat(lease, 60)
+    queue.clock.now += 50
+    # Past midnight, say, the run in progress is not dropped.
+    assert queue.open_run(None, NOW.add(days=1), 60) == ("run", NOW)
+    assert queue.done(lease, [("malenia", page)], [])
+    assert list(queue.edges("run")) == [("malenia", page)]
+
+
+def test_make_queue(tmp_path) -> None:
+    assert make_queue("none") is None
+    assert isinstance(make_queue("local"), LocalWorkQueue)
+    sut = make_queue("sqlite", tmp_path / "queue.sqlite")
+    assert isinstance(sut, SQLiteWorkQueue)
+    with pytest.raises(ValueError, match="Unknown work queue redis"):
+        make_queue("redis")
+
+
+def test_queued_crawl(tmp_path) -> None:
+    queue = SQLiteWorkQueue(tmp_path / "queue.sqlite")
+    workers = [
+        FakeINotion("secret_", crawl=CrawlConfig(worker=name, run="today"), queue=queue)
+        for name in ("tarnished", "maiden")
+    ]
+
+    def work(sut: FakeINotion) -> None:
+        sut.load_users(users, NOW)
+        sut.reset(NOW)
+        sut.get_users()
+        sut._get_pages(("root-a", "root-b"))
+
+    sleep = time.sleep
+    get_users = INotion.get_users
+    with patch("nhound.inotion.time.sleep", lambda _: sleep(0.01)), patch.object(
+        INotion, "get_users", autospec=True, side_effect=get_users
+    ) as mocked:
+        threads = [threading.Thread(target=work, args=(x,)) for x in workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    results = sorted((set(x._cohort.edges()) for x in workers), key=len)
+    assert results == [set(), crawl(1)]
+    assert mocked.call_count == 2 * len(workers)  # Not once per item.
+
+
+def test_queued_crawl_retry() -> None:
+    sut = FakeINotion(
+        "secret_",
+        crawl=CrawlConfig(worker="tarnished", run="now"),
+        queue=LocalWorkQueue(),
+    )
+    retrieve = sut._notion.pages.retrieve
+    failures = [TimeoutError("The Notion API timed out")]
+
+    def flaky(_id: str, **kwargs: Any) -> Any:
+        if _id == "root-b" and failures:
+            raise failures.pop()
+        return retrieve(_id, **kwargs)
+
+    sut._notion.pages.retrieve = flaky
+    sut.load_users(users, NOW)
+    sut.reset(NOW)
+    sut.get_users()
+    sut._get_pages(("root-a", "root-b"))
+
+    edges = set(sut._cohort.edges())
+    assert not failures
+    assert any(u == ranni and p.uuid == "root-b" for u, p in edges)
+    assert edges == crawl(1)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+# Copyright © 2023-present Worldr Technologies Limited. All Rights Reserved.
+"""Workspaces tests."""
+import os
+import threading
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from orjson import dumps
+
+from nhound.workspaces import Workspace, load_workspaces, run_workspaces
+
+
+def write(path: Path, data: object) -> Path:
+    path.write_bytes(dumps(data))
+    return path
+
+
+def test_load_workspaces(tmp_path) -> None:
+    path = write(
+        tmp_path / "workspaces.json",
+        [
+            {"name": "limgrave", "token": "secret_1", "pages": ["a", "b"]},
+            {
+                "name": "caelid",
+                "token_env": "CAELID_TOKEN",
+                "pages": ["c"],
+                "weeks": 4,
+                "rate_limit": 2.5,
+            },
+        ],
+    )
+    with patch.dict(os.environ, {"CAELID_TOKEN": "secret_2"}):
+        sut = load_workspaces(path)
+    assert sut == [
+        Workspace("limgrave", "secret_1", ("a", "b")),
+        Workspace("caelid", "secret_2", ("c",), 4, 2.5),
+    ]
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        {"name": "limgrave"},
+        [{"name": "limgrave", "pages": []}],  # No token.
+        [{"token": "secret_1", "pages": []}],
+        [
+            {"name": "limgrave", "token": "secret_1", "pages": []},
+            {"name": "limgrave", "token": "secret_2", "pages": []},
+        ],
+    ],
+)
+def test_load_workspaces_invalid(tmp_path, data) -> None:
+    path = write(tmp_path / "workspaces.json", data)
+    with pytest.raises(ValueError, match="Invalid workspaces file"):
+        load_workspaces(path)
+
+
+def test_state_path(tmp_path) -> None:
+    with patch.dict(os.environ, {"NHOUND_STATE_DIR": str(tmp_path)}):
+        assert Workspace("", "", ()).state_path("crawl.json") == tmp_path / "crawl.json"
+        assert (
+            Workspace("caelid", "", ()).state_path("crawl.json")
+            == tmp_path / "crawl-caelid.json"
+        )
+
+
+def test_run_workspaces() -> None:
+    barrier = threading.Barrier(2, timeout=5)  # Both run at the same time.
+
+    def ok() -> bool:
+        barrier.wait()
+        return True
+
+    def fail() -> bool:
+        barrier.wait()
+        msg = "Let me solve it"
+        raise RuntimeError(msg)
+
+    assert run_workspaces({"limgrave": ok, "caelid": fail}) == {
+        "limgrave": True,
+        "caelid": False,
+    }